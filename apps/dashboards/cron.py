@@ -5,7 +5,7 @@ import cronjobs
 
 from dashboards.models import PERIODS, WikiDocumentVisits
 from sumo.redis_utils import redis_client
-from wiki.models import Document
+from wiki.models import Document, HelpfulVoteRollup
 
 
 @cronjobs.register
@@ -39,20 +39,16 @@ def _get_old_unhelpful():
     cursor.execute(
         """SELECT doc_id, yes, no
         FROM
-            (SELECT wiki_revision.document_id as doc_id,
-                SUM(limitedvotes.helpful) as yes,
-                SUM(NOT(limitedvotes.helpful)) as no
-            FROM
-                (SELECT * FROM wiki_helpfulvote
-                    WHERE created <= DATE_SUB(CURDATE(), INTERVAL 1 MONTH)
-                    AND created >= DATE_SUB(DATE_SUB(CURDATE(),
-                        INTERVAL 1 MONTH), INTERVAL 1 MONTH)
-                ) as limitedvotes
-            INNER JOIN wiki_revision ON
-                limitedvotes.revision_id=wiki_revision.id
+            (SELECT wiki_helpfulvoterollup.document_id as doc_id,
+                SUM(wiki_helpfulvoterollup.yes) as yes,
+                SUM(wiki_helpfulvoterollup.no) as no
+            FROM wiki_helpfulvoterollup
             INNER JOIN wiki_document ON
-                wiki_document.id=wiki_revision.document_id
+                wiki_document.id=wiki_helpfulvoterollup.document_id
             WHERE wiki_document.locale="en-US"
+                AND day < DATE_SUB(CURDATE(), INTERVAL 1 MONTH)
+                AND day >= DATE_SUB(DATE_SUB(CURDATE(),
+                    INTERVAL 1 MONTH), INTERVAL 1 MONTH)
             GROUP BY doc_id
             HAVING no > yes
             ) as calculated""")
@@ -81,18 +77,14 @@ def _get_current_unhelpful(old_formatted):
     cursor.execute(
         """SELECT doc_id, yes, no
         FROM
-            (SELECT wiki_revision.document_id as doc_id,
-                SUM(limitedvotes.helpful) as yes,
-                SUM(NOT(limitedvotes.helpful)) as no
-            FROM
-                (SELECT * FROM wiki_helpfulvote
-                    WHERE created >= DATE_SUB(CURDATE(), INTERVAL 1 MONTH)
-                ) as limitedvotes
-            INNER JOIN wiki_revision ON
-                limitedvotes.revision_id=wiki_revision.id
+            (SELECT wiki_helpfulvoterollup.document_id as doc_id,
+                SUM(wiki_helpfulvoterollup.yes) as yes,
+                SUM(wiki_helpfulvoterollup.no) as no
+            FROM wiki_helpfulvoterollup
             INNER JOIN wiki_document ON
-                wiki_document.id=wiki_revision.document_id
+                wiki_document.id=wiki_helpfulvoterollup.document_id
             WHERE wiki_document.locale="en-US"
+                AND day >= DATE_SUB(CURDATE(), INTERVAL 1 MONTH)
             GROUP BY doc_id
             HAVING no > yes
             ) as calculated""")
@@ -129,6 +121,8 @@ def cache_most_unhelpful_kb_articles():
 
     REDIS_KEY = settings.HELPFULVOTES_UNHELPFUL_KEY
 
+    # Count the votes up to now.
+    HelpfulVoteRollup.roll_up()
     old_formatted = _get_old_unhelpful()
     final = _get_current_unhelpful(old_formatted)
 
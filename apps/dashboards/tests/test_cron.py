@@ -10,7 +10,7 @@ from dashboards.cron import (cache_most_unhelpful_kb_articles,
                              _get_old_unhelpful, _get_current_unhelpful)
 from sumo.tests import TestCase
 from sumo.redis_utils import redis_client, RedisError
-from wiki.models import HelpfulVote
+from wiki.models import HelpfulVote, HelpfulVoteRollup
 from wiki.tests import revision
 
 
@@ -30,6 +30,7 @@ def _make_backdated_revision(backdate):
 class TopUnhelpfulArticlesTests(TestCase):
     def test_no_old_articles(self):
         """Make sure _get_old_articles() returns nothing with no votes."""
+        HelpfulVoteRollup.roll_up()
         result = _get_old_unhelpful()
         eq_(0, len(result))
 
@@ -52,6 +53,7 @@ class TopUnhelpfulArticlesTests(TestCase):
         # Add 1 yes vote 1.5 months ago
         _add_vote_in_past(r, 1, 45)
 
+        HelpfulVoteRollup.roll_up()
         result = _get_old_unhelpful()
         eq_(1, len(result))
         self.assertAlmostEqual(0.2, result[r.id]['percentage'])
@@ -69,6 +71,7 @@ class TopUnhelpfulArticlesTests(TestCase):
 
         _add_vote_in_past(r, 0, 45)
 
+        HelpfulVoteRollup.roll_up()
         result = _get_old_unhelpful()
         eq_(0, len(result))
 
@@ -87,6 +90,7 @@ class TopUnhelpfulArticlesTests(TestCase):
 
         old_data = {r.id: {'percentage': 0.2, 'total': 5.0}}
 
+        HelpfulVoteRollup.roll_up()
         result = _get_current_unhelpful(old_data)
         eq_(1, len(result))
         self.assertAlmostEqual(0.4, result[r.id]['currperc'])
@@ -109,6 +113,7 @@ class TopUnhelpfulArticlesTests(TestCase):
 
         old_data = {r.id: {'percentage': 0.2, 'total': 5.0}}
 
+        HelpfulVoteRollup.roll_up()
         result = _get_current_unhelpful(old_data)
         eq_(0, len(result))
 
@@ -126,6 +131,7 @@ class TopUnhelpfulArticlesTests(TestCase):
 
         old_data = {}
 
+        HelpfulVoteRollup.roll_up()
         result = _get_current_unhelpful(old_data)
         eq_(1, len(result))
         self.assertAlmostEqual(0.4, result[r.id]['currperc'])
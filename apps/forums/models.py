@@ -9,13 +9,11 @@ from tidings.models import NotificationsMixin
 from access import has_perm, perm_is_defined_on
 from activity.models import ActionMixin
 import forums
-from sumo.helpers import urlparams, wiki_to_html
+from sumo.helpers import urlparams
 from sumo.urlresolvers import reverse
-from sumo.models import ModelBase
-from search import searcher
+from sumo.models import ModelBase, ParsedContentMixin
 from search.models import SearchMixin, register_for_indexing
 from search.utils import crc32
-import waffle
 
 
 def _last_post_from(posts, exclude_post=None):
@@ -201,48 +199,59 @@ class Thread(NotificationsMixin, ModelBase, SearchMixin):
             'indexed_on': {'type': 'integer'}}
 
     @classmethod
-    def extract_document(cls, obj_id):
-        """Extracts interesting thing from a Thread and its Posts"""
-        obj = cls.objects.select_related('last_post').get(pk=obj_id)
-
-        d = {}
-        d['id'] = obj.id
-        d['model'] = cls.get_model_name()
-        d['forum_id'] = obj.forum.id
-        d['title'] = obj.title
-        d['is_sticky'] = obj.is_sticky
-        d['is_locked'] = obj.is_locked
-        d['url'] = obj.get_absolute_url()
-
-        # TODO: Sphinx stores created and updated as seconds since the
-        # epoch, so we convert them to that format here so that the
-        # search view works correctly. When we ditch Sphinx, we should
-        # see if it's faster to filter on ints or whether we should
-        # switch them to dates.
-        d['created'] = int(time.mktime(obj.created.timetuple()))
-
-        if obj.last_post is not None:
-            d['updated'] = int(time.mktime(obj.last_post.created.timetuple()))
-        else:
-            d['updates'] = None
-
-        d['replies'] = obj.replies
-
-        author_ids = set()
-        author_ords = set()
-        content = []
-
-        for post in obj.post_set.select_related('author').all():
-            author_ids.add(post.author.id)
-            author_ords.add(post.author.username)
-            content.append(post.content)
-
-        d['author_id'] = list(author_ids)
-        d['author_ord'] = list(author_ords)
-        d['content'] = content
-
-        d['indexed_on'] = int(time.time())
-        return d
+    def extract_documents(cls, ids):
+        """Extracts interesting thing from Threads and their Posts"""
+        threads = list(cls.objects.select_related('forum', 'last_post')
+                                  .filter(pk__in=ids))
+
+        posts = {}
+        for thread_id, author_id, username, content in (
+                Post.uncached.filter(thread__in=ids)
+                             .values_list('thread', 'author',
+                                          'author__username', 'content')):
+            posts.setdefault(thread_id, []).append(
+                (author_id, username, content))
+
+        for obj in threads:
+            d = {}
+            d['id'] = obj.id
+            d['model'] = cls.get_model_name()
+            d['forum_id'] = obj.forum.id
+            d['title'] = obj.title
+            d['is_sticky'] = obj.is_sticky
+            d['is_locked'] = obj.is_locked
+            d['url'] = obj.get_absolute_url()
+
+            # TODO: Sphinx stores created and updated as seconds since the
+            # epoch, so we convert them to that format here so that the
+            # search view works correctly. When we ditch Sphinx, we should
+            # see if it's faster to filter on ints or whether we should
+            # switch them to dates.
+            d['created'] = int(time.mktime(obj.created.timetuple()))
+
+            if obj.last_post is not None:
+                d['updated'] = int(time.mktime(
+                        obj.last_post.created.timetuple()))
+            else:
+                d['updates'] = None
+
+            d['replies'] = obj.replies
+
+            author_ids = set()
+            author_ords = set()
+            content = []
+
+            for author_id, username, post_content in posts.get(obj.id, []):
+                author_ids.add(author_id)
+                author_ords.add(username)
+                content.append(post_content)
+
+            d['author_id'] = list(author_ids)
+            d['author_ord'] = list(author_ords)
+            d['content'] = content
+
+            d['indexed_on'] = int(time.time())
+            yield d
 
     @classmethod
     def search(cls):
@@ -255,7 +264,7 @@ class Thread(NotificationsMixin, ModelBase, SearchMixin):
 register_for_indexing(Thread, 'forums')
 
 
-class Post(ActionMixin, ModelBase):
+class Post(ParsedContentMixin, ActionMixin, ModelBase):
     thread = models.ForeignKey('Thread')
     content = models.TextField()
     author = models.ForeignKey(User)
@@ -332,27 +341,5 @@ class Post(ActionMixin, ModelBase):
         url_ = self.thread.get_absolute_url()
         return urlparams(url_, hash='post-%s' % self.id, **query)
 
-    @property
-    def content_parsed(self):
-        return wiki_to_html(self.content)
-
 
 register_for_indexing(Post, 'forums', instance_to_indexee=lambda p: p.thread)
-
-
-# NOTE: This only affects Sphinx search--it's not used in ES search.
-def discussion_searcher(request):
-    """Return a forum searcher with default parameters."""
-    if waffle.flag_is_active(request, 'elasticsearch'):
-        index_model = Thread
-    else:
-        # The index is on Post but with the Thread.title for the
-        # Thread related to the Post. We base the S off Post because
-        # we need to excerpt content.
-        index_model = Post
-
-    return (searcher(request)(index_model).weight(title=2, content=1)
-                                          .group_by('thread_id', '-@group')
-                                          .query_fields('title__text',
-                                                        'content__text')
-                                          .order_by('created'))
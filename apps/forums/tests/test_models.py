@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 
 from django.contrib.contenttypes.models import ContentType
 
+import mock
 from nose.tools import eq_
 
 from access.tests import permission
@@ -304,3 +305,16 @@ class SaveDateTestCase(ForumTestCase):
         """The content_parsed field is populated."""
         p = post(thread=self.thread, content='yet another post', save=True)
         eq_('<p>yet another post\n</p>', p.content_parsed)
+
+    def test_content_parsed_cached(self):
+        """content_parsed renders once and again after edits."""
+        p = post(thread=self.thread, content='yet another post', save=True)
+        eq_('<p>yet another post\n</p>', p.content_parsed)
+
+        with mock.patch.object(Post, 'parse_content') as parse_content:
+            eq_('<p>yet another post\n</p>', p.content_parsed)
+            assert not parse_content.called
+
+        p.content = 'edited post'
+        p.save()
+        eq_('<p>edited post\n</p>', Post.objects.get(pk=p.pk).content_parsed)
@@ -64,15 +64,15 @@ class DeleteEditImageTests(TestCase):
         eq_(200, r.status_code)
         eq_(0, Image.objects.count())
 
-    @mock.patch.object(views, 'schedule_rebuild_kb')
-    def test_schedule_rebuild_kb_on_delete(self, schedule_rebuild_kb):
-        """KB rebuild scheduled on delete"""
+    @mock.patch.object(views, 'schedule_rebuild_dependents')
+    def test_rebuild_dependents_on_delete(self, schedule_rebuild_dependents):
+        """Rebuild of the documents showing an image scheduled on delete"""
         im = image()
         r = post(self.client, 'gallery.delete_media', args=['image', im.id])
 
         eq_(200, r.status_code)
         eq_(0, Image.objects.count())
-        assert schedule_rebuild_kb.called
+        assert schedule_rebuild_dependents.called
 
     def test_edit_own_image(self):
         """Can edit an image I created."""
@@ -259,9 +259,9 @@ class UploadImageTests(TestCase):
         msg = 'Image with this Locale and Title already exists.'
         assert doc('ul.errorlist li').text().startswith(msg)
 
-    @mock.patch.object(views, 'schedule_rebuild_kb')
-    def test_upload_image_rebuild_kb(self, schedule_rebuild_kb):
-        """Uploading an image schedules a KB rebuild."""
+    @mock.patch.object(views, 'schedule_rebuild_dependents')
+    def test_upload_image_no_rebuild(self, schedule_rebuild_dependents):
+        """Uploading a draft image doesn't rebuild anything."""
         with open(TEST_IMG) as f:
             r = post(self.client, 'gallery.upload_async', {'file': f},
                      args=['image'])
@@ -270,7 +270,7 @@ class UploadImageTests(TestCase):
         eq_(200, r.status_code)
         json_r = json.loads(r.content)
         eq_('success', json_r['status'])
-        assert schedule_rebuild_kb.called
+        assert not schedule_rebuild_dependents.called
 
 
 class ViewHelpersTests(TestCase):
@@ -22,7 +22,7 @@ from sumo.urlresolvers import reverse
 from sumo.utils import paginate
 from upload.tasks import compress_image, generate_thumbnail
 from upload.utils import FileTooLargeError
-from wiki.tasks import schedule_rebuild_kb
+from wiki.tasks import schedule_rebuild_dependents
 
 MSG_FAIL_UPLOAD = {'image': _lazy(u'Could not upload your image.'),
                    'video': _lazy(u'Could not upload your video.')}
@@ -73,8 +73,8 @@ def upload(request, media_type='image'):
             invalidate = Image.objects.exclude(pk=img.pk)
             if invalidate.exists():
                 Image.objects.invalidate(invalidate[0])
-            # Rebuild KB
-            schedule_rebuild_kb()
+            # Re-render the documents that show it
+            schedule_rebuild_dependents(img)
             return HttpResponseRedirect(img.get_absolute_url())
         else:
             return gallery(request, media_type='image')
@@ -91,8 +91,8 @@ def upload(request, media_type='image'):
             invalidate = Video.objects.exclude(pk=vid.pk)
             if invalidate.exists():
                 Video.objects.invalidate(invalidate[0])
-            # Rebuild KB
-            schedule_rebuild_kb()
+            # Re-render the documents that show it
+            schedule_rebuild_dependents(vid)
             return HttpResponseRedirect(vid.get_absolute_url())
         else:
             return gallery(request, media_type='video')
@@ -208,9 +208,9 @@ def delete_media(request, media_id, media_type='image'):
     # Handle confirm delete form POST
     log.warning('User %s is deleting %s with id=%s' %
                 (request.user, media_type, media.id))
+    # Re-render the documents that show it
+    schedule_rebuild_dependents(media)
     media.delete()
-    # Rebuild KB
-    schedule_rebuild_kb()
     return HttpResponseRedirect(reverse('gallery.gallery', args=[media_type]))
 
 
@@ -266,7 +266,6 @@ def upload_async(request, media_type='image'):
             json.dumps({'status': 'error', 'message': e.args[0]}))
 
     if isinstance(file_info, dict) and 'thumbnail_url' in file_info:
-        schedule_rebuild_kb()
         return HttpResponse(
             json.dumps({'status': 'success', 'file': file_info}))
 
@@ -6,8 +6,8 @@ from django.db import models
 from tidings.models import NotificationsMixin
 
 import kbforums
-from sumo.helpers import urlparams, wiki_to_html
-from sumo.models import ModelBase
+from sumo.helpers import urlparams
+from sumo.models import ModelBase, ParsedContentMixin
 from sumo.urlresolvers import reverse
 from wiki.models import Document
 
@@ -78,7 +78,7 @@ class Thread(NotificationsMixin, ModelBase):
         # then Post.delete will erase the thread, as well.
 
 
-class Post(ModelBase):
+class Post(ParsedContentMixin, ModelBase):
     thread = models.ForeignKey(Thread)
     content = models.TextField()
     creator = models.ForeignKey(User, related_name='wiki_post_set')
@@ -146,7 +146,3 @@ class Post(ModelBase):
                        kwargs={'document_slug': self.thread.document.slug,
                                'thread_id': self.thread.id})
         return urlparams(url_, hash='post-%s' % self.id, **query)
-
-    @property
-    def content_parsed(self):
-        return wiki_to_html(self.content)
@@ -187,3 +187,11 @@ class KBSaveDateTestCase(KBForumTestCase):
         """The content_parsed field is populated."""
         p = Post.objects.get(pk=4)
         eq_('<p>yet another post\n</p>', p.content_parsed)
+
+    def test_content_parsed_after_edit(self):
+        """Editing a post doesn't leave the old HTML around."""
+        p = Post.objects.get(pk=4)
+        eq_('<p>yet another post\n</p>', p.content_parsed)
+        p.content = 'edited post'
+        p.save()
+        eq_('<p>edited post\n</p>', Post.objects.get(pk=4).content_parsed)
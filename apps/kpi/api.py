@@ -2,7 +2,7 @@ from operator import itemgetter
 from datetime import date, timedelta
 
 from django.db import connections, router
-from django.db.models import Count, F
+from django.db.models import Count, F, Sum
 
 from tastypie import fields
 from tastypie.authentication import BasicAuthentication
@@ -14,7 +14,7 @@ from customercare.models import Reply
 from kpi.models import (Metric, MetricKind, VISITORS_METRIC_CODE,
                         L10N_METRIC_CODE)
 from questions.models import Question, Answer, AnswerVote
-from wiki.models import HelpfulVote, Revision
+from wiki.models import HelpfulVoteRollup, Revision
 
 
 class CachedResource(Resource):
@@ -213,16 +213,25 @@ class VoteResource(CachedResource):
 
     def get_object_list(self, request):
         # Set up the queries for the data we need
-        qs_kb_votes = _qs_for(HelpfulVote)
         qs_ans_votes = _qs_for(AnswerVote)
 
         # Filter on helpful
-        qs_kb_helpful_votes = qs_kb_votes.filter(helpful=True)
         qs_ans_helpful_votes = qs_ans_votes.filter(helpful=True)
 
+        # KB votes come rolled up by day already.
+        kb_votes = HelpfulVoteRollup.uncached.filter(
+            day__gte=_start_date()).extra(
+                select={
+                    'month': 'extract( month from day )',
+                    'year': 'extract( year from day )',
+                }).values('year', 'month').annotate(
+                    yes=Sum('yes'), no=Sum('no'))
+        kb_votes = list(kb_votes)
+
         return merge_results(
-                    kb_votes=qs_kb_votes,
-                    kb_helpful=qs_kb_helpful_votes,
+                    kb_votes=[dict(x, count=x['yes'] + x['no'])
+                              for x in kb_votes],
+                    kb_helpful=[dict(x, count=x['yes']) for x in kb_votes],
                     ans_votes=qs_ans_votes,
                     ans_helpful=qs_ans_helpful_votes)
 
@@ -13,6 +13,7 @@ from sumo.tests import TestCase, LocalizingClient
 from sumo.urlresolvers import reverse
 from questions.tests import answer, answervote, question
 from users.tests import user, add_permission
+from wiki.models import HelpfulVoteRollup
 from wiki.tests import document, revision, helpful_vote
 
 
@@ -81,6 +82,7 @@ class KpiApiTests(TestCase):
         helpful_vote(revision=r, save=True)
         helpful_vote(revision=r, save=True)
         helpful_vote(revision=r, helpful=True, save=True)
+        HelpfulVoteRollup.roll_up()
 
         a = answer(save=True)
         answervote(answer=a, save=True)
@@ -1,3 +1,4 @@
+import mock
 from nose.tools import eq_
 
 from messages import send_message
@@ -28,3 +29,21 @@ class SendTests(TestCase):
             eq_(sender, message.sender)
             assert message.to in to
             eq_(msg_text, message.message)
+
+    def test_content_parsed_cached(self):
+        """Messages render once and again after edits."""
+        send_message(to=[user(save=True)], text='hi there!',
+                     sender=user(save=True))
+
+        for cls in (InboxMessage, OutboxMessage):
+            msg = cls.objects.get()
+            eq_('<p>hi there!\n</p>', msg.content_parsed)
+
+            with mock.patch.object(cls, 'parse_content') as parse_content:
+                eq_('<p>hi there!\n</p>',
+                    cls.objects.get(pk=msg.pk).content_parsed)
+                assert not parse_content.called
+
+            msg.message = 'edited'
+            msg.save()
+            eq_('<p>edited\n</p>', cls.objects.get(pk=msg.pk).content_parsed)
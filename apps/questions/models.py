@@ -9,6 +9,7 @@ from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.db import models
+from django.db.models import Count
 from django.db.models.signals import post_save
 
 from product_details import product_details
@@ -25,7 +26,6 @@ from questions.karma_actions import (AnswerAction, FirstAnswerAction,
 from questions.question_config import products
 from questions.tasks import (update_question_votes, update_answer_pages,
                              log_answer)
-from search import searcher
 from search.models import SearchMixin, register_for_indexing
 from search.utils import crc32
 from sumo.helpers import urlparams
@@ -320,66 +320,89 @@ class Question(ModelBase, BigVocabTaggableMixin, SearchMixin):
             'indexed_on': {'type': 'integer'}}
 
     @classmethod
-    def extract_document(cls, obj_id):
-        """Extracts indexable attributes from a Question and its answers."""
+    def extract_documents(cls, ids):
+        """Extracts indexable attributes from Questions and their answers.
+
+        Uses a handful of queries for the whole list of ids.
+
+        """
+        ids = list(ids)
 
         # Note: Need to keep this in sync with
         # tasks.update_question_vote_chunk.
-        obj = cls.uncached.values(
+        questions = cls.uncached.filter(pk__in=ids).values(
             'id', 'title', 'content', 'num_answers', 'solution_id',
             'is_locked', 'created', 'updated', 'num_votes_past_week',
-            'creator__username').get(pk=obj_id)
-
-        d = {}
-        d['id'] = obj['id']
-        d['model'] = cls.get_model_name()
-        d['title'] = obj['title']
-        d['question_content'] = obj['content']
-        d['num_answers'] = obj['num_answers']
-        d['is_solved'] = bool(obj['solution_id'])
-        d['is_locked'] = obj['is_locked']
-        d['has_answers'] = bool(obj['num_answers'])
-
-        # We do this because get_absolute_url is an instance method
-        # and we don't want to create an instance because it's a DB
-        # hit and expensive. So we do it by hand. get_absolute_url
-        # doesn't change much, so this is probably ok.
-        d['url'] = reverse('questions.answers',
-                           kwargs={'question_id': obj['id']})
-
-        # TODO: Sphinx stores created and updated as seconds since the
-        # epoch, so we convert them to that format here so that the
-        # search view works correctly. When we ditch Sphinx, we should
-        # see if it's faster to filter on ints or whether we should
-        # switch them to dates.
-        d['created'] = int(time.mktime(obj['created'].timetuple()))
-        d['updated'] = int(time.mktime(obj['updated'].timetuple()))
-
-        d['question_creator'] = obj['creator__username']
-        d['num_votes'] = (QuestionVote.objects
-                          .filter(question=obj['id'])
-                          .count())
-        d['num_votes_past_week'] = obj['num_votes_past_week']
-
-        d['tag'] = list(TaggedItem.tags_for(
-            Question, Question(pk=obj_id)).values_list('name', flat=True))
-
-        answer_values = list(Answer.objects
-                                   .filter(question=obj_id)
-                                   .values_list('content',
-                                                'creator__username'))
-
-        d['answer_content'] = [a[0] for a in answer_values]
-        d['answer_creator'] = list(set([a[1] for a in answer_values]))
-
-        if not answer_values:
-            d['has_helpful'] = False
-        else:
-            d['has_helpful'] = Answer.objects.filter(
-                question=obj_id).filter(votes__helpful=True).exists()
-
-        d['indexed_on'] = int(time.time())
-        return d
+            'creator__username')
+
+        num_votes = dict(QuestionVote.uncached
+                                     .filter(question__in=ids)
+                                     .values_list('question')
+                                     .annotate(Count('id'))
+                                     .order_by())
+
+        ct = ContentType.objects.get_for_model(cls)
+        tags = {}
+        for obj_id, name in (TaggedItem.objects
+                                       .filter(content_type=ct,
+                                               object_id__in=ids)
+                                       .values_list('object_id',
+                                                    'tag__name')):
+            tags.setdefault(obj_id, []).append(name)
+
+        answers = {}
+        for question_id, content, creator in (
+                Answer.uncached.filter(question__in=ids)
+                               .values_list('question', 'content',
+                                            'creator__username')):
+            answers.setdefault(question_id, []).append((content, creator))
+
+        has_helpful = set(AnswerVote.uncached
+                                    .filter(answer__question__in=ids,
+                                            helpful=True)
+                                    .values_list('answer__question',
+                                                 flat=True))
+
+        for obj in questions:
+            d = {}
+            d['id'] = obj['id']
+            d['model'] = cls.get_model_name()
+            d['title'] = obj['title']
+            d['question_content'] = obj['content']
+            d['num_answers'] = obj['num_answers']
+            d['is_solved'] = bool(obj['solution_id'])
+            d['is_locked'] = obj['is_locked']
+            d['has_answers'] = bool(obj['num_answers'])
+
+            # We do this because get_absolute_url is an instance method
+            # and we don't want to create an instance because it's a DB
+            # hit and expensive. So we do it by hand. get_absolute_url
+            # doesn't change much, so this is probably ok.
+            d['url'] = reverse('questions.answers',
+                               kwargs={'question_id': obj['id']})
+
+            # TODO: Sphinx stores created and updated as seconds since the
+            # epoch, so we convert them to that format here so that the
+            # search view works correctly. When we ditch Sphinx, we should
+            # see if it's faster to filter on ints or whether we should
+            # switch them to dates.
+            d['created'] = int(time.mktime(obj['created'].timetuple()))
+            d['updated'] = int(time.mktime(obj['updated'].timetuple()))
+
+            d['question_creator'] = obj['creator__username']
+            d['num_votes'] = num_votes.get(obj['id'], 0)
+            d['num_votes_past_week'] = obj['num_votes_past_week']
+
+            d['tag'] = tags.get(obj['id'], [])
+
+            answer_values = answers.get(obj['id'], [])
+
+            d['answer_content'] = [a[0] for a in answer_values]
+            d['answer_creator'] = list(set([a[1] for a in answer_values]))
+            d['has_helpful'] = obj['id'] in has_helpful
+
+            d['indexed_on'] = int(time.time())
+            yield d
 
     @classmethod
     def search(cls):
@@ -709,17 +732,3 @@ def _content_parsed(obj):
         html = wiki_to_html(obj.content)
         cache.add(cache_key, html, CACHE_TIMEOUT)
     return html
-
-
-# NOTE: This only affects Sphinx search--it's not used in ES search.
-def question_searcher(request):
-    """Return a question searcher with default parameters."""
-    return (searcher(request)(Question)
-                .query_fields('title__text',
-                              'question_content__text',
-                              'answer_content__text')
-                .weight(title=4, question_content=3, answer_content=3)
-                .group_by('question_id', '-@group')  # nop in elasticutils
-                .highlight(before_match='<b>',
-                           after_match='</b>',
-                           limit=settings.SEARCH_SUMMARY_LENGTH))
@@ -101,3 +101,32 @@ class QuestionSearchTests(ElasticTestCase):
         self.refresh()
         result = Question.search().query('LOLRUS')
         assert len(result) > 0
+
+    def test_extract_documents(self):
+        """extract_documents batches questions without mixing them up."""
+        q1 = question(title=u'q1', save=True)
+        q1.tags.add(u'desktop')
+        ans = answer(question=q1, content=u'a1', save=True)
+        answervote(answer=ans, helpful=True, save=True)
+        questionvote(question=q1, save=True)
+        questionvote(question=q1, save=True)
+        q2 = question(title=u'q2', save=True)
+
+        docs = dict((d['id'], d) for d in
+                    Question.extract_documents([q1.id, q2.id, 0]))
+        eq_(sorted(docs.keys()), sorted([q1.id, q2.id]))
+
+        eq_(docs[q1.id]['tag'], [u'desktop'])
+        eq_(docs[q1.id]['answer_content'], [u'a1'])
+        eq_(docs[q1.id]['num_votes'], 2)
+        eq_(docs[q1.id]['has_helpful'], True)
+
+        eq_(docs[q2.id]['tag'], [])
+        eq_(docs[q2.id]['answer_content'], [])
+        eq_(docs[q2.id]['num_votes'], 0)
+        eq_(docs[q2.id]['has_helpful'], False)
+
+        # extract_document gives the same thing for a single question.
+        doc = Question.extract_document(q1.id)
+        del doc['indexed_on'], docs[q1.id]['indexed_on']
+        eq_(doc, docs[q1.id])
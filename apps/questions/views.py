@@ -43,12 +43,11 @@ from questions.karma_actions import (SolutionAction, AnswerMarkedHelpfulAction,
                                      AnswerMarkedNotHelpfulAction)
 from questions.marketplace import (MARKETPLACE_CATEGORIES, submit_ticket,
                                    ZendeskError)
-from questions.models import (Question, Answer, QuestionVote, AnswerVote,
-                              question_searcher)
+from questions.models import Question, Answer, QuestionVote, AnswerVote
 from questions.question_config import products
 from search.utils import locale_or_default
-from search.es_utils import ESTimeoutError, ESMaxRetryError, ESException
-from search import SearchError
+from search.es_utils import (ESTimeoutError, ESMaxRetryError, ESException,
+                              multi_search)
 from sumo.helpers import urlparams
 from sumo.urlresolvers import reverse
 from sumo.utils import paginate, simple_paginate, build_paged_url
@@ -58,7 +57,7 @@ from upload.views import upload_imageattachment
 from users.forms import RegisterForm
 from users.models import Setting
 from users.utils import handle_login, handle_register
-from wiki.models import Document, wiki_searcher
+from wiki.models import Document
 
 
 log = logging.getLogger('k.questions')
@@ -210,15 +209,11 @@ def new_question(request, template=None):
     if request.method == 'GET':
         search = request.GET.get('search', '')
         if search:
-            try:
-                results = _search_suggestions(
-                    request,
-                    search,
-                    locale_or_default(request.locale),
-                    product.get('tags'))
-            except SearchError:
-                # Just quietly advance the user to the next step.
-                results = []
+            results = _search_suggestions(
+                request,
+                search,
+                locale_or_default(request.locale),
+                product.get('tags'))
             tried_search = True
         else:
             results = []
@@ -935,14 +930,8 @@ def _search_suggestions(request, query, locale, category_tags):
     Returns up to 3 wiki pages, then up to 3 questions.
 
     """
-    if waffle.flag_is_active(request, 'elasticsearch'):
-        engine = 'elastic'
-        question_s = Question.search()
-        wiki_s = Document.search()
-    else:
-        engine = 'sphinx'
-        question_s = question_searcher(request)
-        wiki_s = wiki_searcher(request)
+    question_s = Question.search()
+    wiki_s = Document.search()
 
     # Max number of search results per type.
     WIKI_RESULTS = QUESTIONS_RESULTS = 3
@@ -953,14 +942,21 @@ def _search_suggestions(request, query, locale, category_tags):
         wiki_s = wiki_s.filter(tag__in=category_tags)
 
     try:
-        raw_results = (
+        wiki_s = (
             wiki_s.filter(locale=locale,
                           category__in=settings.SEARCH_DEFAULT_CATEGORIES)
                   .query(query)
                   .values_dict('id')[:WIKI_RESULTS])
 
+        # Note: Questions app is en-US only.
+        question_s = (question_s.query(query)
+                                .values_dict('id')[:QUESTIONS_RESULTS])
+
+        # Get both sets of results in one round trip.
+        multi_search([wiki_s, question_s])
+
         results = []
-        for r in raw_results:
+        for r in wiki_s:
             try:
                 doc = (Document.objects.select_related('current_revision')
                                        .get(pk=r['id']))
@@ -974,11 +970,7 @@ def _search_suggestions(request, query, locale, category_tags):
             except Document.DoesNotExist:
                 pass
 
-        # Note: Questions app is en-US only.
-        raw_results = (question_s.query(query)
-                                 .values_dict('id')[:QUESTIONS_RESULTS])
-
-        for r in raw_results:
+        for r in question_s:
             try:
                 q = Question.objects.get(pk=r['id'])
                 results.append({
@@ -991,16 +983,13 @@ def _search_suggestions(request, query, locale, category_tags):
             except Question.DoesNotExist:
                 pass
 
-    except (SearchError, ESTimeoutError, ESMaxRetryError, ESException), exc:
-        if isinstance(exc, SearchError):
-            statsd.incr('questions.suggestions.%s.searcherror' % engine)
-        elif isinstance(exc, ESTimeoutError):
-            statsd.incr('questions.suggestions.%s.timeouterror' % engine)
+    except (ESTimeoutError, ESMaxRetryError, ESException), exc:
+        if isinstance(exc, ESTimeoutError):
+            statsd.incr('questions.suggestions.elastic.timeouterror')
         elif isinstance(exc, ESMaxRetryError):
-            statsd.incr('questions.suggestions.%s.maxretryerror' % engine)
+            statsd.incr('questions.suggestions.elastic.maxretryerror')
         elif isinstance(exc, ESException):
-            statsd.incr('questions.suggestions.%s.elasticsearchexception' %
-                        engine)
+            statsd.incr('questions.suggestions.elastic.elasticsearchexception')
 
         return []
 
@@ -1,11 +1,4 @@
-import os
-
-from django.conf import settings
-
-from search.es_utils import Sphilastic
-import oedipus
 from tower import ugettext_lazy as _lazy
-import waffle
 
 
 WHERE_WIKI = 1
@@ -78,27 +71,3 @@ SORTBY_QUESTIONS = (
     (3, _lazy(u'Number of answers')),
 )
 
-
-class SphinxSearcher(oedipus.S):
-    @property
-    def port(self):
-        """Twiddle Sphinx port at runtime based on var set in SphinxTestCase"""
-        return (settings.TEST_SPHINX_PORT
-                if os.environ.get('DJANGO_ENVIRONMENT') == 'test'
-                else settings.SPHINX_PORT)
-
-
-ExcerptTimeoutError = oedipus.ExcerptTimeoutError
-ExcerptSocketError = oedipus.ExcerptSocketError
-SearchError = oedipus.SearchError
-
-
-def searcher(request):
-    """Return an ``S`` object for use with either ElasticSearch or Sphinx.
-
-    Which it returns depends on the ``elasticsearch`` waffle flag.
-
-    """
-    return (Sphilastic if
-            waffle.flag_is_active(request, 'elasticsearch') else
-            SphinxSearcher)
@@ -1,21 +1,25 @@
 from datetime import datetime
+import json
 
 from django.conf import settings
 from django.contrib import admin
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db.models import Q
 from django.http import HttpResponseRedirect, Http404
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 
-from waffle.models import Flag
+from redis.exceptions import ConnectionError
 
 from search import es_utils
 from search.es_utils import (get_doctype_stats, get_indexes, delete_index,
-                             ESTimeoutError, ESMaxRetryError,
-                             ESIndexMissingException)
+                             get_aliased_indexes, ESTimeoutError,
+                             ESMaxRetryError, ESIndexMissingException)
 from search.models import Record, get_search_models
 from search.tasks import ES_REINDEX_PROGRESS, reindex_with_progress
+from search.utils import get_slow_searches
+from sumo.redis_utils import RedisError
 from sumo.urlresolvers import reverse
 
 
@@ -36,7 +40,7 @@ def handle_delete(request):
         raise DeleteError('"%s" does not exist.' % index_to_delete)
 
     # Rule 3: Don't delete the READ index.
-    if index_to_delete == es_utils.READ_INDEX:
+    if index_to_delete in get_aliased_indexes(es_utils.READ_INDEX):
         raise DeleteError('"%s" is the read index.' % index_to_delete)
 
     delete_index(index_to_delete)
@@ -82,19 +86,24 @@ def search(request):
                                     '(TimeoutError)')
 
     stats = None
-    write_stats = None
+    write_stats = []
     indexes = []
+    read_indexes = []
+    write_indexes = []
     try:
         # This gets index stats, but also tells us whether ES is in
         # a bad state.
+        read_indexes = get_aliased_indexes(es_utils.READ_INDEX)
+        write_indexes = get_aliased_indexes(es_utils.WRITE_INDEX)
         try:
             stats = get_doctype_stats(es_utils.READ_INDEX)
         except ESIndexMissingException:
             stats = None
-        try:
-            write_stats = get_doctype_stats(es_utils.WRITE_INDEX)
-        except ESIndexMissingException:
-            write_stats = None
+        # Indexes that are only written to are being built by a
+        # reindex.
+        write_stats = [(index, get_doctype_stats(index))
+                       for index in write_indexes
+                       if index not in read_indexes]
         indexes = get_indexes()
         indexes.sort(key=lambda m: m[0])
     except ESMaxRetryError:
@@ -107,19 +116,22 @@ def search(request):
         es_error_message = ('Connection to Elastic Search timed out. '
                             '(TimeoutError)')
 
-    recent_records = reversed(Record.uncached.order_by('starttime')[:20])
-
-    es_waffle_flag = Flag.objects.get(name=u'elasticsearch')
+    # Only show whole reindexing runs, not the chunks they indexed.
+    # Runs are named after their index; older records have no name.
+    run_records = Record.uncached.filter(
+        Q(name='') | Q(name__startswith=settings.ES_INDEX_PREFIX))
+    recent_records = reversed(run_records.order_by('starttime')[:20])
 
     return render_to_response(
         'search/admin/search.html',
         {'title': 'Search',
-         'es_waffle_flag': es_waffle_flag,
          'doctype_stats': stats,
          'doctype_write_stats': write_stats,
          'indexes': indexes,
          'read_index': es_utils.READ_INDEX,
          'write_index': es_utils.WRITE_INDEX,
+         'read_indexes': read_indexes,
+         'write_indexes': write_indexes,
          'delete_error_message': delete_error_message,
          'es_error_message': es_error_message,
          'recent_records': recent_records,
@@ -134,6 +146,38 @@ def search(request):
 admin.site.register_view('search', search, 'Search - Index Maintenance')
 
 
+def slow_searches(request):
+    """Render the admin view listing recent slow searches."""
+    if not request.user.has_perm('search.reindex'):
+        raise PermissionDenied
+
+    error_message = ''
+    searches = []
+    try:
+        searches = get_slow_searches()
+    except (RedisError, ConnectionError), e:
+        error_message = 'Unable to get the slow searches: %s' % e
+
+    for search_ in searches:
+        search_['time'] = datetime.fromtimestamp(search_['time'])
+        search_['es_total'] = sum(ms for ms, took in search_['es_calls'])
+        search_['es_took'] = sum(took for ms, took in search_['es_calls'])
+        search_['bodies'] = [json.dumps(body, indent=2)
+                             for body in search_['bodies']]
+
+    return render_to_response(
+        'search/admin/slow_searches.html',
+        {'title': 'Slow Searches',
+         'searches': searches,
+         'slow_ms': settings.SEARCH_SLOW_MS,
+         'error_message': error_message},
+        RequestContext(request, {}))
+
+
+admin.site.register_view('slow-searches', slow_searches,
+                         'Search - Slow Searches')
+
+
 def _fix_value_dicts(values_dict_list):
     """Takes a values dict returned from an S and humanizes it"""
     for dict_ in values_dict_list:
@@ -0,0 +1,221 @@
+"""Offline search benchmark
+
+Replays a log of searches through the ES search view and reports
+throughput, latency percentiles per phase (see
+:py:class:`search.utils.SearchTimer`) and how much the results overlap
+with an earlier run. That lets you try out changes to weights,
+highlighting and the like before deploying them.
+
+The searches either go to whatever ES ``ES_HOSTS`` points at (a local
+index built from fixtures, say) or get answered from responses
+recorded in an earlier run, which takes ES out of the picture
+entirely.
+
+"""
+import codecs
+import hashlib
+import json
+import logging
+import time
+from urlparse import parse_qsl
+
+from django.conf import settings
+
+import elasticutils
+from pyes.es import ESJsonEncoder
+
+from search import views
+from search.es_utils import ESException
+from search.utils import SearchTimer
+
+
+log = logging.getLogger('search.benchmark')
+
+
+def read_query_log(path):
+    """Returns the list of search request data in a query log
+
+    Each line of the log is either the search terms of a front page
+    search or a query string for the search view starting with "?".
+    Blank lines and lines starting with "#" are skipped.
+
+    """
+    queries = []
+    for line in codecs.open(path, encoding='utf-8'):
+        line = line.strip()
+        if not line or line.startswith(u'#'):
+            continue
+        if line.startswith(u'?'):
+            data = dict((k, v.decode('utf-8')) for k, v
+                        in parse_qsl(line[1:].encode('utf-8')))
+        else:
+            data = {'q': line, 'q_tags': 'desktop', 'product': 'desktop'}
+        queries.append(data)
+    return queries
+
+
+class RecordedES(object):
+    """Stands in for the ES that multi_search talks to
+
+    With a real ES, requests go through to it and the responses get
+    recorded. Without one, requests get answered from the recorded
+    responses.
+
+    """
+    def __init__(self, es=None, responses=None):
+        self.es = es
+        self.responses = responses if responses is not None else {}
+        self.encoder = es.encoder if es is not None else ESJsonEncoder
+
+    def _send_request(self, method, path, body=None, params={}):
+        key = hashlib.md5('%s %s %s' % (method, path, body)).hexdigest()
+        if self.es is None:
+            if key not in self.responses:
+                raise ESException('No recorded response for %s' % body)
+            return self.responses[key]
+
+        response = self.es._send_request(method, path, body, params)
+        self.responses[key] = response
+        return response
+
+
+class _RecordingTimer(SearchTimer):
+    """SearchTimer that keeps track of all its instances"""
+    timers = []
+
+    def __init__(self, *args, **kwargs):
+        super(_RecordingTimer, self).__init__(*args, **kwargs)
+        self.timers.append(self)
+
+
+def percentile(values, percent):
+    """Returns the percent percentile of a sorted list of values"""
+    if not values:
+        return 0
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def overlap(first, second):
+    """Returns the fraction of results two lists of results share"""
+    if not first and not second:
+        return 1.0
+    return (float(len(set(first) & set(second))) /
+            max(len(first), len(second)))
+
+
+def run_benchmark(queries, runs=1, es=None):
+    """Runs the queries through the search view
+
+    :arg queries: list of request data dicts
+    :arg runs: how many times to run through the queries
+    :arg es: the ES for the searches to use, e.g. a RecordedES;
+        defaults to the usual one
+
+    :returns: ``(seconds, timers, results)`` where ``timers`` is the
+        list of SearchTimers of all the searches and ``results`` is a
+        dict of query -> list of the result urls of the last run
+
+    """
+    from sumo.tests import LocalizingClient
+    from sumo.urlresolvers import reverse
+
+    client = LocalizingClient()
+    url = reverse('search')
+    results = {}
+
+    # Swap in our timer and ES and make sure we're not timing the
+    # results cache.
+    old_timer, old_get_es = views.SearchTimer, elasticutils.get_es
+    old_timeout = settings.SEARCH_RESULTS_CACHE_TIMEOUT
+    _RecordingTimer.timers = []
+    views.SearchTimer = _RecordingTimer
+    if es is not None:
+        elasticutils.get_es = lambda **kwargs: es
+    settings.SEARCH_RESULTS_CACHE_TIMEOUT = 0
+    try:
+        start = time.time()
+        for i in range(runs):
+            for data in queries:
+                resp = client.get(url, dict(data, format='json'))
+                content = json.loads(resp.content)
+                if resp.status_code != 200:
+                    log.error('Search for %r failed: %s', data,
+                              content.get('error'))
+                    continue
+                key = json.dumps(data, sort_keys=True)
+                results[key] = [r['url'] for r in content['results']]
+        seconds = time.time() - start
+    finally:
+        views.SearchTimer = old_timer
+        elasticutils.get_es = old_get_es
+        settings.SEARCH_RESULTS_CACHE_TIMEOUT = old_timeout
+
+    return seconds, _RecordingTimer.timers, results
+
+
+def es_bench_cmd(query_log, runs=1, record=None, replay=None,
+                 output=None, compare=None):
+    """Benchmarks the ES search view against a query log
+
+    :arg query_log: path of the query log; see :py:func:`read_query_log`
+    :arg runs: how many times to run through the queries
+    :arg record: path to save the ES responses to
+    :arg replay: path of saved ES responses to answer searches with
+        instead of ES
+    :arg output: path to save the results to
+    :arg compare: path of results saved by an earlier run to compare
+        the results to
+
+    """
+    queries = read_query_log(query_log)
+    if not queries:
+        log.error('There are no queries in %s.', query_log)
+        return
+
+    es = None
+    if replay:
+        es = RecordedES(responses=json.load(open(replay)))
+    elif record:
+        es = RecordedES(es=elasticutils.get_es())
+
+    seconds, timers, results = run_benchmark(queries, runs, es)
+
+    if record:
+        json.dump(es.responses, open(record, 'w'))
+    if output:
+        json.dump(results, open(output, 'w'), indent=2)
+
+    searches = len(timers)
+    log.info('%d searches in %.2fs: %.1f searches/s', searches, seconds,
+             searches / seconds if seconds else 0)
+
+    phases = {}
+    for timer in timers:
+        phases.setdefault('total', []).append(timer.total)
+        for phase, ms in timer.phases:
+            phases.setdefault(phase, []).append(ms)
+        for ms, took in timer.es_calls:
+            phases.setdefault('es took', []).append(took)
+    log.info('%-10s %6s %6s %6s %6s %6s', 'phase (ms)', 'count', 'p50',
+             'p90', 'p99', 'max')
+    for phase, values in sorted(phases.items()):
+        values.sort()
+        log.info('%-10s %6d %6d %6d %6d %6d', phase, len(values),
+                 percentile(values, 50), percentile(values, 90),
+                 percentile(values, 99), values[-1])
+
+    if compare:
+        previous = json.load(open(compare))
+        overlaps = sorted((overlap(previous[key], urls), key)
+                          for key, urls in results.items()
+                          if key in previous)
+        if not overlaps:
+            log.info('No queries in common with %s.', compare)
+            return
+        log.info('Mean result overlap with %s: %.1f%%', compare,
+                 100 * sum(o for o, key in overlaps) / len(overlaps))
+        for value, key in overlaps[:10]:
+            if value == 1.0:
+                break
+            log.info('  %5.1f%%  %s', 100 * value, json.loads(key).get('q'))
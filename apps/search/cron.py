@@ -0,0 +1,27 @@
+from django.conf import settings
+
+import cronjobs
+
+from search.suggestions import update_suggestions as _update_suggestions
+from search.tasks import process_index_queue
+
+
+@cronjobs.register
+def index_queued():
+    """Files a task to index what's in the live indexing queue."""
+    if not settings.ES_INDEX_QUEUE:
+        return
+
+    process_index_queue.delay()
+
+
+@cronjobs.register
+def update_suggestions():
+    """Updates the search suggestions prefix index."""
+    _update_suggestions()
+
+
+@cronjobs.register
+def rebuild_suggestions():
+    """Updates the search suggestions prefix index from scratch."""
+    _update_suggestions(full=True)
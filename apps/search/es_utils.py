@@ -1,8 +1,15 @@
 import json
 import logging
-from itertools import chain, count, izip
+import multiprocessing
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import groupby, izip
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.db.models import Q
 
 import elasticutils
 import pyes
@@ -14,16 +21,27 @@ ESIndexMissingException = pyes.exceptions.IndexMissingException
 ESException = pyes.exceptions.ElasticSearchException
 
 
-# Calculate index names.
+# Calculate alias names.
 #
-# Note: This means that you need to restart kitsune to pick up new
-# index names. If that turns out to be lame, then we should switch
-# these to be functions.
+# Searches read from whatever index the READ_INDEX alias points to and
+# live indexing writes to every index behind the WRITE_INDEX alias.
+# Full reindexing builds a fresh timestamped index and flips the
+# aliases over to it when it's done, so switching indexes doesn't need
+# a settings change or a restart.
 READ_INDEX = (u'%s_%s' % (settings.ES_INDEX_PREFIX,
                           settings.ES_INDEXES['default']))
 
-WRITE_INDEX = (u'%s_%s' % (settings.ES_INDEX_PREFIX,
-                           settings.ES_WRITE_INDEXES['default']))
+WRITE_INDEX = READ_INDEX + u'_write'
+
+# Cache key prefix for the list of indexes behind the write alias.
+# Every live indexing call needs the list, so we keep it in the cache
+# and reindexing clears it whenever it changes the alias.
+ES_WRITE_INDEXES_KEY = 'sumo:search:es_write_indexes:%s'
+
+# Cache key for the search results generation. Cached search results
+# are keyed on it, so bumping it after the indexes change invalidates
+# all of them at once.
+ES_GENERATION_KEY = 'sumo:search:es_generation'
 
 # This is the unified elastic search doctype.
 SUMO_DOCTYPE = u'sumodoc'
@@ -46,6 +64,10 @@ class Sphilastic(elasticutils.S):
        touching oedipus when I need to make changes.
 
     """
+    # Raw ES response filled in by :py:func:`multi_search`. When this
+    # is set, the S doesn't go back to ES for its results or count.
+    _prefetched = None
+
     def get_index(self):
         # Sphilastic is a searcher and so it's _always_ used in a read
         # context. Therefore, we always return the READ_INDEX.
@@ -55,6 +77,18 @@ class Sphilastic(elasticutils.S):
         # SUMO uses a unified doctype, so this always returns that.
         return SUMO_DOCTYPE
 
+    def raw(self):
+        """Returns the prefetched response if there is one."""
+        if self._prefetched is not None:
+            return self._prefetched
+        return super(Sphilastic, self).raw()
+
+    def count(self):
+        """Returns the prefetched total if there is one."""
+        if self._prefetched is not None:
+            return self._prefetched['hits']['total']
+        return super(Sphilastic, self).count()
+
     def query(self, text, **kwargs):
         """Ignore any non-kw arg."""
         # TODO: If you're feeling fancy, turn the `text` arg into an "or"
@@ -101,6 +135,60 @@ class Sphilastic(elasticutils.S):
         return self
 
 
+def multi_search(searches):
+    """Executes several Sphilastic searches in a single ES round trip
+
+    All the queries are sent at once with the ``_msearch`` API and each
+    S is primed with its response, so iterating over it or calling
+    ``count()`` on it afterwards doesn't hit ES again.
+
+    .. Note::
+
+       Slicing and ``values_dict()`` return new S instances, so do
+       those *before* passing the searches in.
+
+    :arg searches: list of Sphilastic instances
+
+    :returns: the list of searches passed in
+
+    :throws ESException: if ES reports an error for any of the searches
+
+    """
+    if not searches:
+        return searches
+
+    es = elasticutils.get_es()
+
+    lines = []
+    for s in searches:
+        lines.append(json.dumps({'index': s.get_index(),
+                                 'type': s.get_doctype()}))
+        lines.append(json.dumps(s._build_query(), cls=es.encoder))
+
+    # The _msearch body is newline-delimited and has to end with a
+    # newline.
+    body = '\n'.join(lines) + '\n'
+    responses = es._send_request('GET', '_msearch', body)['responses']
+
+    for s, response in izip(searches, responses):
+        if 'error' in response:
+            raise ESException(response['error'])
+        s._prefetched = response
+
+    return searches
+
+
+def get_took(searches):
+    """Returns how long ES says primed searches took in ms
+
+    That's the slowest of them, since ES runs the searches of a
+    ``_msearch`` in parallel.
+
+    """
+    return max([s._prefetched.get('took', 0) for s in searches
+                if s._prefetched is not None] or [0])
+
+
 class MappingMergeError(Exception):
     """Represents a mapping merge error"""
     pass
@@ -204,32 +292,277 @@ def get_documents(cls, ids):
     return list(ret)
 
 
-def es_reindex_with_progress(percent=100):
-    """Rebuild Elastic indexes as you iterate over yielded progress ratios.
+def get_reindex_chunks(search_models, percent=100):
+    """Splits the indexable ids of each model into chunks
 
-    :arg percent: Defaults to 100.  Allows you to specify how much of
-        each doctype you want to index.  This is useful for
-        development where doing a full reindex takes an hour.
+    Chunks cover fixed id ranges (``ES_REINDEX_CHUNK_SIZE`` ids wide),
+    so a chunk's name stays the same between runs and can be used to
+    checkpoint it.
+
+    :arg search_models: list of model classes to chunk
+    :arg percent: how much of each model to include
+
+    :returns: list of ``(cls, name, id_list)`` tuples
+
+    """
+    chunk_size = settings.ES_REINDEX_CHUNK_SIZE
+    chunks = []
+    for cls in search_models:
+        ids = list(cls.get_indexable())
+        ids = ids[:int(len(ids) * (percent / 100.0))]
+
+        for key, group in groupby(ids, lambda id_: id_ // chunk_size):
+            name = u'%s %d-%d' % (cls.get_model_name(), key * chunk_size,
+                                  (key + 1) * chunk_size - 1)
+            chunks.append((cls, name, list(group)))
+    return chunks
+
+
+def index_chunk(cls, id_list, es=None, indexes=None):
+    """Extracts and bulk-indexes the documents for a list of ids
+
+    Documents that fail to extract or index are logged and skipped.
+
+    :arg cls: the search model class
+    :arg id_list: list of ids to index
+    :arg es: the ES to use; defaults to a fresh indexing ES
+    :arg indexes: the indexes to index into; defaults to the write
+        indexes
+
+    """
+    if es is None:
+        es = get_indexing_es()
+
+    try:
+        documents = list(cls.extract_documents(id_list))
+    except Exception:
+        # Go one at a time so one bad object doesn't take the whole
+        # chunk down with it.
+        log.exception('Unable to extract documents (ids: %d-%d), '
+                      'extracting one at a time', id_list[0], id_list[-1])
+        documents = []
+        for obj_id in id_list:
+            try:
+                documents.append(cls.extract_document(obj_id))
+            except Exception:
+                log.exception('Unable to extract document (id: %d)',
+                              obj_id)
+
+    for document in documents:
+        try:
+            cls.index(document, bulk=True, es=es, indexes=indexes)
+        except Exception:
+            log.exception('Unable to index document (id: %d)',
+                          document['id'])
+
+    es.flush_bulk(forced=True)
+
+
+def _index_chunk_worker(task):
+    """Indexes a chunk and checkpoints it in the Record table
+
+    This runs in reindexing worker processes, so it only takes and
+    returns picklable things.
+
+    :arg task: ``(batch_id, index, cls, name, id_list)`` tuple
+
+    :returns: ``(number of ids, whether it succeeded)`` tuple
+
+    """
+    from search.models import Record
+
+    batch_id, index, cls, name, id_list = task
+    rec = Record(batch_id=batch_id, name=name,
+                 starttime=datetime.now(),
+                 status=Record.STATUS_IN_PROGRESS,
+                 text=u'Indexing %s' % name)
+    rec.save()
+
+    try:
+        index_chunk(cls, id_list, indexes=[index])
+    except Exception, exc:
+        log.exception('Unable to index chunk %s', name)
+        rec.mark_fail(u'%s: %s' % (exc.__class__.__name__, exc))
+        return len(id_list), False
+    finally:
+        # We're essentially loading the whole db and if DEBUG=True,
+        # then Django saves every sql statement.
+        reset_queries()
+
+    rec.mark_success()
+    return len(id_list), True
+
+
+def get_aliased_indexes(alias):
+    """Returns the sorted list of indexes behind alias
+
+    Returns an empty list if there's no such alias. If alias is an
+    actual index (e.g. one built before we switched to aliases),
+    returns that.
+
+    """
+    try:
+        return sorted(get_indexing_es().get_alias(alias))
+    except ESIndexMissingException:
+        return []
+
+
+def get_write_indexes():
+    """Returns the list of indexes live indexing should write to
+
+    That's the live index, plus the index being built while a full
+    reindex is running.
 
     """
+    key = ES_WRITE_INDEXES_KEY % WRITE_INDEX
+    indexes = cache.get(key)
+    if indexes is None:
+        # Fall back to the read alias (or pre-alias index) if nothing
+        # has set up the write alias yet.
+        indexes = (get_aliased_indexes(WRITE_INDEX) or
+                   get_aliased_indexes(READ_INDEX))
+        cache.set(key, indexes, settings.ES_WRITE_INDEXES_TIMEOUT)
+    return indexes
+
+
+def _set_aliases(alias, indexes):
+    """Returns the alias commands that point alias at exactly indexes"""
+    current = get_aliased_indexes(alias)
+    commands = [('remove', index, alias) for index in current
+                if index not in indexes and index != alias]
+    commands.extend([('add', index, alias) for index in indexes
+                     if index not in current])
+    return commands
+
+
+def set_write_indexes(indexes):
+    """Points the write alias at indexes"""
+    commands = _set_aliases(WRITE_INDEX, indexes)
+    if commands:
+        get_indexing_es().change_aliases(commands)
+    cache.delete(ES_WRITE_INDEXES_KEY % WRITE_INDEX)
+
+
+def get_generation():
+    """Returns the current search results generation"""
+    generation = cache.get(ES_GENERATION_KEY)
+    if generation is None:
+        # Start from the time rather than 1 so we don't go back to an
+        # old generation if the key gets evicted.
+        generation = int(time.time())
+        cache.add(ES_GENERATION_KEY, generation, 60 * 60 * 24 * 30)
+        generation = cache.get(ES_GENERATION_KEY, generation)
+    return generation
+
+
+def bump_generation():
+    """Invalidates cached search results
+
+    Call this after changing what's in the indexes.
+
+    """
+    try:
+        cache.incr(ES_GENERATION_KEY)
+    except ValueError:
+        # The key isn't there, so there's nothing cached to invalidate.
+        pass
+
+
+def get_index_name():
+    """Returns a new timestamped index name for the read alias"""
+    return u'%s_%s' % (READ_INDEX, datetime.now().strftime('%Y%m%d%H%M%S%f'))
+
+
+def get_built_indexes():
+    """Returns the sorted list of indexes built for the read alias"""
+    prefix = READ_INDEX + u'_'
+    return sorted(name for name, count in get_indexes(all_indexes=True)
+                  if name.startswith(prefix) and name != WRITE_INDEX)
+
+
+def flip_aliases(index):
+    """Atomically points the read and write aliases at index
+
+    :returns: list of the indexes the read alias pointed to before
+
+    """
+    previous = get_aliased_indexes(READ_INDEX)
+    if previous == [READ_INDEX]:
+        # There's an index by the name of the alias from before we
+        # used aliases. It has to go before the alias can be made.
+        log.warning('Deleting index %s to replace it with an alias.',
+                    READ_INDEX)
+        delete_index(READ_INDEX)
+        previous = []
+
+    commands = (_set_aliases(READ_INDEX, [index]) +
+                _set_aliases(WRITE_INDEX, [index]))
+    if commands:
+        get_indexing_es().change_aliases(commands)
+    cache.delete(ES_WRITE_INDEXES_KEY % WRITE_INDEX)
+    bump_generation()
+    return [i for i in previous if i != index]
+
+
+def prune_indexes(keep):
+    """Deletes built indexes other than the ones in keep
+
+    This gets rid of old indexes and abandoned builds.
+
+    """
+    for index in get_built_indexes():
+        if index not in keep:
+            log.info('Deleting old index %s', index)
+            delete_index(index)
+
+
+def get_resumable_batch():
+    """Returns the last unfinished reindexing run
+
+    A run that still has records in progress is left alone, since
+    another reindex may be working on it, unless none of its records
+    were started or finished in the last ``ES_REINDEX_STALE_AFTER``
+    seconds, in which case it's taken to have crashed.
+
+    :returns: ``(batch_id, index)`` of the last reindexing run if it
+        didn't finish and its index is still around, otherwise
+        ``(None, None)``
+
+    """
+    from search.models import Record
+
+    runs = (Record.uncached.filter(name__startswith=READ_INDEX + u'_')
+                           .order_by('-id')[:1])
+    if (not runs or runs[0].status == Record.STATUS_SUCCESS or
+        runs[0].name not in get_built_indexes()):
+        return None, None
+
+    records = Record.uncached.filter(batch_id=runs[0].batch_id)
+    cutoff = datetime.now() - timedelta(
+        seconds=settings.ES_REINDEX_STALE_AFTER)
+    if (records.filter(status__in=[Record.STATUS_NEW,
+                                   Record.STATUS_IN_PROGRESS]).exists() and
+        records.filter(Q(starttime__gt=cutoff) |
+                       Q(endtime__gt=cutoff)).exists()):
+        return None, None
+    return runs[0].batch_id, runs[0].name
+
+
+def create_index(index):
+    """Creates index with the SUMO mapping"""
     from search.models import get_search_models
 
-    search_models = get_search_models()
     merged_mapping = {
         SUMO_DOCTYPE: {
             'properties': merge_mappings(
                 [(cls._meta.db_table, cls.get_mapping())
-                 for cls in search_models])
+                 for cls in get_search_models()])
             }
         }
 
     es = elasticutils.get_es()
-    index = WRITE_INDEX
     delete_index(index)
 
-    # There should be no mapping-conflict race here since the index doesn't
-    # exist. Live indexing should just fail.
-
     # Simultaneously create the index and the mappings, so live
     # indexing doesn't get a chance to index anything between the two
     # and infer a bogus mapping (which ES then freaks out over when we
@@ -237,19 +570,145 @@ def es_reindex_with_progress(percent=100):
 
     es.create_index(index, settings={'mappings': merged_mapping})
 
-    total = sum([cls.get_indexable().count() for cls in search_models])
-    to_index = [cls.index_all(percent) for cls in search_models]
-    return (float(done) / total for done, _ in
-            izip(count(1), chain(*to_index)))
+
+def es_reindex_with_progress(percent=100, workers=1, resume=False):
+    """Rebuild Elastic indexes as you iterate over yielded progress ratios.
+
+    Everything gets indexed into a new timestamped index. While that's
+    being built, live indexing writes to both the live index and the
+    new one. When it's done, the read and write aliases are flipped
+    over to the new index in one go. The previous index is kept around
+    so you can roll back to it (see :py:func:`es_rollback_cmd`); older
+    ones are deleted.
+
+    The indexable ids of each search model are split into chunks (see
+    :py:func:`get_reindex_chunks`) which get indexed by a pool of
+    worker processes. Each finished chunk is checkpointed in the
+    ``search.Record`` table, so a crashed run can be resumed.
+
+    :arg percent: Defaults to 100.  Allows you to specify how much of
+        each doctype you want to index.  This is useful for
+        development where doing a full reindex takes an hour.
+    :arg workers: Number of worker processes to index with. With 1,
+        everything is indexed in this process.
+    :arg resume: If the last run didn't finish, pick it up and skip
+        the chunks it finished instead of starting over with a new
+        index.
+
+    """
+    from search.models import Record, get_search_models
+
+    batch_id, index = get_resumable_batch() if resume else (None, None)
+    if batch_id is None:
+        batch_id = uuid.uuid4().hex[:10]
+        index = get_index_name()
+        done_names = set()
+    else:
+        log.info('Resuming reindex batch %s into %s', batch_id, index)
+        done_names = set(Record.uncached
+                               .filter(batch_id=batch_id,
+                                       status=Record.STATUS_SUCCESS)
+                               .values_list('name', flat=True))
+
+    rec = Record(batch_id=batch_id, name=index,
+                 starttime=datetime.now(),
+                 status=Record.STATUS_IN_PROGRESS,
+                 text=u'Reindexing into %s' % index)
+    rec.save()
+
+    pool = None
+    try:
+        if not resume or not done_names:
+            create_index(index)
+
+        # Double-write live updates into the new index while we build
+        # it, so it doesn't miss changes to chunks that are done.
+        set_write_indexes(
+            [i for i in get_aliased_indexes(READ_INDEX) if i != index] +
+            [index])
+
+        chunks = get_reindex_chunks(get_search_models(), percent)
+        total = sum(len(id_list) for cls, name, id_list in chunks)
+        done = sum(len(id_list) for cls, name, id_list in chunks
+                   if name in done_names)
+        tasks = [(batch_id, index, cls, name, id_list)
+                 for cls, name, id_list in chunks
+                 if name not in done_names]
+
+        if workers > 1:
+            # Worker processes must not share our db connection, so
+            # close it and let everyone open their own.
+            connection.close()
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(_index_chunk_worker, tasks)
+        else:
+            results = (_index_chunk_worker(task) for task in tasks)
+
+        failed = 0
+        for num, ok in results:
+            done += num
+            if not ok:
+                failed += 1
+            if total:
+                yield float(done) / total
+
+        get_indexing_es().refresh(index, timesleep=0)
+
+        if failed:
+            # Don't flip to an incomplete index. Live indexing keeps
+            # writing to it, so it's ready to be resumed.
+            rec.mark_fail(u'%d chunks failed. Run again with resume to '
+                          u'retry them.' % failed)
+        else:
+            previous = flip_aliases(index)
+            prune_indexes(keep=[index] + previous)
+            rec.mark_success()
+    except Exception, exc:
+        rec.mark_fail(u'Errored out %s %s' % (exc.__class__.__name__, exc))
+        raise
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def es_rollback_cmd():
+    """Points the aliases back at the index before the current one"""
+    current = get_aliased_indexes(READ_INDEX)
+    older = [index for index in get_built_indexes()
+             if current and index < current[0]]
+    if not older:
+        log.error('There is no older index to roll back to.')
+        return
+
+    log.info('Rolling back from %s to %s...', ', '.join(current), older[-1])
+    flip_aliases(older[-1])
+    log.info('Done!')
 
 
-def es_reindex_cmd(percent=100):
+def es_reindex_cmd(percent=100, workers=1, resume=False):
     """Rebuild ElasticSearch indexes
 
+    Progress is logged and published to the admin progress bar.
+
     See :py:func:`.es_reindex_with_progress` for argument details.
 
     """
-    [x for x in es_reindex_with_progress(percent) if False]
+    from search.tasks import ES_REINDEX_PROGRESS
+
+    start = last_update = time.time()
+    try:
+        cache.set(ES_REINDEX_PROGRESS, 0.001)
+        for ratio in es_reindex_with_progress(percent, workers, resume):
+            now = time.time()
+            if now > last_update + settings.ES_REINDEX_PROGRESS_BAR_INTERVAL:
+                last_update = now
+                cache.set(ES_REINDEX_PROGRESS, '%.5f' % ratio)
+                log.info('%.1f%% done (%s so far)', ratio * 100,
+                         format_time(now - start))
+    finally:
+        cache.delete(ES_REINDEX_PROGRESS)
+
+    log.info('done! (%s)', format_time(time.time() - start))
 
 
 def es_delete_cmd(index):
@@ -265,7 +724,7 @@ def es_delete_cmd(index):
         log.error('Index "%s" is not a valid index.', index)
         return
 
-    if index == READ_INDEX:
+    if index in get_aliased_indexes(READ_INDEX):
         ret = raw_input('"%s" is a read index. Are you sure you want '
                         'to delete it? (yes/no) ' % index)
         if ret != 'yes':
@@ -279,18 +738,19 @@ def es_delete_cmd(index):
 def es_status_cmd():
     """Shows elastic search index status"""
     try:
+        read_indexes = get_aliased_indexes(READ_INDEX)
+        write_indexes = get_aliased_indexes(WRITE_INDEX)
+
         try:
             read_doctype_stats = get_doctype_stats(READ_INDEX)
         except ESIndexMissingException:
             read_doctype_stats = None
 
-        if READ_INDEX == WRITE_INDEX:
-            write_doctype_stats = read_doctype_stats
-        else:
-            try:
-                write_doctype_stats = get_doctype_stats(WRITE_INDEX)
-            except ESIndexMissingException:
-                write_doctype_stats = None
+        # Stats for the indexes that are only written to, i.e. the one
+        # a full reindex is building.
+        write_doctype_stats = [(index, get_doctype_stats(index))
+                               for index in write_indexes
+                               if index not in read_indexes]
 
         indexes = get_indexes(all_indexes=True)
     except ESMaxRetryError:
@@ -303,7 +763,12 @@ def es_status_cmd():
     log.info('  ES_INDEX_PREFIX       : %s', settings.ES_INDEX_PREFIX)
     log.info('  ES_LIVE_INDEXING      : %s', settings.ES_LIVE_INDEXING)
     log.info('  ES_INDEXES            : %s', settings.ES_INDEXES)
-    log.info('  ES_WRITE_INDEXES      : %s', settings.ES_WRITE_INDEXES)
+
+    log.info('Aliases:')
+    log.info('  Read alias  (%s): %s', READ_INDEX,
+             ', '.join(read_indexes) or 'does not exist')
+    log.info('  Write alias (%s): %s', WRITE_INDEX,
+             ', '.join(write_indexes) or 'does not exist')
 
     log.info('Index stats:')
 
@@ -311,9 +776,9 @@ def es_status_cmd():
         log.info('  List of indexes:')
         for name, count in indexes:
             read_write = []
-            if name == READ_INDEX:
+            if name in read_indexes:
                 read_write.append('READ')
-            if name == WRITE_INDEX:
+            if name in write_indexes:
                 read_write.append('WRITE')
             log.info('    %-20s: %s %s', name, count,
                      '/'.join(read_write))
@@ -327,12 +792,10 @@ def es_status_cmd():
         for name, count in read_doctype_stats.items():
             log.info('    %-20s: %d', name, count)
 
-    if READ_INDEX != WRITE_INDEX:
-        if write_doctype_stats is None:
-            log.info('  Write index does not exist. (%s)', WRITE_INDEX)
-        else:
-            log.info('  Write index (%s):', WRITE_INDEX)
-            for name, count in write_doctype_stats.items():
+    if write_doctype_stats:
+        for index, stats in write_doctype_stats:
+            log.info('  Write-only index (%s):', index)
+            for name, count in stats.items():
                 log.info('    %-20s: %d', name, count)
     else:
         log.info('  Write index is same as read index.')
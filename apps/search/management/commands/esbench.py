@@ -0,0 +1,37 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from search.benchmark import es_bench_cmd
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks ES searches replayed from a query log.'
+    args = '<query_log>'
+    option_list = BaseCommand.option_list + (
+        make_option('--runs', type='int', dest='runs', default=1,
+                    help='Number of times to run through the queries'),
+        make_option('--record', dest='record', default=None,
+                    help='Save the ES responses to this file'),
+        make_option('--replay', dest='replay', default=None,
+                    help='Answer searches from ES responses saved with '
+                         '--record instead of ES'),
+        make_option('--output', dest='output', default=None,
+                    help='Save the results to this file'),
+        make_option('--compare', dest='compare', default=None,
+                    help='Compare the results to ones saved with '
+                         '--output'),)
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        if len(args) != 1:
+            raise CommandError('You must specify the query log.')
+        if options['runs'] < 1:
+            raise CommandError('runs should be at least 1')
+        if options['record'] and options['replay']:
+            raise CommandError("You can't record and replay at once.")
+
+        es_bench_cmd(args[0], options['runs'], options['record'],
+                     options['replay'], options['output'],
+                     options['compare'])
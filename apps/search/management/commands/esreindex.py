@@ -10,11 +10,19 @@ class Command(BaseCommand):
     help = 'Reindex the database for Elastic.'
     option_list = BaseCommand.option_list + (
         make_option('--percent', type='int', dest='percent', default=100,
-                    help='Reindex a percentage of things'),)
+                    help='Reindex a percentage of things'),
+        make_option('--workers', type='int', dest='workers', default=1,
+                    help='Number of worker processes to index with'),
+        make_option('--resume', action='store_true', dest='resume',
+                    default=False,
+                    help='Resume the last unfinished reindexing run'),)
 
     def handle(self, *args, **options):
         logging.basicConfig(level=logging.INFO)
         percent = options['percent']
         if not 1 <= percent <= 100:
             raise CommandError('percent should be between 1 and 100')
-        es_reindex_cmd(percent)
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('workers should be at least 1')
+        es_reindex_cmd(percent, workers, options['resume'])
@@ -0,0 +1,11 @@
+import logging
+from django.core.management.base import BaseCommand
+from search.es_utils import es_rollback_cmd
+
+
+class Command(BaseCommand):
+    help = 'Point the search aliases back at the previous index.'
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        es_rollback_cmd()
@@ -1,18 +1,22 @@
+import datetime
 import logging
 import pyes
-import time
 from threading import local
 
 from django.conf import settings
 from django.core import signals
-from django.db import reset_queries, models
+from django.db import models
 from django.db.models.signals import pre_delete, post_save
 from django.dispatch import receiver
 
-from search.tasks import index_task, unindex_task
+from redis.exceptions import ConnectionError
+from statsd import statsd
+
+from search.tasks import index_task, unindex_task, queue_for_indexing
 from search import es_utils
 
 from sumo.models import ModelBase
+from sumo.redis_utils import RedisError
 
 log = logging.getLogger('search.es')
 
@@ -49,7 +53,7 @@ class SearchMixin(object):
     When using this mixin, make sure to implement:
 
     * get_mapping
-    * extract_document
+    * extract_documents or extract_document
 
     Additionally, after defining your model, remember to register it and any
     related models which affect it::
@@ -74,13 +78,39 @@ class SearchMixin(object):
     def extract_document(cls, obj_id):
         """Extracts the ES index document for this instance
 
-        This must be implemented. It should return a dict representing
-        the document to be indexed.
+        It should return a dict representing the document to be
+        indexed.
+
+        By default, this uses :py:meth:`extract_documents`, so you only
+        need to implement one of the two.
+
+        :throws DoesNotExist: if there's no object with that id
+
+        """
+        for document in cls.extract_documents([obj_id]):
+            return document
+        raise cls.DoesNotExist('No %s with id %s.' % (cls.__name__, obj_id))
+
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts the ES index documents for a list of ids
+
+        It should yield a dict like the ones ``extract_document``
+        returns for each of the ids that exists. Use a few set-based
+        queries for the whole list rather than a few per object,
+        since this is what reindexing uses.
+
+        By default, this calls :py:meth:`extract_document` for each id,
+        so you only need to implement one of the two.
 
         For examples, see the codebase.
 
         """
-        raise NotImplementedError
+        for obj_id in ids:
+            try:
+                yield cls.extract_document(obj_id)
+            except cls.DoesNotExist:
+                pass
 
     @classmethod
     def get_model_name(cls):
@@ -116,81 +146,15 @@ class SearchMixin(object):
         return cls.objects.order_by('id').values_list('id', flat=True)
 
     @classmethod
-    def index_all(cls, percent=100):
-        """Reindexes all the objects for this model.
-
-        Yields number of documents done.
-
-        Note: This can get run from the command line, so we log stuff
-        to let the user know what's going on.
+    def index(cls, document, bulk=False, force_insert=False, refresh=False,
+              es=None, indexes=None):
+        """Indexes a single document
 
-        :arg percent: The percentage of questions to index. Defaults to
-            100--e.g. all of them.
+        :arg indexes: the indexes to index into. Defaults to the write
+            indexes, which include the index being built while a full
+            reindex is running.
 
         """
-        es = es_utils.get_indexing_es()
-
-        cls_name = cls._meta.db_table
-
-        start_time = time.time()
-
-        indexable_qs = cls.get_indexable()
-
-        log.info('reindex %s into %s index....', cls_name, es_utils.WRITE_INDEX)
-        total = indexable_qs.count()
-        to_index = int(total * (percent / 100.0))
-        log.info('total %s: %s (to be indexed: %s)',
-                 es_utils.SUMO_DOCTYPE, total, to_index)
-        if to_index == 0:
-            log.info('done!')
-            return
-
-        total = to_index
-
-        for t, obj_id in enumerate(indexable_qs):
-            if t > total:
-                break
-
-            if t % 1000 == 0 and t > 0:
-                time_to_go = (total - t) * ((time.time() - start_time) / t)
-                per_1000 = (time.time() - start_time) / (t / 1000.0)
-                log.info('%s/%s... (%s to go, %s per 1000 docs)', t, total,
-                         es_utils.format_time(time_to_go),
-                         es_utils.format_time(per_1000))
-
-                # We call this every 1000 or so because we're
-                # essentially loading the whole db and if DEBUG=True,
-                # then Django saves every sql statement which causes
-                # our memory to go up up up. So we reset it and that
-                # makes things happier even in DEBUG environments.
-                reset_queries()
-
-            if t % settings.ES_FLUSH_BULK_EVERY == 0:
-                # We built the ES with this setting, but it doesn't
-                # actually do anything with it unless we call
-                # flush_bulk which causes it to check its bulk_size
-                # and flush it if it's too big.
-                es.flush_bulk()
-
-            try:
-                cls.index(cls.extract_document(obj_id), bulk=True, es=es)
-            except Exception:
-                log.exception('Unable to extract/index document (id: %d)',
-                              obj_id)
-
-            yield t
-
-        es.flush_bulk(forced=True)
-        delta_time = time.time() - start_time
-        log.info('done! (%s, %s per 1000 docs)',
-                 es_utils.format_time(delta_time),
-                 es_utils.format_time(delta_time / (total / 1000.0)))
-        es.refresh(es_utils.WRITE_INDEX, timesleep=0)
-
-    @classmethod
-    def index(cls, document, bulk=False, force_insert=False, refresh=False,
-              es=None):
-        """Indexes a single document"""
         if not settings.ES_LIVE_INDEXING:
             return
 
@@ -199,19 +163,28 @@ class SearchMixin(object):
             # ES_INDEXING_TIMEOUT.
             es = es_utils.get_indexing_es()
 
-        es.index(document,
-                 index=es_utils.WRITE_INDEX,
-                 doc_type=es_utils.SUMO_DOCTYPE,
-                 id=document['id'],
-                 bulk=bulk,
-                 force_insert=force_insert)
+        if indexes is None:
+            indexes = es_utils.get_write_indexes()
 
-        if refresh:
-            es.refresh(es_utils.WRITE_INDEX, timesleep=0)
+        for index in indexes:
+            es.index(document,
+                     index=index,
+                     doc_type=es_utils.SUMO_DOCTYPE,
+                     id=document['id'],
+                     bulk=bulk,
+                     force_insert=force_insert)
+
+        if refresh and indexes:
+            es.refresh(indexes, timesleep=0)
 
     @classmethod
-    def unindex(cls, id, es=None):
-        """Removes a document from the index"""
+    def unindex(cls, id, es=None, indexes=None):
+        """Removes a document from the index
+
+        :arg indexes: the indexes to remove it from. Defaults to the
+            write indexes.
+
+        """
         if not settings.ES_LIVE_INDEXING:
             return
 
@@ -220,14 +193,16 @@ class SearchMixin(object):
             # ES_INDEXING_TIMEOUT.
             es = es_utils.get_indexing_es()
 
-        try:
-            # TODO: There is a race condition here if this gets called
-            # during reindexing.
-            es.delete(es_utils.WRITE_INDEX, es_utils.SUMO_DOCTYPE, id)
-        except pyes.exceptions.NotFoundException:
-            # Ignore the case where we try to delete something that's
-            # not there.
-            pass
+        if indexes is None:
+            indexes = es_utils.get_write_indexes()
+
+        for index in indexes:
+            try:
+                es.delete(index, es_utils.SUMO_DOCTYPE, id)
+            except pyes.exceptions.NotFoundException:
+                # Ignore the case where we try to delete something
+                # that's not there.
+                pass
 
 
 _identity = lambda s: s
@@ -309,8 +284,24 @@ def generate_tasks(**kwargs):
     so if four tasks get tossed into the set that are identical, we
     execute it only once.
 
+    If ``settings.ES_INDEX_QUEUE`` is on, the objects go into the
+    coalescing indexing queue instead and
+    :py:func:`search.tasks.process_index_queue` indexes them in bulk.
+    If redis is down, we fall back to filing the tasks.
+
     """
     tasks = _local_tasks()
+    if tasks and settings.ES_INDEX_QUEUE:
+        try:
+            queue_for_indexing((cls, obj_id)
+                               for fun, (cls, ids) in tasks
+                               for obj_id in ids)
+            tasks.clear()
+            return
+        except (RedisError, ConnectionError), e:
+            statsd.incr('redis.errror')
+            log.error('Redis error: %s' % e)
+
     for fun, args in tasks:
         fun(*args)
 
@@ -321,9 +312,30 @@ signals.request_finished.connect(generate_tasks)
 
 
 class Record(ModelBase):
-    """Record for the reindexing log"""
+    """Record for the reindexing log
+
+    A reindexing run gets one record named after the index it's
+    indexing into plus one record per chunk it indexed. They all share
+    the run's ``batch_id``.
+
+    """
+    STATUS_NEW = 0
+    STATUS_IN_PROGRESS = 1
+    STATUS_FAIL = 2
+    STATUS_SUCCESS = 3
+
+    STATUS_CHOICES = (
+        (STATUS_NEW, 'new'),
+        (STATUS_IN_PROGRESS, 'in progress'),
+        (STATUS_FAIL, 'done - fail'),
+        (STATUS_SUCCESS, 'done - success'),
+        )
+
+    batch_id = models.CharField(max_length=10, default='', db_index=True)
+    name = models.CharField(max_length=255, default='', db_index=True)
     starttime = models.DateTimeField(null=True)
     endtime = models.DateTimeField(null=True)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=STATUS_NEW)
     text = models.CharField(max_length=255)
 
     class Meta:
@@ -336,3 +348,16 @@ class Record(ModelBase):
         if self.starttime and self.endtime:
             return self.endtime - self.starttime
         return None
+
+    def mark_fail(self, msg):
+        """Marks as failed and appends msg to the text"""
+        self.endtime = datetime.datetime.now()
+        self.status = self.STATUS_FAIL
+        self.text = (u'%s: %s' % (self.text, msg))[:255]
+        self.save()
+
+    def mark_success(self):
+        """Marks as successfully done"""
+        self.endtime = datetime.datetime.now()
+        self.status = self.STATUS_SUCCESS
+        self.save()
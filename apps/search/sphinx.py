@@ -0,0 +1,68 @@
+"""Sphinx compatibility adapter
+
+Searching goes through ElasticSearch only. This module keeps the
+Sphinx searchers around for the Sphinx management commands and tests
+while the Sphinx indexes are still being built. Nothing that handles
+requests imports it, so oedipus doesn't get imported unless it's used.
+
+"""
+import os
+
+from django.conf import settings
+
+import oedipus
+
+
+ExcerptTimeoutError = oedipus.ExcerptTimeoutError
+ExcerptSocketError = oedipus.ExcerptSocketError
+SearchError = oedipus.SearchError
+
+
+class SphinxSearcher(oedipus.S):
+    @property
+    def port(self):
+        """Twiddle Sphinx port at runtime based on var set in SphinxTestCase"""
+        return (settings.TEST_SPHINX_PORT
+                if os.environ.get('DJANGO_ENVIRONMENT') == 'test'
+                else settings.SPHINX_PORT)
+
+
+def wiki_searcher():
+    """Return a Sphinx wiki document searcher with default parameters."""
+    from wiki.models import Document
+
+    return (SphinxSearcher(Document)
+            .query_fields('title__text',
+                          'content__text',
+                          'summary__text',
+                          'keywords__text')
+            .weight(title=6, content=1, keywords=4, summary=2))
+
+
+def question_searcher():
+    """Return a Sphinx question searcher with default parameters."""
+    from questions.models import Question
+
+    return (SphinxSearcher(Question)
+                .query_fields('title__text',
+                              'question_content__text',
+                              'answer_content__text')
+                .weight(title=4, question_content=3, answer_content=3)
+                .group_by('question_id', '-@group')
+                .highlight(before_match='<b>',
+                           after_match='</b>',
+                           limit=settings.SEARCH_SUMMARY_LENGTH))
+
+
+def discussion_searcher():
+    """Return a Sphinx forum searcher with default parameters."""
+    from forums.models import Post
+
+    # The index is on Post but with the Thread.title for the Thread
+    # related to the Post. We base the S off Post because we need to
+    # excerpt content.
+    return (SphinxSearcher(Post).weight(title=2, content=1)
+                                .group_by('thread_id', '-@group')
+                                .query_fields('title__text',
+                                              'content__text')
+                                .order_by('created'))
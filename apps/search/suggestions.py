@@ -0,0 +1,242 @@
+"""Search-as-you-type suggestions
+
+Suggestions come from a prefix index of KB document titles and solved
+question titles that lives in the "default" redis backend, so
+answering them doesn't touch ES or the database.
+
+For every title, we index each prefix (up to
+``settings.SEARCH_SUGGEST_PREFIX_LENGTH`` characters) of the title
+starting at each of its words, so "firefox cra" finds both "Firefox
+crashes" and "How to fix Firefox crashes". Each prefix is a sorted set
+keyed on kind, locale and prefix holding ``[title, slug or id]`` JSON
+members scored by popularity. Questions aren't localized, so they're
+all filed under the locale ``''``.
+
+The ``update_suggestions`` cron job keeps the index up to date.
+
+"""
+from datetime import datetime
+import json
+import re
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+from sumo.redis_utils import redis_client
+from sumo.urlresolvers import reverse
+
+
+SUGGEST_KEY = 'sumo:search:suggest'
+# Hash per kind of id -> JSON [locale, title, slug or id, score] for
+# everything in the index. Updating diffs against it.
+ENTRIES_KEY = SUGGEST_KEY + ':entries:%s'
+# Set of the ids of questions in the index with a score above 0. Their
+# weekly votes decay without the question being updated, so every
+# update rescores them.
+VOTED_KEY = SUGGEST_KEY + ':voted'
+# Time of the last update. Questions changed since then get updated.
+UPDATED_KEY = SUGGEST_KEY + ':updated'
+# Sorted set of the entries of a kind and locale with a given prefix.
+PREFIX_KEY = SUGGEST_KEY + ':%s:%s:%s'
+
+# How many entries to update per round trip to redis.
+BATCH_SIZE = 100
+
+_non_word = re.compile(r'[^\w\s]', re.U)
+
+
+def normalize(text):
+    """Lowercases text, drops punctuation and collapses whitespace"""
+    return u' '.join(_non_word.sub(u' ', text.lower()).split())
+
+
+def get_prefixes(title):
+    """Returns the set of prefixes title gets indexed under"""
+    words = normalize(title).split()
+    prefixes = set()
+    for i in range(len(words)):
+        rest = u' '.join(words[i:])[:settings.SEARCH_SUGGEST_PREFIX_LENGTH]
+        prefixes.update(rest[:j] for j in range(1, len(rest) + 1)
+                        if not rest[:j].endswith(u' '))
+    return prefixes
+
+
+def _wiki_entries():
+    """Yields (id, entry) for every KB document that should be suggested"""
+    from dashboards import LAST_30_DAYS
+    from dashboards.models import WikiDocumentVisits
+    from wiki.config import REDIRECT_HTML
+    from wiki.models import Document
+
+    visits = dict(WikiDocumentVisits.uncached
+                  .filter(period=LAST_30_DAYS)
+                  .values_list('document', 'visits'))
+    docs = (Document.uncached
+            .filter(is_archived=False, is_template=False,
+                    current_revision__isnull=False)
+            .exclude(html__startswith=REDIRECT_HTML)
+            .values_list('id', 'locale', 'title', 'slug'))
+    for id_, locale, title, slug in docs:
+        yield unicode(id_), [locale, title, slug, visits.get(id_, 0)]
+
+
+def _question_entries(since=None, ids=()):
+    """Yields (id, entry or None) for questions
+
+    :arg since: if given, only questions updated since then, the ones
+        in ``ids`` and the ones with votes this week, with an entry of
+        None for the ones that shouldn't be suggested (any more).
+        Otherwise, all the solved ones.
+    :arg ids: ids of questions to include when ``since`` is given
+
+    """
+    from questions.models import Question
+
+    questions = Question.uncached.all()
+    if since is None:
+        questions = questions.filter(solution__isnull=False)
+    else:
+        wanted = Q(updated__gte=since) | Q(num_votes_past_week__gt=0)
+        if ids:
+            wanted |= Q(id__in=list(ids))
+        questions = questions.filter(wanted)
+    questions = questions.values_list('id', 'title', 'solution',
+                                      'num_votes_past_week')
+    for id_, title, solution_id, votes in questions:
+        if solution_id is None:
+            yield unicode(id_), None
+        else:
+            yield unicode(id_), [u'', title, id_, votes]
+
+
+def _member(entry):
+    locale, title, ref, score = entry
+    return json.dumps([title, ref])
+
+
+def _get_entries(redis, kind, ids=None):
+    """Returns a dict of id -> entry of kind in the index
+
+    :arg ids: the ids to get. Defaults to all of them.
+
+    """
+    if ids is None:
+        return dict((id_, json.loads(value)) for id_, value
+                    in redis.hgetall(ENTRIES_KEY % kind).iteritems())
+    ids = list(ids)
+    if not ids:
+        return {}
+    return dict((id_, json.loads(value)) for id_, value
+                in zip(ids, redis.hmget(ENTRIES_KEY % kind, ids))
+                if value is not None)
+
+
+def update_suggestions(full=False):
+    """Brings the suggestions index up to date
+
+    KB documents get diffed against the index every time. Questions
+    only get looked at if they've been updated since the last update
+    or have votes in the index or this week, unless ``full`` is True or
+    there hasn't been an update yet.
+
+    :returns: number of entries added, changed or removed
+
+    Raises ``RedisError`` or ``redis.ConnectionError`` if redis isn't
+    available.
+
+    """
+    redis = redis_client('default')
+    started = time.time()
+    since = None if full else redis.get(UPDATED_KEY)
+
+    wiki_wanted = dict(_wiki_entries())
+    wiki_current = _get_entries(redis, 'wiki')
+    if since is None:
+        question_wanted = dict(_question_entries())
+        question_current = _get_entries(redis, 'question')
+    else:
+        voted = redis.smembers(VOTED_KEY)
+        question_wanted = dict(_question_entries(
+            datetime.fromtimestamp(float(since)), voted))
+        question_current = _get_entries(redis, 'question',
+                                        set(question_wanted) | voted)
+
+    changed = 0
+    pipe = redis.pipeline(transaction=False)
+    for kind, current, wanted in (
+            ('wiki', wiki_current, wiki_wanted),
+            ('question', question_current, question_wanted)):
+        for id_ in set(current) | set(wanted):
+            old, new = current.get(id_), wanted.get(id_)
+            if old == new:
+                continue
+
+            if old is not None:
+                for prefix in get_prefixes(old[1]):
+                    pipe.zrem(PREFIX_KEY % (kind, old[0], prefix),
+                              _member(old))
+            if new is not None:
+                for prefix in get_prefixes(new[1]):
+                    pipe.zadd(PREFIX_KEY % (kind, new[0], prefix),
+                              _member(new), new[3])
+                pipe.hset(ENTRIES_KEY % kind, id_, json.dumps(new))
+            else:
+                pipe.hdel(ENTRIES_KEY % kind, id_)
+            if kind == 'question':
+                if new is not None and new[3] > 0:
+                    pipe.sadd(VOTED_KEY, id_)
+                else:
+                    pipe.srem(VOTED_KEY, id_)
+
+            changed += 1
+            if changed % BATCH_SIZE == 0:
+                pipe.execute()
+
+    pipe.set(UPDATED_KEY, started)
+    pipe.execute()
+    return changed
+
+
+def get_suggestions(locale, term, limit=5):
+    """Returns up to limit (title, url) suggestions per kind for term
+
+    KB documents in locale come first, then questions.
+
+    Raises ``RedisError`` or ``redis.ConnectionError`` if redis isn't
+    available.
+
+    """
+    term = normalize(term)
+    if not term:
+        return []
+
+    prefix = term[:settings.SEARCH_SUGGEST_PREFIX_LENGTH].rstrip()
+    # Terms longer than the indexed prefixes need filtering, so get
+    # more to filter.
+    fetch = limit if prefix == term else limit * 10
+
+    pipe = redis_client('default').pipeline(transaction=False)
+    pipe.zrevrange(PREFIX_KEY % ('wiki', locale, prefix), 0, fetch - 1)
+    pipe.zrevrange(PREFIX_KEY % ('question', '', prefix), 0, fetch - 1)
+    wiki_members, question_members = pipe.execute()
+
+    results = []
+    for kind, members in (('wiki', wiki_members),
+                          ('question', question_members)):
+        found = 0
+        for member in members:
+            if found == limit:
+                break
+            title, ref = json.loads(member)
+            if prefix != term and (u' ' + term) not in (
+                    u' ' + normalize(title)):
+                continue
+            if kind == 'wiki':
+                url = reverse('wiki.document', locale=locale, args=[ref])
+            else:
+                url = reverse('questions.answers',
+                              kwargs={'question_id': ref})
+            results.append((title, url))
+            found += 1
+    return results
@@ -1,14 +1,18 @@
-import datetime
 import logging
-import sys
+import uuid
 from time import time
 
 from django.conf import settings
 from django.core.cache import cache
 
 from celery.decorators import task
+from redis.exceptions import ResponseError
+from statsd import statsd
 
+from search import es_utils
 from search.es_utils import es_reindex_with_progress
+from sumo.redis_utils import redis_client
+from sumo.utils import chunked
 
 
 # This is present in memcached when reindexing is in progress and
@@ -16,20 +20,23 @@ from search.es_utils import es_reindex_with_progress
 # (even if it crashes), the token is removed.
 ES_REINDEX_PROGRESS = 'sumo:search:es_reindex_progress'
 
+# Redis set of "<db_table>:<id>" members waiting to be (un)indexed and
+# a hash of the same members to the time they were first queued.
+ES_INDEX_QUEUE = 'sumo:search:index_queue'
+ES_INDEX_QUEUE_TIMES = ES_INDEX_QUEUE + ':times'
+
 log = logging.getLogger('k.task')
 
 
 @task
-def reindex_with_progress(write_index):
+def reindex_with_progress(write_index, workers=1, resume=False):
     """Rebuild elasticsearch index while updating progress bar for admins.
-    """
-    # Need to import Record here to prevent circular import
-    from search.models import Record
 
-    rec = Record(
-        starttime=datetime.datetime.now(),
-        text=u'Reindexing into %s' % write_index)
-    rec.save()
+    The reindexing run and its chunks are logged in the Record table.
+    See :py:func:`search.es_utils.es_reindex_with_progress` for
+    argument details.
+
+    """
     try:
         # Init progress bar stuff:
         cache.set(ES_REINDEX_PROGRESS, 0.001)  # An iota so it tests
@@ -37,7 +44,8 @@ def reindex_with_progress(write_index):
 
         # Reindex:
         start = time()
-        for ratio in es_reindex_with_progress():
+        for ratio in es_reindex_with_progress(workers=workers,
+                                              resume=resume):
             now = time()
             if now > start + settings.ES_REINDEX_PROGRESS_BAR_INTERVAL:
                 # Update memcached only every so often.
@@ -46,16 +54,6 @@ def reindex_with_progress(write_index):
                 # which seems to be understood by JS but makes me
                 # nervous:
                 cache.set(ES_REINDEX_PROGRESS, '%.5f' % ratio)
-
-        rec.endtime = datetime.datetime.now()
-        rec.save()
-    except Exception:
-
-        rec.text = (u'%s: Errored out %s %s' % (
-                rec.text, sys.exc_type, sys.exc_value))
-        rec.endtime = datetime.datetime.now()
-        rec.save()
-        raise
     finally:
         cache.delete(ES_REINDEX_PROGRESS)
 
@@ -78,8 +76,10 @@ MAX_RETRIES = len(RETRY_TIMES)
 def index_task(cls, ids, **kw):
     """Index documents specified by cls and ids"""
     try:
-        for id in cls.uncached.filter(id__in=ids).values_list('id', flat=True):
-            cls.index(cls.extract_document(id), refresh=True)
+        ids = cls.uncached.filter(id__in=ids).values_list('id', flat=True)
+        for document in cls.extract_documents(list(ids)):
+            cls.index(document, refresh=True)
+        es_utils.bump_generation()
     except Exception, exc:
         retries = index_task.request.retries
         index_task.retry(exc=exc, max_retries=MAX_RETRIES - 1,
@@ -92,7 +92,127 @@ def unindex_task(cls, ids, **kw):
     try:
         for id in ids:
             cls.unindex(id)
+        es_utils.bump_generation()
     except Exception, exc:
         retries = unindex_task.request.retries
         unindex_task.retry(exc=exc, max_retries=MAX_RETRIES - 1,
                            countdown=RETRY_TIMES[retries])
+
+
+def queue_for_indexing(items):
+    """Adds objects to the live indexing queue
+
+    Queuing the same object again before the queue gets processed is a
+    no-op, so busy objects get indexed once per run of
+    :py:func:`process_index_queue` instead of once per save.
+
+    :arg items: iterable of ``(model class, id)`` pairs
+
+    Raises ``RedisError`` or ``redis.ConnectionError`` if redis isn't
+    available.
+
+    """
+    redis = redis_client('default')
+    now = time()
+    pipe = redis.pipeline()
+    for cls, obj_id in items:
+        member = '%s:%s' % (cls._meta.db_table, obj_id)
+        pipe.sadd(ES_INDEX_QUEUE, member)
+        pipe.hsetnx(ES_INDEX_QUEUE_TIMES, member, now)
+    pipe.execute()
+
+
+def _index_queued(members, times):
+    """Indexes queued members in bulk and refreshes once at the end
+
+    Objects that exist get (re)indexed and the rest get unindexed, so
+    an object that was saved and then deleted only gets unindexed.
+
+    """
+    from search.models import get_search_models
+
+    models = dict((cls._meta.db_table, cls) for cls in get_search_models())
+    ids = {}
+    for member in members:
+        table, _, obj_id = member.rpartition(':')
+        if table in models:
+            ids.setdefault(table, []).append(int(obj_id))
+
+    es = es_utils.get_indexing_es()
+    indexes = es_utils.get_write_indexes()
+    now = time()
+    for table, id_list in ids.items():
+        cls = models[table]
+        id_list.sort()
+        for chunk in chunked(id_list, settings.ES_INDEX_QUEUE_BATCH_SIZE):
+            existing = list(cls.uncached.filter(id__in=chunk)
+                                        .order_by('id')
+                                        .values_list('id', flat=True))
+            if existing:
+                es_utils.index_chunk(cls, existing, es=es, indexes=indexes)
+            for obj_id in set(chunk) - set(existing):
+                cls.unindex(obj_id, es=es, indexes=indexes)
+
+        queued = min(float(times.get('%s:%s' % (table, obj_id), now))
+                     for obj_id in id_list)
+        statsd.timing('search.index_queue.lag.%s' % table,
+                      int((now - queued) * 1000))
+        statsd.incr('search.index_queue.indexed.%s' % table, len(id_list))
+
+    if ids and indexes:
+        es.refresh(indexes, timesleep=0)
+        es_utils.bump_generation()
+
+
+@task
+def process_index_queue():
+    """Drains the live indexing queue
+
+    Whatever is queued when this starts gets indexed in batches of
+    ``settings.ES_INDEX_QUEUE_BATCH_SIZE`` with a single refresh at the
+    end. If that fails, the items are put back for the next run.
+
+    """
+    if not settings.ES_LIVE_INDEXING:
+        return
+
+    redis = redis_client('default')
+
+    # Move the queue out of the way so saves that happen while we're
+    # indexing go into a fresh one.
+    processing = '%s:%s' % (ES_INDEX_QUEUE, uuid.uuid4().hex)
+    processing_times = processing + ':times'
+    # The renames go one at a time: in a MULTI, the one that found its
+    # key would still happen if the other one failed.
+    moved = False
+    for key, processing_key in ((ES_INDEX_QUEUE, processing),
+                                (ES_INDEX_QUEUE_TIMES, processing_times)):
+        try:
+            redis.rename(key, processing_key)
+            moved = True
+        except ResponseError:
+            # There's no such key.
+            pass
+    if not moved:
+        # Nothing is queued.
+        return
+
+    members, times = set(), {}
+    try:
+        members = redis.smembers(processing)
+        times = redis.hgetall(processing_times)
+        start = time()
+        _index_queued(members, times)
+        statsd.timing('search.index_queue.run',
+                      int((time() - start) * 1000))
+    except Exception:
+        log.exception('Error indexing %d queued objects, requeuing them.',
+                      len(members))
+        pipe = redis.pipeline()
+        pipe.sunionstore(ES_INDEX_QUEUE, [ES_INDEX_QUEUE, processing])
+        for member, queued in times.items():
+            pipe.hsetnx(ES_INDEX_QUEUE_TIMES, member, queued)
+        pipe.execute()
+        raise
+    finally:
+        redis.delete(processing, processing_times)
@@ -1,6 +1,13 @@
+from django.conf import settings
+
+import mock
+from nose import SkipTest
 from nose.tools import eq_
 
-from search.utils import crc32, ComposedList
+from search.utils import (crc32, ComposedList, SearchTimer,
+                          SLOW_SEARCHES_KEY, get_slow_searches,
+                          log_slow_search)
+from sumo.redis_utils import redis_client, RedisError
 from sumo.tests import TestCase
 
 
@@ -88,3 +95,52 @@ class TestComposedList(TestCase):
         eq_(cl[4:7], [('test1', (4, 5)),
                       ('test2', (0, 1)),
                       ('test3', (0, 1))])
+
+
+class TestSearchTimer(TestCase):
+    @mock.patch('search.utils.time')
+    @mock.patch('search.utils.statsd')
+    def test_phases(self, statsd, time):
+        time.time.side_effect = [100.0, 100.25, 100.75, 100.875]
+        timer = SearchTimer('elastic')
+        timer.mark('form')
+        timer.mark_es(450)
+        timer.mark('render')
+
+        eq_(timer.phases, [('form', 250), ('es', 500), ('render', 125)])
+        eq_(timer.es_calls, [(500, 450)])
+        eq_(timer.total, 875)
+        statsd.timing.assert_any_call('search.elastic.es.took', 450)
+        statsd.timing.assert_any_call('search.elastic.es.overhead', 50)
+
+
+class TestSlowSearches(TestCase):
+    def setUp(self):
+        super(TestSlowSearches, self).setUp()
+        try:
+            self.redis = redis_client('default')
+            self.redis.delete(SLOW_SEARCHES_KEY)
+        except RedisError:
+            raise SkipTest
+
+    def tearDown(self):
+        self.redis.delete(SLOW_SEARCHES_KEY)
+        super(TestSlowSearches, self).tearDown()
+
+    @mock.patch.object(settings._wrapped, 'SEARCH_SLOW_MS', 100)
+    def test_only_slow_searches_logged(self):
+        s = mock.Mock()
+        s._build_query.return_value = {'query': {'match_all': {}}}
+
+        timer = mock.Mock(engine='elastic', start=0, total=99,
+                          phases=[('es', 99)], es_calls=[(99, 90)])
+        log_slow_search(timer, u'crash', u'en-US', [s])
+        eq_(get_slow_searches(), [])
+
+        timer.total = 100
+        log_slow_search(timer, u'crash', u'en-US', [s])
+        slow = get_slow_searches()
+        eq_(len(slow), 1)
+        eq_(slow[0]['query'], u'crash')
+        eq_(slow[0]['es_calls'], [[99, 90]])
+        eq_(slow[0]['bodies'], [{'query': {'match_all': {}}}])
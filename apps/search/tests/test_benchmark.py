@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+from nose.tools import eq_, raises
+
+from search.benchmark import (RecordedES, overlap, percentile,
+                              read_query_log)
+from search.es_utils import ESException
+from sumo.tests import TestCase
+
+
+class BenchmarkTests(TestCase):
+    def test_read_query_log(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, '# comment\n\nfirefox crash\n'
+                     '?q=pagap%C3%B3&w=2&a=1\n')
+        os.close(fd)
+        try:
+            eq_(read_query_log(path),
+                [{'q': u'firefox crash', 'q_tags': 'desktop',
+                  'product': 'desktop'},
+                 {'q': u'pagap\xf3', 'w': u'2', 'a': u'1'}])
+        finally:
+            os.remove(path)
+
+    def test_percentile(self):
+        values = range(1, 101)
+        eq_(percentile(values, 50), 51)
+        eq_(percentile(values, 99), 99)
+        eq_(percentile([], 50), 0)
+
+    def test_overlap(self):
+        eq_(overlap(['a', 'b'], ['b', 'a']), 1.0)
+        eq_(overlap(['a', 'b', 'c', 'd'], ['a', 'b']), 0.5)
+        eq_(overlap([], []), 1.0)
+
+    def test_record_and_replay(self):
+        class FakeES(object):
+            encoder = None
+
+            def _send_request(self, method, path, body=None, params={}):
+                return {'responses': [{'took': 3}]}
+
+        recorder = RecordedES(es=FakeES())
+        response = recorder._send_request('GET', '_msearch', 'body\n')
+
+        replayer = RecordedES(responses=recorder.responses)
+        eq_(replayer._send_request('GET', '_msearch', 'body\n'), response)
+
+    @raises(ESException)
+    def test_replay_unknown(self):
+        RecordedES(responses={})._send_request('GET', '_msearch', 'body\n')
@@ -3,19 +3,28 @@ import datetime
 
 import mock
 from django.conf import settings
+from django.core.cache import cache
+from django.http import QueryDict
+from django.utils.http import urlquote
 from elasticutils import get_es
 from nose import SkipTest
 from nose.tools import eq_
+from pyquery import PyQuery as pq
 from test_utils import TestCase
 
-from forums.tests import thread, post
+from forums.tests import forum, thread, post
 from questions.tests import question, answer, answervote
 from questions.models import Question
-from search.models import generate_tasks
+from search.forms import SearchForm
+from search.models import Record, generate_tasks
 from search import es_utils
+from search.tasks import (ES_INDEX_QUEUE, ES_INDEX_QUEUE_TIMES,
+                          process_index_queue)
+from search.views import _search_cache_key
+from sumo.redis_utils import redis_client, RedisError
 from sumo.tests import LocalizingClient
 from sumo.urlresolvers import reverse
-from waffle.models import Flag
+from users.tests import user
 from wiki.tests import document, revision
 
 
@@ -44,7 +53,7 @@ class ElasticTestCase(TestCase):
         cls._old_read_index = es_utils.READ_INDEX
         cls._old_write_index = es_utils.WRITE_INDEX
         es_utils.READ_INDEX = u'sumo_test'
-        es_utils.WRITE_INDEX = u'sumo_test'
+        es_utils.WRITE_INDEX = u'sumo_test_write'
 
     @classmethod
     def tearDownClass(cls):
@@ -58,7 +67,6 @@ class ElasticTestCase(TestCase):
             raise SkipTest
 
         super(ElasticTestCase, self).setUp()
-        Flag.objects.create(name='elasticsearch', everyone=True)
         self.setup_indexes()
 
     def tearDown(self):
@@ -98,7 +106,10 @@ class ElasticTestCase(TestCase):
 
     def teardown_indexes(self):
         es = get_es()
+        for index in es_utils.get_built_indexes():
+            es.delete_index_if_exists(index)
         es.delete_index_if_exists(es_utils.READ_INDEX)
+        cache.delete(es_utils.ES_WRITE_INDEXES_KEY % es_utils.WRITE_INDEX)
 
         settings.ES_LIVE_INDEXING = False
 
@@ -139,6 +150,75 @@ class ElasticSearchTasksTests(ElasticTestCase):
         eq_(index_fun.call_count, 1)
 
 
+class ElasticSearchIndexQueueTests(ElasticTestCase):
+    def setUp(self):
+        super(ElasticSearchIndexQueueTests, self).setUp()
+        try:
+            self.redis = redis_client('default')
+            self.redis.delete(ES_INDEX_QUEUE, ES_INDEX_QUEUE_TIMES)
+        except RedisError:
+            raise SkipTest
+
+    def tearDown(self):
+        self.redis.delete(ES_INDEX_QUEUE, ES_INDEX_QUEUE_TIMES)
+        super(ElasticSearchIndexQueueTests, self).tearDown()
+
+    @mock.patch.object(settings._wrapped, 'ES_INDEX_QUEUE', True)
+    def test_queue_coalesces(self):
+        """Saves go into the queue and get indexed once per drain."""
+        q = question(save=True)
+        generate_tasks()
+        q.save()
+        generate_tasks()
+        assert ('questions_question:%s' % q.id in
+                self.redis.smembers(ES_INDEX_QUEUE))
+
+        with mock.patch.object(es_utils, 'index_chunk') as index_chunk:
+            process_index_queue()
+            calls = [args for args, kwargs in index_chunk.call_args_list
+                     if args[0] is Question]
+            eq_(calls, [(Question, [q.id])])
+        eq_(self.redis.scard(ES_INDEX_QUEUE), 0)
+
+    @mock.patch.object(settings._wrapped, 'ES_INDEX_QUEUE', True)
+    def test_queue_without_times(self):
+        """A queue without its times hash still gets drained."""
+        q = question(save=True)
+        generate_tasks()
+        self.redis.delete(ES_INDEX_QUEUE_TIMES)
+
+        with mock.patch.object(es_utils, 'index_chunk') as index_chunk:
+            process_index_queue()
+            calls = [args for args, kwargs in index_chunk.call_args_list
+                     if args[0] is Question]
+            eq_(calls, [(Question, [q.id])])
+        eq_(self.redis.keys(ES_INDEX_QUEUE + '*'), [])
+
+    @mock.patch.object(settings._wrapped, 'ES_INDEX_QUEUE', True)
+    def test_times_without_queue(self):
+        """Times left without a queue get cleared out."""
+        self.redis.hset(ES_INDEX_QUEUE_TIMES, 'questions_question:1', 1)
+
+        with mock.patch.object(es_utils, 'index_chunk') as index_chunk:
+            process_index_queue()
+            eq_(index_chunk.call_count, 0)
+        eq_(self.redis.keys(ES_INDEX_QUEUE + '*'), [])
+
+    @mock.patch.object(settings._wrapped, 'ES_INDEX_QUEUE', True)
+    def test_queue_indexes_and_unindexes(self):
+        q = question(save=True)
+        generate_tasks()
+        process_index_queue()
+        eq_([int(d['id']) for d in es_utils.get_documents(Question, [q.id])],
+            [q.id])
+
+        q_id = q.id
+        q.delete()
+        generate_tasks()
+        process_index_queue()
+        eq_(list(es_utils.get_documents(Question, [q_id])), [])
+
+
 class ElasticSearchViewPagingTests(ElasticTestCase):
     client_class = LocalizingClient
 
@@ -177,6 +257,70 @@ class ElasticSearchViewPagingTests(ElasticTestCase):
                 if mem['type'] == 'document']
         eq_(len(docs), 10)
 
+    def test_front_page_search_deep_paging(self):
+        """Pages past the prefetch window take a second round trip."""
+        for i in range(5):
+            ques = question(title=u'audio', content=u'audio bad.', save=True)
+            ques.tags.add(u'desktop')
+            ans = answer(question=ques, save=True)
+            answervote(answer=ans, helpful=True, save=True)
+
+        self.refresh()
+
+        data = {'q_tags': 'desktop', 'product': 'desktop', 'q': 'audio',
+                'format': 'json'}
+        response = self.client.get(reverse('search'), data)
+        prefetched = json.loads(response.content)
+
+        with mock.patch.object(settings._wrapped, 'SEARCH_PREFETCH_WINDOW', 0):
+            with mock.patch.object(settings._wrapped,
+                                   'SEARCH_RESULTS_CACHE_TIMEOUT', 0):
+                response = self.client.get(reverse('search'), data)
+        eq_(200, response.status_code)
+        content = json.loads(response.content)
+
+        eq_(content['total'], 5)
+        eq_([r['url'] for r in content['results']],
+            [r['url'] for r in prefetched['results']])
+
+
+class ElasticSearchViewCacheTests(ElasticTestCase):
+    client_class = LocalizingClient
+
+    def test_results_cached_until_indexing(self):
+        ques = question(title=u'audio', content=u'audio bad.', save=True)
+        ques.tags.add(u'desktop')
+        self.refresh()
+
+        data = {'a': '1', 'w': '2', 'q': 'audio', 'format': 'json'}
+        response = self.client.get(reverse('search'), data)
+        eq_(json.loads(response.content)['total'], 1)
+
+        # The same search, spelled a little differently, comes out of
+        # the cache.
+        with mock.patch('search.views.multi_search') as multi_search:
+            response = self.client.get(reverse('search'),
+                                       dict(data, q='  AUDIO '))
+            eq_(multi_search.call_count, 0)
+        eq_(json.loads(response.content)['total'], 1)
+
+        # Indexing invalidates it.
+        question(title=u'audio', content=u'audio bad.', save=True)
+        self.refresh()
+        response = self.client.get(reverse('search'), data)
+        eq_(json.loads(response.content)['total'], 2)
+
+    def test_cache_key_normalizes_only_query(self):
+        def key(**cleaned):
+            return _search_cache_key(cleaned, 'en-US', 1, 'elastic', 1, 0)
+
+        eq_(key(q=u'audio fails', asked_by=u'jsocol'),
+            key(q=u' Audio  FAILS ', asked_by=u'jsocol'))
+        assert (key(q=u'audio', asked_by=u'jsocol') !=
+                key(q=u'audio', asked_by=u'JSocol'))
+        assert (key(q=u'audio', author=u'jsocol ') !=
+                key(q=u'audio', author=u'jsocol'))
+
 
 class ElasticSearchViewTests(ElasticTestCase):
     client_class = LocalizingClient
@@ -408,6 +552,308 @@ class ElasticSearchViewTests(ElasticTestCase):
         eq_(content['total'], 0)
 
 
+class ElasticSearchViewFilterTests(ElasticTestCase):
+    """Tests for the search view's filters, cookie and metrics"""
+    client_class = LocalizingClient
+
+    def _search(self, locale='en-US', **params):
+        """Return the results of a JSON search."""
+        params['format'] = 'json'
+        response = self.client.get(reverse('search', locale=locale), params)
+        eq_(200, response.status_code)
+        return json.loads(response.content)
+
+    def _document(self, title, tags=(), **kwargs):
+        """Return a saved document with an approved revision."""
+        kwargs.setdefault('category', 10)
+        doc = document(title=title, save=True, **kwargs)
+        for tag in tags:
+            doc.tags.add(tag)
+        revision(document=doc, is_approved=True, save=True)
+        return doc
+
+    def _question(self, when, **kwargs):
+        """Return a saved question created and last updated when."""
+        return question(created=when, updated=when, save=True, **kwargs)
+
+    def _thread(self, when, **kwargs):
+        """Return a saved thread created when with one post made then."""
+        t = thread(created=when, save=True, **kwargs)
+        post(thread=t, content=u'Some post', created=when, save=True)
+        return t
+
+    def _assert_urls(self, objs, results):
+        """Assert the results are of objs, going by the ends of their URLs:
+        slugs for documents and ids for everything else."""
+        urls = [result['url'] for result in results]
+        eq_(len(objs), len(urls), urls)
+        for obj in objs:
+            end = u'/%s' % getattr(obj, 'slug', obj.id)
+            assert [url for url in urls if url.endswith(end)], (end, urls)
+
+    def test_search_metrics(self):
+        """Query strings are added to search results."""
+        self._document(u'audio')
+        self.refresh()
+
+        response = self.client.get(reverse('search'), {'q': 'audio', 'w': 3})
+        doc = pq(response.content)
+        _, _, qs = doc('a.title:first').attr('href').partition('?')
+        q = QueryDict(qs)
+        eq_('audio', q['s'])
+        eq_('s', q['as'])
+        eq_('0', q['r'])
+        eq_('es', q['e'])
+
+    def test_category_invalid(self):
+        """An invalid category searches the default categories."""
+        self._document(u'Default category')
+        self._document(u'Other category', category=30)
+        self.refresh()
+
+        eq_(1, self._search(a=1, w=3, category='invalid')['total'])
+
+    def test_num_voted_none(self):
+        response = self.client.get(reverse('search'), {
+            'q': '', 'w': 2, 'a': 1, 'num_voted': 2, 'num_votes': ''})
+        eq_(200, response.status_code)
+
+    def test_created(self):
+        """Basic functionality of created filter."""
+        old = self._question(datetime.datetime(2010, 6, 10))
+        new = self._question(datetime.datetime(2010, 6, 25))
+        self.refresh()
+
+        for created, obj in ((1, old), (2, new)):
+            results = self._search(a=1, w=2, sortby=2, created=created,
+                                   created_date='06/20/2010')['results']
+            self._assert_urls([obj], results)
+
+    def test_sortby_invalid(self):
+        """Invalid sortby is ignored."""
+        self._search(a=1, w=4, sortby='')
+
+    def test_created_invalid(self):
+        """Invalid created_date is ignored."""
+        self._question(datetime.datetime(2010, 6, 10))
+        self._question(datetime.datetime(2010, 6, 25))
+        self.refresh()
+
+        eq_(2, self._search(a=1, w=2, created=1,
+                            created_date='invalid')['total'])
+
+    def test_created_nonexistent(self):
+        """created is set while created_date is left out of the query."""
+        self._search(a=1, w=2, created=1)
+
+    def test_created_range_sanity(self):
+        """Dates far in the future or past match nothing."""
+        self._question(datetime.datetime(2010, 6, 10),
+                       title=u'How to contribute')
+        self.refresh()
+
+        for created, created_date in ((2, '05/28/2099'), (1, '05/28/1900'),
+                                      (1, '05/28/1920')):
+            eq_(0, self._search(a=1, w=2, q='contribute', created=created,
+                                created_date=created_date)['total'])
+
+    def test_updated(self):
+        """Basic functionality of updated filter."""
+        old = self._question(datetime.datetime(2010, 6, 10))
+        new = self._question(datetime.datetime(2010, 6, 25))
+        self.refresh()
+
+        for updated, obj in ((1, old), (2, new)):
+            results = self._search(a=1, w=2, sortby=1, updated=updated,
+                                   updated_date='06/20/2010')['results']
+            self._assert_urls([obj], results)
+
+    def test_updated_invalid(self):
+        """Invalid updated_date is ignored."""
+        self._question(datetime.datetime(2010, 6, 10))
+        self._question(datetime.datetime(2010, 6, 25))
+        self.refresh()
+
+        eq_(2, self._search(a=1, w=2, updated=1,
+                            updated_date='invalid')['total'])
+
+    def test_updated_nonexistent(self):
+        """updated is set while updated_date is left out of the query."""
+        self._search(a=1, w=2, updated=1)
+
+    def test_updated_range_sanity(self):
+        """Dates far in the future or past match nothing."""
+        self._question(datetime.datetime(2010, 6, 10),
+                       title=u'How to contribute')
+        self.refresh()
+
+        for updated, updated_date in ((2, '05/28/2099'), (1, '05/28/1900'),
+                                      (1, '05/28/1920')):
+            eq_(0, self._search(a=1, w=2, q='contribute', updated=updated,
+                                updated_date=updated_date)['total'])
+
+    def test_asked_by(self):
+        """Check several author values."""
+        when = datetime.datetime(2010, 6, 10)
+        asker = user(username='asker', save=True)
+        other = user(username='other', save=True)
+        self._question(when, creator=asker)
+        self._question(when, creator=asker)
+        self._question(when, creator=other)
+        self.refresh()
+
+        for author, total in (('doesnotexist', 0), ('asker', 2),
+                              ('other', 1)):
+            eq_(total, self._search(a=1, w=2, asked_by=author)['total'])
+
+    def test_tags(self):
+        """Search for tags, includes multiple."""
+        self._document(u'Extant', tags=['extant'])
+        self._document(u'Extant and tagged', tags=['extant', 'tagged'])
+        self.refresh()
+
+        for tags, total in (('doesnotexist', 0), ('extant', 2),
+                            ('tagged', 1), ('extant tagged', 1)):
+            eq_(total, self._search(a=1, w=1, tags=tags)['total'])
+
+    def test_tags_inherit(self):
+        """Translations inherit tags from their parents."""
+        parent = self._document(u'Extant', tags=['extant'])
+        self._document(u'Extante', locale='es', parent=parent)
+        self.refresh()
+
+        eq_(1, self._search(locale='es', a=1, w=1, tags='extant')['total'])
+
+    def test_products(self):
+        """Search for products."""
+        self._document(u'Desktop', tags=['desktop', 'sync'])
+        self._document(u'Mobile', tags=['mobile', 'sync'])
+        self.refresh()
+
+        for product, total in (('mobile', 1), ('desktop', 1), ('sync', 2),
+                               ('FxHome', 0)):
+            eq_(total, self._search(a=1, w=1, product=product)['total'])
+
+    def test_products_inherit(self):
+        """Translations inherit products from their parents."""
+        parent = self._document(u'Desktop', tags=['desktop'])
+        self._document(u'Bureau', locale='fr', parent=parent)
+        self.refresh()
+
+        eq_(1, self._search(locale='fr', a=1, w=1,
+                            product='desktop')['total'])
+
+    def test_meta_tags(self):
+        response = self.client.get(reverse('search'), {'q': 'contribute'})
+        eq_(3, len(pq(response.content)('meta')))
+
+    def test_discussion_filter_author(self):
+        """Filter by author in discussion forums."""
+        when = datetime.datetime(2010, 5, 3)
+        author = user(username='author', save=True)
+        other = user(username='other', save=True)
+        t1 = self._thread(when)
+        t2 = self._thread(when)
+        post(thread=t1, author=author, content=u'One', save=True)
+        post(thread=t2, author=author, content=u'Two', save=True)
+        post(thread=t2, author=other, content=u'Three', save=True)
+        self.refresh()
+
+        for name, total in (('doesnotexist', 0), ('author', 2),
+                            ('other', 1)):
+            eq_(total, self._search(a=1, w=4, author=name)['total'])
+
+    def test_discussion_filter_forum(self):
+        """Filter by forum in discussion forums."""
+        when = datetime.datetime(2010, 5, 3)
+        f1 = forum(save=True)
+        f2 = forum(save=True)
+        for f in (f1, f1, f2):
+            self._thread(when, forum=f)
+        self.refresh()
+
+        # The form gets its forum choices when it's imported.
+        choices = [(f.id, f.name) for f in (f1, f2)]
+        with mock.patch.object(SearchForm.base_fields['forum'], 'choices',
+                               choices):
+            for forum_id, total in ((f1.id, 2), (f2.id, 1)):
+                eq_(total, self._search(a=1, w=4, forum=forum_id)['total'])
+
+    def test_discussion_filter_sticky(self):
+        """Filter for sticky threads."""
+        when = datetime.datetime(2010, 5, 3)
+        sticky = self._thread(when, is_sticky=True)
+        self._thread(when)
+        self.refresh()
+
+        self._assert_urls([sticky],
+                          self._search(a=1, w=4, thread_type=1)['results'])
+
+    def test_discussion_filter_locked(self):
+        """Filter for locked threads."""
+        when = datetime.datetime(2010, 5, 3)
+        locked = self._thread(when, is_locked=True)
+        self._thread(when)
+        self.refresh()
+
+        self._assert_urls([locked],
+                          self._search(a=1, w=4, thread_type=2)['results'])
+
+    def test_discussion_filter_sticky_locked(self):
+        """Filter for locked and sticky threads."""
+        when = datetime.datetime(2010, 5, 3)
+        both = self._thread(when, is_sticky=True, is_locked=True)
+        self._thread(when, is_sticky=True)
+        self._thread(when, is_locked=True)
+        self.refresh()
+
+        self._assert_urls([both], self._search(a=1, w=4,
+                                               thread_type=[1, 2])['results'])
+
+    def test_discussion_filter_created(self):
+        """Filter for created date."""
+        old = self._thread(datetime.datetime(2010, 5, 1))
+        new = self._thread(datetime.datetime(2010, 5, 5))
+        self.refresh()
+
+        for created, obj in ((1, old), (2, new)):
+            results = self._search(a=1, w=4, sortby=2, created=created,
+                                   created_date='05/03/2010')['results']
+            self._assert_urls([obj], results)
+
+    def test_discussion_filter_updated(self):
+        """Filter for updated date."""
+        old = self._thread(datetime.datetime(2010, 5, 1))
+        new = self._thread(datetime.datetime(2010, 5, 1))
+        post(thread=new, content=u'Later', save=True,
+             created=datetime.datetime(2010, 5, 5))
+        self.refresh()
+
+        for updated, obj in ((1, old), (2, new)):
+            results = self._search(a=1, w=4, sortby=1, updated=updated,
+                                   updated_date='05/04/2010')['results']
+            self._assert_urls([obj], results)
+
+    def test_search_cookie(self):
+        """Set a cookie with the latest search term."""
+        data = {'q': u'pagap\xf3 banco'}
+        cookie = settings.LAST_SEARCH_COOKIE
+        response = self.client.get(reverse('search', locale='fr'), data)
+        assert cookie in response.cookies
+        eq_(urlquote(data['q']), response.cookies[cookie].value)
+
+    def test_archived(self):
+        """Archived articles show only when requested."""
+        archived = self._document(u'Impalas', is_archived=True)
+        self.refresh()
+
+        results = self._search(q='impalas', a=1, w=1,
+                               include_archived='on')['results']
+        self._assert_urls([archived], results)
+
+        eq_([], self._search(q='impalas', a=0, w=1)['results'])
+
+
 class ElasticSearchUtilsTests(ElasticTestCase):
     def test_get_documents(self):
         q = question(save=True)
@@ -415,3 +861,105 @@ class ElasticSearchUtilsTests(ElasticTestCase):
         docs = es_utils.get_documents(Question, [q.id])
         docs = [int(mem[u'id']) for mem in docs]
         eq_(docs, [q.id])
+
+    def test_multi_search(self):
+        q = question(title=u'audio', save=True)
+        q.tags.add(u'desktop')
+        doc = document(title=u'audio', locale=u'en-US', save=True)
+        revision(document=doc, is_approved=True, save=True)
+        self.refresh()
+
+        question_s = Question.search().values_dict('id')[:5]
+        count_s = Question.search()[:0]
+        question_s, count_s = es_utils.multi_search([question_s, count_s])
+
+        eq_([int(r['id']) for r in question_s], [q.id])
+        eq_(count_s.count(), 1)
+
+        # Primed searches don't go back to ES.
+        with mock.patch.object(es_utils.Sphilastic, '_build_query') as bq:
+            eq_(question_s.count(), 1)
+            eq_(bq.call_count, 0)
+
+    @mock.patch.object(settings._wrapped, 'ES_REINDEX_CHUNK_SIZE', 2)
+    def test_get_reindex_chunks(self):
+        qs = [question(save=True) for i in range(3)]
+        chunks = es_utils.get_reindex_chunks([Question])
+
+        eq_(sum([id_list for cls, name, id_list in chunks], []),
+            [q.id for q in qs])
+        for cls, name, id_list in chunks:
+            eq_(cls, Question)
+            # All ids in a chunk share an id range named in the chunk.
+            eq_(len(set(id_ // 2 for id_ in id_list)), 1)
+            eq_(name, u'questions_question %d-%d' % (
+                    id_list[0] // 2 * 2, id_list[0] // 2 * 2 + 1))
+
+    def test_reindex_flips_aliases(self):
+        """Reindexing builds a new index and swaps both aliases to it."""
+        q = question(save=True)
+        old = es_utils.get_aliased_indexes(es_utils.READ_INDEX)
+        eq_(es_utils.get_aliased_indexes(es_utils.WRITE_INDEX), old)
+
+        es_utils.es_reindex_cmd()
+        new = es_utils.get_aliased_indexes(es_utils.READ_INDEX)
+        assert new != old
+        eq_(es_utils.get_aliased_indexes(es_utils.WRITE_INDEX), new)
+        eq_(es_utils.get_write_indexes(), new)
+        eq_([int(d['id']) for d in es_utils.get_documents(Question, [q.id])],
+            [q.id])
+
+        # The previous index is kept around to roll back to.
+        es_utils.es_rollback_cmd()
+        eq_(es_utils.get_aliased_indexes(es_utils.READ_INDEX), old)
+        eq_(es_utils.get_write_indexes(), old)
+
+    def test_reindex_resume(self):
+        q = question(save=True)
+
+        # Pretend the last run into a new index died after finishing
+        # the chunk holding q.
+        index = es_utils.get_index_name()
+        es_utils.create_index(index)
+        chunks = es_utils.get_reindex_chunks([Question])
+        Record.objects.create(batch_id='abc', name=index,
+                              status=Record.STATUS_FAIL,
+                              starttime=datetime.datetime.now())
+        Record.objects.create(batch_id='abc', name=chunks[0][1],
+                              status=Record.STATUS_SUCCESS)
+        eq_(es_utils.get_resumable_batch(), ('abc', index))
+
+        with mock.patch.object(Question, 'extract_documents') as extract:
+            es_utils.es_reindex_cmd(resume=True)
+            eq_(extract.call_count, 0)
+
+        # The resumed run finished and went live, so there's nothing to
+        # resume now.
+        eq_(es_utils.get_aliased_indexes(es_utils.READ_INDEX), [index])
+        eq_(es_utils.get_resumable_batch(), (None, None))
+
+        # Without resume, everything is indexed again.
+        es_utils.es_reindex_cmd()
+        eq_([int(d['id']) for d in es_utils.get_documents(Question, [q.id])],
+            [q.id])
+
+    @mock.patch.object(settings._wrapped, 'ES_REINDEX_STALE_AFTER', 60)
+    def test_reindex_resume_running(self):
+        index = es_utils.get_index_name()
+        es_utils.create_index(index)
+        Record.objects.create(batch_id='abc', name=index,
+                              status=Record.STATUS_IN_PROGRESS,
+                              starttime=datetime.datetime.now() -
+                                        datetime.timedelta(hours=2))
+        chunk = Record.objects.create(batch_id='abc', name='questions 1',
+                                      status=Record.STATUS_IN_PROGRESS,
+                                      starttime=datetime.datetime.now())
+
+        # Another reindex is still working on it.
+        eq_(es_utils.get_resumable_batch(), (None, None))
+
+        # Nothing has happened in a while, so it crashed.
+        chunk.starttime = datetime.datetime.now() - datetime.timedelta(
+            minutes=2)
+        chunk.save()
+        eq_(es_utils.get_resumable_batch(), ('abc', index))
@@ -62,11 +62,11 @@ class JSONTest(ElasticTestCase):
             eq_(response['Content-Type'], 'application/json')
 
 
-class JSONTestNoSphinx(TestCase):
+class JSONTestNoES(TestCase):
     client_class = LocalizingClient
 
     def test_json_down(self):
-        """When the Sphinx is down, return JSON and 503 status"""
+        """When ES is down, return JSON and 503 status"""
         # Test with flags for advanced search or not
         callbacks = (
             ('', 503, 'application/json'),
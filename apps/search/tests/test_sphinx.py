@@ -1,37 +1,23 @@
 """
 Tests Sphinx-specific stuff
 """
-from functools import partial
 import os
 import shutil
 import time
-import json
 
 from django.conf import settings
-from django.contrib.sites.models import Site
-from django.http import QueryDict
-from django.utils.http import urlquote
 
 import jingo
-import mock
 from nose import SkipTest
 from nose.tools import eq_
-from pyquery import PyQuery as pq
 
-from forums.models import Thread, discussion_searcher
-from questions.models import question_searcher
+from forums.models import Thread
 import search as constants
-from search.tests import dummy_request
+from search.sphinx import (discussion_searcher, question_searcher,
+                           wiki_searcher)
 from search.utils import (start_sphinx, stop_sphinx, reindex,
                           clean_excerpt)
-from sumo.tests import LocalizingClient, TestCase
-from sumo.urlresolvers import reverse
-from wiki.models import wiki_searcher
-
-
-discussion_searcher = partial(discussion_searcher, dummy_request)
-wiki_searcher = partial(wiki_searcher, dummy_request)
-question_searcher = partial(question_searcher, dummy_request)
+from sumo.tests import TestCase
 
 
 def render(s, context):
@@ -97,34 +83,16 @@ class SphinxTestCase(TestCase):
 
 
 class SearchTest(SphinxTestCase):
-    client_class = LocalizingClient
-
     def test_indexer(self):
         results = wiki_searcher().query('audio')
         eq_(2, len(results))
 
-    def test_search_metrics(self):
-        """Ensure that query strings are added to search results"""
-        response = self.client.get(reverse('search'), {'q': 'audio', 'w': 3})
-        doc = pq(response.content)
-        _, _, qs = doc('a.title:first').attr('href').partition('?')
-        q = QueryDict(qs)
-        eq_('audio', q['s'])
-        eq_('s', q['as'])
-        eq_('0', q['r'])
-        eq_('sph', q['e'])
-
     def test_category(self):
         results = wiki_searcher().filter(category__in=[10])
         eq_(5, len(results))
         results = wiki_searcher().filter(category__in=[30])
         eq_(1, len(results))
 
-    def test_category_invalid(self):
-        qs = {'a': 1, 'w': 3, 'format': 'json', 'category': 'invalid'}
-        response = self.client.get(reverse('search'), qs)
-        eq_(6, json.loads(response.content)['total'])
-
     def test_no_filter(self):
         """Test searching with no filters."""
         # Note: We keep the query('') here to force a new S and thus
@@ -156,154 +124,6 @@ class SearchTest(SphinxTestCase):
             assert x > y, '%s !> %s' % (x, y)
             i += 1
 
-    def test_num_voted_none(self):
-        qs = {'q': '', 'w': 2, 'a': 1, 'num_voted': 2, 'num_votes': ''}
-        response = self.client.get(reverse('search'), qs)
-        eq_(200, response.status_code)
-
-    def test_created(self):
-        """Basic functionality of created filter."""
-
-        qs = {'a': 1, 'w': 2, 'format': 'json',
-              'sortby': 2, 'created_date': '06/20/2010'}
-        created_vals = (
-            (1, '/3'),
-            (2, '/1'),
-        )
-
-        for created, url_id in created_vals:
-            qs.update({'created': created})
-            response = self.client.get(reverse('search'), qs)
-            result = json.loads(response.content)['results'][-1]
-            url_end = result['url'].endswith(url_id)
-            assert url_end, ('Url was "%s", expected to end with "%s"' %
-                             (result['url'], url_id))
-
-    def test_sortby_invalid(self):
-        """Invalid created_date is ignored."""
-        qs = {'a': 1, 'w': 4, 'format': 'json', 'sortby': ''}
-        response = self.client.get(reverse('search'), qs)
-        eq_(200, response.status_code)
-
-    def test_created_invalid(self):
-        """Invalid created_date is ignored."""
-        qs = {'a': 1, 'w': 4, 'format': 'json',
-              'created': 1, 'created_date': 'invalid'}
-        response = self.client.get(reverse('search'), qs)
-        eq_(5, json.loads(response.content)['total'])
-
-    def test_created_nonexistent(self):
-        """created is set while created_date is left out of the query."""
-        qs = {'a': 1, 'w': 2, 'format': 'json', 'created': 1}
-        response = self.client.get(reverse('search'), qs)
-        eq_(200, response.status_code)
-
-    def test_created_range_sanity(self):
-        """Ensure that the created_date range is sane."""
-        qs = {'a': 1, 'w': '2', 'q': 'contribute', 'created': '2',
-              'format': 'json'}
-        date_vals = ('05/28/2099', '05/28/1900', '05/28/1920')
-        for date_ in date_vals:
-            qs.update({'created_date': date_})
-            response = self.client.get(reverse('search'), qs)
-            eq_(0, json.loads(response.content)['total'])
-
-    def test_updated(self):
-        """Basic functionality of updated filter."""
-        qs = {'a': 1, 'w': 2, 'format': 'json',
-              'sortby': 1, 'updated_date': '06/20/2010'}
-        updated_vals = (
-            (1, '/4'),
-            (2, '/2'),
-        )
-
-        for updated, url_id in updated_vals:
-            qs.update({'updated': updated})
-            response = self.client.get(reverse('search'), qs)
-            result = json.loads(response.content)['results'][0]
-            url_end = result['url'].endswith(url_id)
-            assert url_end, ('Url was "%s", expected to end with "%s"' %
-                             (result['url'], url_id))
-
-    def test_updated_invalid(self):
-        """Invalid updated_date is ignored."""
-        qs = {'a': 1, 'w': 2, 'format': 'json',
-              'updated': 1, 'updated_date': 'invalid'}
-        response = self.client.get(reverse('search'), qs)
-        eq_(4, json.loads(response.content)['total'])
-
-    def test_updated_nonexistent(self):
-        """updated is set while updated_date is left out of the query."""
-        qs = {'a': 1, 'w': 2, 'format': 'json', 'updated': 1}
-        response = self.client.get(reverse('search'), qs)
-        eq_(response.status_code, 200)
-
-    def test_updated_range_sanity(self):
-        """Ensure that the updated_date range is sane."""
-        qs = {'a': 1, 'w': '2', 'q': 'contribute', 'updated': '2',
-              'format': 'json'}
-        date_vals = ('05/28/2099', '05/28/1900', '05/28/1920')
-        for date_ in date_vals:
-            qs.update({'updated_date': date_})
-            response = self.client.get(reverse('search'), qs)
-            eq_(0, json.loads(response.content)['total'])
-
-    def test_asked_by(self):
-        """Check several author values, including test for (anon)"""
-        qs = {'a': 1, 'w': 2, 'format': 'json'}
-        author_vals = (
-            ('DoesNotExist', 0),
-            ('jsocol', 2),
-            ('pcraciunoiu', 2),
-        )
-
-        for author, total in author_vals:
-            qs.update({'asked_by': author})
-            response = self.client.get(reverse('search'), qs)
-            eq_(total, json.loads(response.content)['total'])
-
-    def test_tags(self):
-        """Search for tags, includes multiple."""
-        qs = {'a': 1, 'w': 1, 'format': 'json'}
-        tags_vals = (
-            ('doesnotexist', 0),
-            ('extant', 2),
-            ('tagged', 1),
-            ('extant tagged', 1),
-        )
-
-        for tag_string, total in tags_vals:
-            qs.update({'tags': tag_string})
-            response = self.client.get(reverse('search'), qs)
-            eq_(total, json.loads(response.content)['total'])
-
-    def test_tags_inherit(self):
-        """Translations inherit tags from their parents."""
-        qs = {'a': 1, 'w': 1, 'format': 'json', 'tags': 'extant'}
-        response = self.client.get(reverse('search', locale='es'), qs)
-        eq_(1, json.loads(response.content)['total'])
-
-    def test_products(self):
-        """Search for products."""
-        qs = {'a': 1, 'w': 1, 'format': 'json'}
-        prod_vals = (
-            ('mobile', 1),
-            ('desktop', 1),
-            ('sync', 2),
-            ('FxHome', 0),
-        )
-
-        for prod, total in prod_vals:
-            qs.update({'product': prod})
-            response = self.client.get(reverse('search'), qs)
-            eq_(total, json.loads(response.content)['total'])
-
-    def test_products_inherit(self):
-        """Translations inherit products from their parents."""
-        qs = {'a': 1, 'w': 1, 'format': 'json', 'product': 'desktop'}
-        response = self.client.get(reverse('search', locale='fr'), qs)
-        eq_(1, json.loads(response.content)['total'])
-
     def test_unicode_excerpt(self):
         """Unicode characters in the excerpt should not be a problem."""
         ws = (wiki_searcher().highlight('html')
@@ -334,14 +154,6 @@ class SearchTest(SphinxTestCase):
         out_ = '<b>test</b> &lt;div&gt;the start of something&lt;/div&gt;'
         eq_(out_, clean_excerpt(in_))
 
-    def test_meta_tags(self):
-        url_ = reverse('search')
-        response = self.client.get(url_, {'q': 'contribute'})
-
-        doc = pq(response.content)
-        metas = doc('meta')
-        eq_(3, len(metas))
-
     def test_discussion_sanity(self):
         """Sanity check for discussion forums search client."""
         dis_s = (discussion_searcher()
@@ -352,94 +164,6 @@ class SearchTest(SphinxTestCase):
         eq_(1, len(results))
         eq_([u'yet another <b>post</b>'], dis_s.excerpt(results[0])[0])
 
-    def test_discussion_filter_author(self):
-        """Filter by author in discussion forums."""
-        qs = {'a': 1, 'w': 4, 'format': 'json'}
-        author_vals = (
-            ('DoesNotExist', 0),
-            ('admin', 1),
-            ('jsocol', 4),
-        )
-
-        for author, total in author_vals:
-            qs.update({'author': author})
-            response = self.client.get(reverse('search'), qs)
-            eq_(total, json.loads(response.content)['total'])
-
-    def test_discussion_filter_forum(self):
-        """Filter by forum in discussion forums."""
-        raise SkipTest  # TODO: Figure out why this randomly started failing.
-        qs = {'a': 1, 'w': 4, 'format': 'json'}
-        forum_vals = (
-            # (forum_id, num_results)
-            (1, 4),
-            (2, 1),
-            (3, 0),  # this forum does not exist
-        )
-
-        for forum_id, total in forum_vals:
-            qs.update({'forum': forum_id})
-            response = self.client.get(reverse('search'), qs)
-            eq_(total, json.loads(response.content)['total'])
-
-    def test_discussion_filter_sticky(self):
-        """Filter for sticky threads."""
-        raise SkipTest  # TODO: Figure out why this randomly started failing.
-        qs = {'a': 1, 'w': 4, 'format': 'json', 'thread_type': 1, 'forum': 1}
-        response = self.client.get(reverse('search'), qs)
-        result = json.loads(response.content)['results'][0]
-        eq_(u'Sticky Thread', result['title'])
-
-    def test_discussion_filter_locked(self):
-        """Filter for locked threads."""
-        raise SkipTest  # TODO: Figure out why this randomly started failing.
-        qs = {'a': 1, 'w': 4, 'format': 'json', 'thread_type': 2,
-              'forum': 1, 'q': 'locked'}
-        response = self.client.get(reverse('search'), qs)
-        result = json.loads(response.content)['results'][0]
-        eq_(u'Locked Thread', result['title'])
-
-    def test_discussion_filter_sticky_locked(self):
-        """Filter for locked and sticky threads."""
-        qs = {'a': 1, 'w': 4, 'format': 'json', 'thread_type': (1, 2)}
-        response = self.client.get(reverse('search'), qs)
-        result = json.loads(response.content)['results'][0]
-        eq_(u'Locked Sticky Thread', result['title'])
-
-    def test_discussion_filter_created(self):
-        """Filter for created date."""
-        qs = {'a': 1, 'w': 4, 'format': 'json',
-              'sortby': 2, 'created_date': '05/03/2010'}
-        created_vals = (
-            (1, '/1'),
-            (2, '/5'),
-        )
-
-        for created, url_id in created_vals:
-            qs.update({'created': created})
-            response = self.client.get(reverse('search'), qs)
-            result = json.loads(response.content)['results'][-1]
-            url_end = result['url'].endswith(url_id)
-            assert url_end, ('Url was "%s", expected to end with "%s"' %
-                             (result['url'], url_id))
-
-    def test_discussion_filter_updated(self):
-        """Filter for updated date."""
-        qs = {'a': 1, 'w': 4, 'format': 'json',
-              'sortby': 1, 'updated_date': '05/04/2010'}
-        updated_vals = (
-            (1, '/1'),
-            (2, '/4'),
-        )
-
-        for updated, url_id in updated_vals:
-            qs.update({'updated': updated})
-            response = self.client.get(reverse('search'), qs)
-            result = json.loads(response.content)['results'][0]
-            url_end = result['url'].endswith(url_id)
-            assert url_end, ('URL was "%s", expected to end with "%s"' %
-                             (result['url'], url_id))
-
     def test_discussion_sort_mode(self):
         """Test set groupsort."""
         # Initialize client and attrs.
@@ -523,50 +247,3 @@ class SearchTest(SphinxTestCase):
         """Redirect articles should never appear in search results."""
         results = list(wiki_searcher().query('ghosts'))
         eq_(1, len(results))
-
-    def test_search_cookie(self):
-        """Set a cookie with the latest search term."""
-        data = {'q': u'pagap\xf3 banco'}
-        cookie = settings.LAST_SEARCH_COOKIE
-        response = self.client.get(reverse('search', locale='fr'), data)
-        assert cookie in response.cookies
-        eq_(urlquote(data['q']), response.cookies[cookie].value)
-
-    @mock.patch.object(Site.objects, 'get_current')
-    def test_suggestions(self, get_current):
-        """Suggestions API is well-formatted."""
-        get_current.return_value.domain = 'testserver'
-
-        response = self.client.get(reverse('search.suggestions',
-                                           locale='en-US'),
-                                   {'q': 'audio'})
-        eq_(200, response.status_code)
-        eq_('application/x-suggestions+json', response['content-type'])
-        results = json.loads(response.content)
-        eq_('audio', results[0])
-        eq_(3, len(results[1]))
-        eq_(0, len(results[2]))
-        eq_(3, len(results[3]))
-
-    @mock.patch.object(Site.objects, 'get_current')
-    def test_invalid_suggestions(self, get_current):
-        """The suggestions API needs a query term."""
-        get_current.return_value.domain = 'testserver'
-        response = self.client.get(reverse('search.suggestions',
-                                           locale='en-US'))
-        eq_(400, response.status_code)
-        assert not response.content
-
-    def test_archived(self):
-        """Ensure archived articles show only when requested."""
-        qs = {'q': 'impalas', 'a': 1, 'w': 1, 'format': 'json',
-              'include_archived': 'on'}
-        response = self.client.get(reverse('search'), qs)
-        results = json.loads(response.content)['results']
-        eq_(1, len(results))
-        assert results[0]['url'].endswith('archived-article')
-
-        qs = {'q': 'impalas', 'a': 0, 'w': 1, 'format': 'json'}
-        response = self.client.get(reverse('search'), qs)
-        results = json.loads(response.content)['results']
-        eq_([], results)
@@ -0,0 +1,142 @@
+import json
+
+from django.contrib.sites.models import Site
+
+import mock
+from nose import SkipTest
+from nose.tools import eq_
+
+from questions.models import Question
+from questions.tests import question, answer
+from search.suggestions import (ENTRIES_KEY, UPDATED_KEY, VOTED_KEY,
+                                get_prefixes, get_suggestions,
+                                update_suggestions)
+from sumo.redis_utils import redis_client, RedisError
+from sumo.tests import TestCase
+from sumo.urlresolvers import reverse
+from wiki.tests import document, revision
+
+
+class SuggestionsTestCase(TestCase):
+    def setUp(self):
+        super(SuggestionsTestCase, self).setUp()
+        try:
+            self.redis = redis_client('default')
+            self.redis.flushdb()
+        except RedisError:
+            raise SkipTest
+
+    def tearDown(self):
+        self.redis.flushdb()
+        super(SuggestionsTestCase, self).tearDown()
+
+    def _solved_question(self, **kwargs):
+        q = question(save=True, **kwargs)
+        q.solution = answer(question=q, save=True)
+        q.save()
+        return q
+
+    def test_get_prefixes(self):
+        eq_(get_prefixes(u'Fix a crash!'),
+            set([u'f', u'fi', u'fix', u'fix a', u'fix a c', u'fix a cr',
+                 u'fix a cra', u'fix a cras', u'fix a crash', u'a',
+                 u'a c', u'a cr', u'a cra', u'a cras', u'a crash', u'c',
+                 u'cr', u'cra', u'cras', u'crash']))
+
+    def test_suggestions(self):
+        doc = document(title=u'Firefox crashes', locale=u'en-US',
+                       save=True)
+        revision(document=doc, is_approved=True, save=True)
+        q = self._solved_question(title=u'How do I stop Firefox crashing?')
+        question(title=u'Firefox crashes a lot', save=True)
+        update_suggestions()
+
+        eq_(get_suggestions(u'en-US', u'firefox cra'),
+            [(doc.title, doc.get_absolute_url()),
+             (q.title, q.get_absolute_url())])
+        eq_(get_suggestions(u'de', u'firefox cra'),
+            [(q.title, q.get_absolute_url())])
+        eq_(get_suggestions(u'en-US', u'Crashing'),
+            [(q.title, q.get_absolute_url())])
+
+    def test_long_terms(self):
+        q = self._solved_question(title=u'Firefox crashes on startup')
+        self._solved_question(title=u'Firefox crashes on exit')
+        update_suggestions()
+
+        eq_(get_suggestions(u'en-US', u'firefox crashes on st'),
+            [(q.title, q.get_absolute_url())])
+
+    def test_incremental_update(self):
+        q = self._solved_question(title=u'Firefox crashes')
+        update_suggestions()
+        eq_(len(get_suggestions(u'en-US', u'firefox')), 1)
+
+        # Pretend the last update was long ago so the changed question
+        # gets picked up.
+        self.redis.set(UPDATED_KEY, 0)
+        q.solution = None
+        q.save()
+        eq_(update_suggestions(), 1)
+        eq_(get_suggestions(u'en-US', u'firefox'), [])
+        eq_(self.redis.hlen(ENTRIES_KEY % 'question'), 0)
+
+        # Nothing changed, so there's nothing to do.
+        eq_(update_suggestions(), 0)
+
+    def test_incremental_update_reads_changed_entries(self):
+        self._solved_question(title=u'Firefox crashes')
+        update_suggestions()
+        q = self._solved_question(title=u'Firefox hangs')
+
+        redis = mock.Mock(wraps=self.redis)
+        with mock.patch('search.suggestions.redis_client',
+                        lambda name: redis):
+            eq_(update_suggestions(), 1)
+        eq_([args for args, kwargs in redis.hgetall.call_args_list],
+            [(ENTRIES_KEY % 'wiki',)])
+        eq_(get_suggestions(u'en-US', u'firefox h'),
+            [(q.title, q.get_absolute_url())])
+
+    def test_votes_decay(self):
+        q = self._solved_question(title=u'Firefox crashes',
+                                  num_votes_past_week=3)
+        update_suggestions()
+        eq_(self.redis.smembers(VOTED_KEY), set([str(q.id)]))
+
+        # The weekly votes cron job updates the counts without touching
+        # updated.
+        Question.uncached.filter(id=q.id).update(num_votes_past_week=0)
+        eq_(update_suggestions(), 1)
+        entry = json.loads(self.redis.hget(ENTRIES_KEY % 'question', q.id))
+        eq_(entry[3], 0)
+        eq_(self.redis.smembers(VOTED_KEY), set())
+
+    @mock.patch.object(Site.objects, 'get_current')
+    def test_suggestions_view(self, get_current):
+        """Suggestions API is well-formatted."""
+        get_current.return_value.domain = 'testserver'
+        q = self._solved_question(title=u'audio fails')
+        update_suggestions()
+
+        response = self.client.get(reverse('search.suggestions',
+                                           locale='en-US'),
+                                   {'q': 'audio'})
+        eq_(200, response.status_code)
+        eq_('application/x-suggestions+json', response['content-type'])
+        results = json.loads(response.content)
+        eq_(u'audio', results[0])
+        eq_([q.title], results[1])
+        eq_([], results[2])
+        eq_(1, len(results[3]))
+        assert results[3][0].startswith(u'https://testserver/')
+        assert results[3][0].endswith(q.get_absolute_url())
+
+    @mock.patch.object(Site.objects, 'get_current')
+    def test_invalid_suggestions(self, get_current):
+        """The suggestions API needs a query term."""
+        get_current.return_value.domain = 'testserver'
+        response = self.client.get(reverse('search.suggestions',
+                                           locale='en-US'))
+        eq_(400, response.status_code)
+        assert not response.content
@@ -1,13 +1,27 @@
+import json
+import logging
 import subprocess
+import time
 import zlib
 
 import bleach
 
 from django.conf import settings
 
+from redis.exceptions import ConnectionError
+from statsd import statsd
+
+from sumo.redis_utils import redis_client, RedisError
 from sumo_locales import LOCALES
 
 
+# Redis list of the most recent slow searches, newest first.
+SLOW_SEARCHES_KEY = 'sumo:search:slow_searches'
+
+log = logging.getLogger('k.search')
+slow_log = logging.getLogger('k.search.slow')
+
+
 crc32 = lambda x: zlib.crc32(x.encode('utf-8')) & 0xffffffff
 
 
@@ -63,6 +77,101 @@ def locale_or_default(locale):
     return locale
 
 
+class SearchTimer(object):
+    """Times the phases of handling a search
+
+    Phases are back to back: ``mark(phase)`` ends the phase that
+    started when the previous one ended. Each phase goes to statsd as
+    ``search.<engine>.<phase>``.
+
+    ES round trips also record how long ES says the searches took, so
+    time spent in ES can be told apart from the network and our own
+    overhead.
+
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.start = self._last = time.time()
+        self.phases = []
+        self.es_calls = []
+
+    def mark(self, phase):
+        """Ends a phase"""
+        now = time.time()
+        ms = int((now - self._last) * 1000)
+        self._last = now
+        self.phases.append((phase, ms))
+        statsd.timing('search.%s.%s' % (self.engine, phase), ms)
+
+    def mark_es(self, took):
+        """Ends an ES round trip phase
+
+        :arg took: how long ES says it took in ms
+
+        """
+        self.mark('es')
+        ms = self.phases[-1][1]
+        self.es_calls.append((ms, took))
+        statsd.timing('search.%s.es.took' % self.engine, took)
+        statsd.timing('search.%s.es.overhead' % self.engine,
+                      max(ms - took, 0))
+
+    @property
+    def total(self):
+        """Milliseconds from the start to the end of the last phase"""
+        return int((self._last - self.start) * 1000)
+
+
+def log_slow_search(timer, query, locale, searches):
+    """Logs a search if it was slower than ``settings.SEARCH_SLOW_MS``
+
+    Slow searches go to the ``k.search.slow`` log and to the list of
+    recent slow searches the search admin shows.
+
+    :arg timer: the search's :py:class:`SearchTimer`
+    :arg query: the search terms
+    :arg locale: the locale searched
+    :arg searches: the S instances the search ran. Their ES bodies get
+        logged.
+
+    """
+    if timer.total < settings.SEARCH_SLOW_MS:
+        return
+
+    entry = json.dumps({
+        'time': int(timer.start),
+        'query': query,
+        'locale': locale,
+        'engine': timer.engine,
+        'total': timer.total,
+        'phases': timer.phases,
+        'es_calls': timer.es_calls,
+        'bodies': [s._build_query() for s in searches]})
+    slow_log.info(entry)
+
+    try:
+        redis = redis_client('default')
+        pipe = redis.pipeline()
+        pipe.lpush(SLOW_SEARCHES_KEY, entry)
+        pipe.ltrim(SLOW_SEARCHES_KEY, 0, settings.SEARCH_SLOW_KEEP - 1)
+        pipe.execute()
+    except (RedisError, ConnectionError), e:
+        statsd.incr('redis.errror')
+        log.error('Redis error: %s' % e)
+
+
+def get_slow_searches():
+    """Returns the recent slow searches, newest first
+
+    Raises ``RedisError`` or ``redis.ConnectionError`` if redis isn't
+    available.
+
+    """
+    redis = redis_client('default')
+    return [json.loads(entry) for entry
+            in redis.lrange(SLOW_SEARCHES_KEY, 0, -1)]
+
+
 class ComposedList(object):
     """Takes counts and pretends they're sublists of a big list
 
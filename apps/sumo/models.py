@@ -1,7 +1,11 @@
+import time
+
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 
 import caching.base
+import jinja2
 
 
 # Our apps should subclass ManagerBase instead of models.Manager or
@@ -47,6 +51,64 @@ class ModelBase(caching.base.CachingMixin, models.Model):
                                           created=False)
 
 
+class ParsedContentMixin(object):
+    """
+    Mixin for models with wiki markup content that gets shown as HTML.
+
+    ``content_parsed`` renders the content once and then serves the HTML
+    from memcached, keyed on model, pk, ``updated`` timestamp and
+    ``sumo.parser.PARSER_VERSION``. Saving clears it.
+
+    Mix it in before ModelBase.
+    """
+
+    # Field holding the wiki markup
+    parsed_content_field = 'content'
+    # DateTimeField bumped on edits, or None if the model has none
+    parsed_updated_field = 'updated'
+    parsed_cache_timeout = 60 * 60 * 24
+
+    @property
+    def html_cache_key(self):
+        from sumo.parser import PARSER_VERSION
+
+        updated = (getattr(self, self.parsed_updated_field)
+                   if self.parsed_updated_field else None)
+        if updated is not None:
+            updated = int(time.mktime(updated.timetuple()))
+        return u'parsed:%s.%s:%s:%s:%s' % (
+            self._meta.app_label, self._meta.module_name, self.pk, updated,
+            PARSER_VERSION)
+
+    def parse_content(self):
+        """Render the content to HTML, bypassing the cache."""
+        from sumo.parser import wiki_to_html
+
+        return wiki_to_html(getattr(self, self.parsed_content_field))
+
+    @property
+    def content_parsed(self):
+        if self.pk is None:
+            return jinja2.Markup(self.parse_content())
+
+        cache_key = self.html_cache_key
+        html = cache.get(cache_key)
+        if html is None:
+            html = self.parse_content()
+            cache.add(cache_key, html, self.parsed_cache_timeout)
+        return jinja2.Markup(html)
+
+    def clear_cached_html(self):
+        if self.pk is not None:
+            cache.delete(self.html_cache_key)
+
+    def save(self, *args, **kwargs):
+        super(ParsedContentMixin, self).save(*args, **kwargs)
+        # updated usually moves on save, which changes the key anyway,
+        # but not always by a whole second.
+        self.clear_cached_html()
+
+
 class LocaleField(models.CharField):
     """CharField with locale settings specific to SUMO defaults."""
     def __init__(self, max_length=7, default=settings.LANGUAGE_CODE,
@@ -1,3 +1,5 @@
+import re
+
 from django.conf import settings
 
 import jingo
@@ -34,6 +36,12 @@ IMAGE_PARAM_VALUES = {
     'valign': ('baseline', 'sub', 'super', 'top', 'text-top', 'middle',
               'bottom', 'text-bottom'),
 }
+# [[Namespace:Name|params]] or [[Title#hash|text]] in wiki markup
+INTERNAL_LINK_RE = re.compile(r'\[\[(.+?)\]\]')
+# Bump this when a parser change changes the HTML it makes, so HTML
+# cached by sumo.models.ParsedContentMixin and KB documents rendered with
+# the old parser get rendered again.
+PARSER_VERSION = 1
 
 
 def wiki_to_html(wiki_markup, locale=settings.WIKI_DEFAULT_LANGUAGE,
@@ -91,20 +99,100 @@ def get_object_fallback(cls, title, locale, default=None, **kwargs):
         return default
 
 
-def _get_wiki_link(title, locale):
+def get_objects_fallback(cls, titles, locale, **kwargs):
+    """Look up many titles the way get_object_fallback() does, in a few
+    queries.
+
+    Return a dict of lowercased title -> instance of cls, or None if there
+    is no such instance.
+
+    The database compares titles case-insensitively (and, depending on the
+    collation, accent-insensitively), so an instance gets matched to the
+    title it was looked up by via its lowercased title. If the database
+    returns an instance that doesn't match any of the titles that way, the
+    titles not found are left out of the dict rather than reported missing.
+    Use get_object_fallback() for titles that aren't in the dict.
+
+    """
+    default_locale = settings.WIKI_DEFAULT_LANGUAGE
+    titles = dict((title.lower(), title) for title in titles)
+    if not titles:
+        return {}
+
+    def by_title(objects):
+        found = dict((obj.title.lower(), obj) for obj in objects)
+        return found, any(key not in titles for key in found)
+
+    found, fuzzy = by_title(cls.objects.filter(
+        title__in=titles.values(), locale=locale, **kwargs))
+
+    # Fallback
+    missing = [title for key, title in titles.iteritems() if key not in found]
+    if missing and locale != default_locale:
+        defaults, fuzzy_defaults = by_title(cls.objects.filter(
+            title__in=missing, locale=default_locale, **kwargs))
+        fuzzy = fuzzy or fuzzy_defaults
+        if hasattr(cls, 'translated_to'):
+            _translate_fallbacks(cls, defaults, locale)
+        for key, obj in defaults.iteritems():
+            found.setdefault(key, obj)
+
+    if not fuzzy:
+        for key in titles:
+            found.setdefault(key, None)
+    return found
+
+
+def _translate_fallbacks(cls, defaults, locale):
+    """Replace default locale documents with their translations to locale.
+
+    Like get_object_fallback(), this follows redirects in the hope of finding
+    a translation of the redirect target. Redirects are few, so they are
+    followed one by one, but the translations are looked up in one query.
+
+    """
+    def translations(docs):
+        return dict((t.parent_id, t) for t in cls.objects.filter(
+            locale=locale, parent__in=[d.id for d in docs],
+            current_revision__isnull=False))
+
+    if not defaults:
+        return
+
+    found = translations(defaults.values())
+    targets = {}
+    for key, doc in defaults.items():
+        if doc.id in found:
+            defaults[key] = found[doc.id]
+        elif hasattr(doc, 'redirect_document'):
+            target = doc.redirect_document()
+            if target:
+                targets[key] = target
+
+    if targets:
+        found = translations(targets.values())
+        for key, target in targets.iteritems():
+            if target.id in found:
+                defaults[key] = found[target.id]
+
+
+def _get_wiki_link(title, locale, object_fallback=get_object_fallback):
     """Checks the page exists, and returns its URL or the URL to create it.
 
     Return value is a dict: {'found': boolean, 'url': string}.
     found is False if the document does not exist.
 
+    object_fallback -- a function with the signature of get_object_fallback()
+        to look the document up with
+
     """
     # Prevent circular import. sumo is conceptually a utils apps and shouldn't
     # have import-time (or really, any, but that's not going to happen)
     # dependencies on client apps.
     from wiki.models import Document
 
-    d = get_object_fallback(Document, locale=locale, title=title,
-                            is_template=False)
+    d = object_fallback(Document, locale=locale, title=title,
+                        is_template=False)
     if d:
         # The locale in the link urls should always match the current
         # document's locale even if the document/slug being linked to
@@ -172,9 +260,68 @@ def build_hook_params(string, locale, allowed_params=[],
     return (title, params)
 
 
+class SimpleSyntax(object):
+    """Expands simple syntax like {menu Tools} into HTML in a single pass
+
+    Takes a list of (compiled regex, replacement) pairs like the arguments
+    to re.sub. Each regex should match a {...} construct, so it starts
+    with "\{", and can't have named groups. The replacements shouldn't add
+    braces of their own. Expanding is then the same as substituting each
+    regex in turn, only with one scan of the text rather than one per
+    regex.
+
+    """
+    def __init__(self, patterns):
+        self.patterns = patterns
+        flags = 0
+        alternatives = []
+        # Group name -> (regex, replacement) of the regex it matches
+        self._dispatch = {}
+        for i, (pattern, replacement) in enumerate(patterns):
+            if not pattern.pattern.startswith(r'\{'):
+                raise ValueError('%r doesn\'t start with "\\{".' %
+                                 pattern.pattern)
+            flags |= pattern.flags
+            name = '_%i' % i
+            # Leave the "{" out of the alternatives so the combined regex
+            # can skip ahead to the next "{" quickly.
+            alternatives.append('(?P<%s>%s)' % (name, pattern.pattern[2:]))
+            self._dispatch[name] = pattern, replacement
+        self._regex = re.compile(r'\{(?:%s)' % '|'.join(alternatives), flags)
+
+    def expand(self, text):
+        """Return text with the simple syntax expanded."""
+        if '{' not in text:
+            return text
+
+        nested = []
+
+        def replace(match):
+            # When constructs nest, the result of substituting the regexes
+            # in turn depends on their order, which one pass can't mimic.
+            if '{' in match.group()[1:]:
+                nested.append(match)
+            pattern, replacement = self._dispatch[match.lastgroup]
+            if callable(replacement):
+                return replacement(pattern.match(text, match.start()))
+            # Substituting on the match lets re cache the parsed template.
+            return pattern.sub(replacement, match.group(), 1)
+
+        expanded = self._regex.sub(replace, text)
+        return self.expand_sequentially(text) if nested else expanded
+
+    def expand_sequentially(self, text):
+        """Return text with each regex substituted in turn."""
+        for pattern, replacement in self.patterns:
+            text = pattern.sub(replacement, text)
+        return text
+
+
 class WikiParser(Parser):
     """Wrapper for wikimarkup which adds Kitsune-specific callbacks and setup.
     """
+    # SimpleSyntax to expand before running the formatter, if any
+    simple_syntax = None
 
     def __init__(self, base_url=None):
         super(WikiParser, self).__init__(base_url)
@@ -183,6 +330,17 @@ class WikiParser(Parser):
         self.registerInternalLinkHook(None, self._hook_internal_link)
         self.registerInternalLinkHook('Image', self._hook_image_tag)
 
+        # Objects the hooks need, looked up before running the formatter.
+        # Keyed by (class, locale, query kwargs, lowercased title). They are
+        # kept for the length of one parse, including nested parses of
+        # inclusions.
+        self._objects = {}
+        self._parse_depth = 0
+
+        # (class, title, id or None) of the objects the last parse looked up
+        # for inclusion in the output, images for example. Links don't count.
+        self.dependencies = set()
+
     def parse(self, text, show_toc=None, tags=None, attributes=None,
               styles=None, locale=settings.WIKI_DEFAULT_LANGUAGE,
               nofollow=False):
@@ -195,16 +353,75 @@ class WikiParser(Parser):
         Since py-wikimarkup's hooks don't offer custom paramters for callbacks,
         we're using self.locale to keep things simple."""
         self.locale = locale
+        if not self._parse_depth:
+            self._objects = {}
+            self.dependencies = set()
+        if self.simple_syntax is not None:
+            text = self.simple_syntax.expand(text)
+        self._prefetch_objects(text)
 
         parser_kwargs = {'tags': tags} if tags else {}
-        return super(WikiParser, self).parse(
-            text,
-            show_toc=show_toc,
-            attributes=attributes or ALLOWED_ATTRIBUTES,
-            styles=styles or ALLOWED_STYLES,
-            nofollow=nofollow,
-            strip_comments=True,
-            **parser_kwargs)
+        self._parse_depth += 1
+        try:
+            return super(WikiParser, self).parse(
+                text,
+                show_toc=show_toc,
+                attributes=attributes or ALLOWED_ATTRIBUTES,
+                styles=styles or ALLOWED_STYLES,
+                nofollow=nofollow,
+                strip_comments=True,
+                **parser_kwargs)
+        finally:
+            self._parse_depth -= 1
+
+    def _object_lookups(self, space, name):
+        """Return the (class, title, query kwargs) lookups the hook for
+        [[space:name]] is going to do."""
+        if space is None:
+            title = name.split('|', 1)[0].split('#', 1)[0]
+            if title:
+                from wiki.models import Document
+                return [(Document, title, {'is_template': False})]
+        elif space == 'Image':
+            return [(Image, name.split('|', 1)[0].strip(), {})]
+        return []
+
+    def _prefetch_objects(self, text):
+        """Look up everything the links in text refer to, a few queries per
+        kind of object rather than a few per link."""
+        groups = {}
+        for match in INTERNAL_LINK_RE.finditer(text):
+            link = match.group(1)
+            space, colon, name = link.partition(':')
+            if not colon:
+                space, name = None, link
+            for cls, title, kwargs in self._object_lookups(space, name):
+                key = (cls, frozenset(kwargs.iteritems()))
+                groups.setdefault(key, set()).add(title)
+
+        for (cls, kwargs), titles in groups.iteritems():
+            titles = [t for t in titles if
+                      (cls, self.locale, kwargs, t.lower()) not in
+                      self._objects]
+            found = get_objects_fallback(cls, titles, self.locale,
+                                         **dict(kwargs))
+            for title, obj in found.iteritems():
+                self._objects[(cls, self.locale, kwargs, title)] = obj
+
+    def _get_object_fallback(self, cls, title, locale, default=None,
+                             **kwargs):
+        """get_object_fallback(), answered from the prefetched objects when
+        possible."""
+        key = (cls, locale, frozenset(kwargs.iteritems()), title.lower())
+        if key not in self._objects:
+            return get_object_fallback(cls, title, locale, default, **kwargs)
+        obj = self._objects[key]
+        return default if obj is None else obj
+
+    def _add_dependency(self, cls, title, obj):
+        """Record that the output depends on the cls titled title, which is
+        obj if it exists."""
+        self.dependencies.add((cls, title, getattr(obj, 'id', None)))
 
     def _hook_internal_link(self, parser, space, name):
         """Parses text and returns internal link."""
@@ -229,7 +446,7 @@ class WikiParser(Parser):
                 text = hash.replace('_', ' ')
             return u'<a href="%s">%s</a>' % (hash, text)
 
-        link = _get_wiki_link(title, self.locale)
+        link = _get_wiki_link(title, self.locale, self._get_object_fallback)
         a_cls = ''
         if not link['found']:
             a_cls = ' class="new"'
@@ -243,7 +460,8 @@ class WikiParser(Parser):
                                           IMAGE_PARAM_VALUES)
 
         message = _lazy(u'The image "%s" does not exist.') % title
-        image = get_object_fallback(Image, title, self.locale, message)
+        image = self._get_object_fallback(Image, title, self.locale, message)
+        self._add_dependency(Image, title, image)
         if isinstance(image, basestring):
             return image
 
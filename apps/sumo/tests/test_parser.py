@@ -1,13 +1,18 @@
 from functools import partial
+import re
 
 from django.conf import settings
 
+import mock
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 
 from gallery.tests import image
-from sumo.parser import (WikiParser, build_hook_params, _get_wiki_link,
-                         get_object_fallback, IMAGE_PARAMS, IMAGE_PARAM_VALUES)
+import sumo.parser
+from sumo.parser import (WikiParser, SimpleSyntax, build_hook_params,
+                         _get_wiki_link,
+                         get_object_fallback, get_objects_fallback,
+                         IMAGE_PARAMS, IMAGE_PARAM_VALUES)
 from sumo.tests import TestCase
 from wiki.models import Document
 from wiki.tests import document, revision
@@ -143,6 +148,48 @@ class GetObjectFallbackTests(TestCase):
                                 redirect_rev.document.locale))
 
 
+class GetObjectsFallbackTests(TestCase):
+    fixtures = ['users.json']
+
+    def test_found_and_missing(self):
+        """Titles are matched case-insensitively; missing ones are None."""
+        d = document(title='A doc', save=True)
+        eq_({'a doc': d, 'no doc': None},
+            get_objects_fallback(Document, ['a Doc', 'No doc'], 'en-US'))
+
+    def test_translated(self):
+        """Translations with an approved revision replace the fallback."""
+        en_d = document(title='A doc', save=True)
+        revision(document=en_d, is_approved=True, save=True)
+        fr_d = document(parent=en_d, title='Une doc', locale='fr', save=True)
+        other_d = document(title='Other doc', save=True)
+        eq_({'a doc': en_d, 'other doc': other_d},
+            get_objects_fallback(Document, ['A doc', 'Other doc'], 'fr'))
+
+        revision(document=fr_d, is_approved=True, save=True)
+        eq_({'a doc': fr_d, 'other doc': other_d},
+            get_objects_fallback(Document, ['A doc', 'Other doc'], 'fr'))
+
+    def test_redirect(self):
+        """Redirects are followed to translations of their targets."""
+        target_rev = revision(
+            document=document(title='target', save=True),
+            is_approved=True,
+            save=True)
+        translated_target_rev = revision(
+            document=document(parent=target_rev.document, locale='de',
+                              save=True),
+            is_approved=True,
+            save=True)
+        revision(
+            document=document(title='redirect', save=True),
+            content='REDIRECT [[target]]',
+            is_approved=True).save()
+
+        eq_({'redirect': translated_target_rev.document},
+            get_objects_fallback(Document, ['redirect'], 'de'))
+
+
 class TestWikiParser(TestCase):
     fixtures = ['users.json']
 
@@ -215,11 +262,56 @@ class TestWikiParser(TestCase):
             _get_wiki_link('Installing Firefox',
                          locale=settings.WIKI_DEFAULT_LANGUAGE))
 
+    @mock.patch.object(sumo.parser, 'get_object_fallback')
+    def test_links_prefetched(self, get_object_fallback):
+        """Links are looked up before parsing, not one by one."""
+        image(title='An image.jpg')
+        doc = pq(self.p.parse('[[Installing Firefox]] [[installing firefox]] '
+                              '[[Missing doc|here]] [[Image:An image.jpg]]'))
+        assert not get_object_fallback.called
+        links = doc('a')
+        eq_('/en-US/kb/installing-firefox', links.eq(0).attr('href'))
+        eq_('/en-US/kb/installing-firefox', links.eq(1).attr('href'))
+        assert links.eq(2).hasClass('new')
+        eq_(1, len(doc('img')))
+
     def test_showfor(self):
         """<showfor> tags should be escaped, not obeyed."""
         eq_('<p>&lt;showfor&gt;smoo&lt;/showfor&gt;</p>',
             self.p.parse('<showfor>smoo</showfor>').replace('\n', ''))
 
+    def test_simple_syntax(self):
+        """Parsers can be given simple syntax to expand."""
+        self.p.simple_syntax = SimpleSyntax([
+            (re.compile(r'\{menu (.*?)\}'), r'<span class="menu">\1</span>')])
+        eq_('<p>Open <span class="menu">Tools</span> {key Q}</p>',
+            self.p.parse('Open {menu Tools} {key Q}').replace('\n', ''))
+
+
+class SimpleSyntaxTests(TestCase):
+    def setUp(self):
+        self.syntax = SimpleSyntax([
+            (re.compile(r'\{b\}'), '<b>'),
+            (re.compile(r'\{/b\}'), '</b>'),
+            (re.compile(r'\{upper (.*?)\}'),
+             lambda match: match.group(1).upper())])
+
+    def test_expand(self):
+        eq_('<b>A</b> B C {x}',
+            self.syntax.expand('{b}A{/b} {upper b} C {x}'))
+
+    def test_nested(self):
+        """Nested constructs come out as if each regex was substituted in
+        turn."""
+        text = '{upper a {b}} {upper {upper b}}'
+        eq_(self.syntax.expand_sequentially(text), self.syntax.expand(text))
+        eq_('A <B> {UPPER B}', self.syntax.expand(text))
+
+    def test_brace_required(self):
+        """Regexes have to match from a {."""
+        self.assertRaises(ValueError, SimpleSyntax,
+                          [(re.compile('b'), '<b>')])
+
 
 class TestWikiInternalLinks(TestCase):
     fixtures = ['users.json']
@@ -0,0 +1,172 @@
+"""Offline wiki parser benchmark
+
+Times the phases of rendering KB articles (see ``PHASES``) on the
+largest articles in the database, which are the ones where the cost of
+parsing shows. Each phase gets run on the current revision of each of
+the articles, so the numbers of a run before and after a change to the
+parser can be compared directly.
+
+"""
+import logging
+import time
+
+from wiki.models import Document, Revision
+from wiki.parser import (ForParser, SIMPLE_SYNTAX, WikiParser,
+                         wiki_to_html)
+
+
+log = logging.getLogger('wiki.benchmark')
+
+
+def _content(rev):
+    return rev.content
+
+
+def _unexpanded_html(rev):
+    """Returns the HTML of a revision before its <for> tags get expanded"""
+    parser = WikiParser(doc_id=rev.document_id)
+    return parser._parse_unexpanded(rev.content, show_toc=False,
+                                    locale=rev.document.locale)
+
+
+def _revision(rev):
+    return rev
+
+
+def _render(rev):
+    wiki_to_html(rev.content, rev.document.locale, rev.document_id)
+
+
+def _render_by_section(rev):
+    parser = WikiParser(doc_id=rev.document_id)
+    parser.parse_by_section(rev.content, show_toc=False,
+                            locale=rev.document.locale)
+
+
+def _expand_with_tree(html):
+    for_parser = ForParser(html)
+    for_parser.expand_fors()
+    return for_parser.to_unicode()
+
+
+# Name -> (function(revision) returning what to time the phase on,
+#          function to time)
+PHASES = {
+    'strip_fors': (_content, ForParser.strip_fors),
+    'simple_syntax': (_content, SIMPLE_SYNTAX.expand),
+    'simple_syntax_sequential': (_content, SIMPLE_SYNTAX.expand_sequentially),
+    'expand_fors': (_unexpanded_html, ForParser.expand),
+    'expand_fors_tree': (_unexpanded_html, _expand_with_tree),
+    'render': (_revision, _render),
+    'render_by_section': (_revision, _render_by_section),
+}
+
+
+def largest_revisions(count, locale=None):
+    """Returns the current revisions of the count largest articles"""
+    docs = Document.uncached.filter(current_revision__isnull=False)
+    if locale:
+        docs = docs.filter(locale=locale)
+    ids = list(docs.values_list('current_revision', flat=True))
+    return list(Revision.uncached.filter(id__in=ids)
+                .select_related('document')
+                .extra(select={'length': 'LENGTH(content)'})
+                .order_by('-length')[:count])
+
+
+def time_phase(phase, revisions, runs=1):
+    """Returns a list of (ms, revision) the phase took per revision
+
+    The time is the best of ``runs`` runs, which is the most repeatable.
+
+    """
+    prepare, function = PHASES[phase]
+    timings = []
+    for rev in revisions:
+        arg = prepare(rev)
+        best = None
+        for i in range(runs):
+            start = time.time()
+            function(arg)
+            ms = (time.time() - start) * 1000
+            best = ms if best is None else min(best, ms)
+        timings.append((best, rev))
+    return timings
+
+
+def check_for_expansion(revisions):
+    """Checks that expanding <for> tags without a parse tree gives the
+    same HTML as with one
+
+    :returns: list of the revisions where it doesn't
+
+    """
+    streamed, mismatches = 0, []
+    for rev in revisions:
+        html = _unexpanded_html(rev)
+        expanded = ForParser._expand_streaming(html)
+        if expanded is None:
+            continue
+        streamed += 1
+        if expanded != _expand_with_tree(html):
+            log.error('Expanding the fors of %s/%s without a tree gives '
+                      'different HTML.', rev.document.locale,
+                      rev.document.slug)
+            mismatches.append(rev)
+    log.info('%d of %d articles expanded without a tree, %d differently.',
+             streamed, len(revisions), len(mismatches))
+    return mismatches
+
+
+def check_simple_syntax(revisions):
+    """Checks that expanding simple syntax in one pass gives the same
+    text as substituting each pattern in turn
+
+    :returns: list of the revisions where it doesn't
+
+    """
+    mismatches = []
+    for rev in revisions:
+        if (SIMPLE_SYNTAX.expand(rev.content) !=
+            SIMPLE_SYNTAX.expand_sequentially(rev.content)):
+            log.error('Expanding the simple syntax of %s/%s in one pass '
+                      'gives different text.', rev.document.locale,
+                      rev.document.slug)
+            mismatches.append(rev)
+    log.info('%d of %d articles had their simple syntax expanded '
+             'differently.', len(mismatches), len(revisions))
+    return mismatches
+
+
+def wiki_bench_cmd(count=20, runs=3, phases=None, locale=None, check=False):
+    """Benchmarks the wiki parser on the largest articles
+
+    :arg count: how many articles to benchmark on
+    :arg runs: how many times to run each phase on each article
+    :arg phases: names of the phases to time; defaults to all of them
+    :arg locale: only benchmark on articles in this locale
+    :arg check: check the output of the faster ways of doing things
+        against the slower ones rather than timing anything
+
+    """
+    revisions = largest_revisions(count, locale)
+    if not revisions:
+        log.error('There are no articles to benchmark on.')
+        return
+    log.info('%d articles, %d to %d characters', len(revisions),
+             len(revisions[-1].content), len(revisions[0].content))
+
+    if check:
+        check_simple_syntax(revisions)
+        check_for_expansion(revisions)
+        return
+
+    log.info('%-24s %9s %8s %8s  %s', 'phase (ms)', 'total', 'mean', 'max',
+             'slowest')
+    for phase in phases or sorted(PHASES):
+        timings = sorted(time_phase(phase, revisions, runs))
+        total = sum(ms for ms, rev in timings)
+        slowest_ms, slowest = timings[-1]
+        log.info('%-24s %9.1f %8.2f %8.2f  %s/%s', phase, total,
+                 total / len(timings), slowest_ms,
+                 slowest.document.locale, slowest.document.slug)
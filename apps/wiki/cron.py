@@ -4,7 +4,6 @@ import time
 import urllib2
 
 from django.conf import settings
-from django.db import connection, transaction
 
 import cronjobs
 from multidb.pinning import use_master
@@ -12,6 +11,8 @@ from statsd import statsd
 import waffle
 
 from wiki import tasks
+from wiki.models import HelpfulVoteRollup
+from wiki.related import update_related_documents
 
 
 log = logging.getLogger('k.migratehelpful')
@@ -19,57 +20,8 @@ log = logging.getLogger('k.migratehelpful')
 
 @cronjobs.register
 def calculate_related_documents():
-    """Calculates all related documents based on common tags."""
-
-    cursor = connection.cursor()
-
-    cursor.execute('DELETE FROM wiki_relateddocument')
-    cursor.execute("""
-        INSERT INTO
-            wiki_relateddocument (document_id, related_id, in_common)
-        SELECT
-            t1.object_id,
-            t2.object_id,
-            COUNT(*) AS common_tags
-        FROM
-            wiki_document d1 JOIN
-            taggit_taggeditem t1 JOIN
-            taggit_taggeditem t2 JOIN
-            wiki_document d2
-        WHERE
-            d1.id = t1.object_id AND
-            t1.tag_id = t2.tag_id AND
-            t1.object_id <> t2.object_id AND
-            t1.content_type_id = (
-                SELECT
-                    id
-                FROM
-                    django_content_type
-                WHERE
-                    app_label = 'wiki' AND
-                    model = 'document'
-                ) AND
-            t2.content_type_id = (
-                SELECT
-                    id
-                FROM
-                    django_content_type
-                WHERE
-                    app_label = 'wiki' AND
-                    model = 'document'
-                ) AND
-            d2.id = t2.object_id AND
-            d2.locale = d1.locale AND
-            d2.category = d1.category AND
-            d1.current_revision_id IS NOT NULL AND
-            d2.current_revision_id IS NOT NULL AND
-            d2.is_archived = 0
-        GROUP BY
-            t1.object_id,
-            t2.object_id
-        HAVING
-            common_tags > 1""")
-    transaction.commit_unless_managed()
+    """Recalculates the related documents of documents that changed."""
+    update_related_documents()
 
 
 @cronjobs.register
@@ -81,6 +33,12 @@ def rebuild_kb():
     tasks.rebuild_kb()
 
 
+@cronjobs.register
+def rollup_helpful_votes():
+    """Roll up the helpful votes cast since the last run."""
+    HelpfulVoteRollup.roll_up()
+
+
 @cronjobs.register
 def get_highcharts():
     """Fetch highcharts, v1.0.2."""
@@ -1,5 +1,16 @@
+"""Diffing revisions
+
+Revisions never change once they're saved, so the diff between two of
+them is worked out once and cached for good: :py:func:`unified_diff`
+for the notification mails and :py:func:`html_diff` for the compare
+view and the review pages.
+
+"""
 import difflib
 
+from django.conf import settings
+from django.core.cache import cache
+
 
 class BetterHtmlDiff(difflib.HtmlDiff):
     """Modified version of HtmlDiff.
@@ -44,3 +55,86 @@ class BetterHtmlDiff(difflib.HtmlDiff):
 
         return '<td class="diff_header"%s>%s</td><td class="text">%s</td>' \
                % (id, linenum, text)
+
+
+def _diff_key(kind, revision_from, revision_to):
+    return 'wiki:diff:%s:%s:%s' % (kind, revision_from.id, revision_to.id)
+
+
+def _hash_lines(lines_from, lines_to):
+    """Return the lines as lists of ints, one int per distinct line.
+
+    SequenceMatcher hashes and compares every line many times over, which
+    is a lot quicker with small ints than with long lines of wiki markup.
+    Equal ints are equal lines, so the opcodes come out the same.
+
+    """
+    ids = {}
+    return ([ids.setdefault(line, len(ids)) for line in lines_from],
+            [ids.setdefault(line, len(ids)) for line in lines_to])
+
+
+def _format_range(start, stop):
+    """Return a hunk range in the unified format, like difflib does."""
+    length = stop - start
+    if length == 1:
+        return '%s' % (start + 1)
+    return '%s,%s' % (start + 1 if length else start, length)
+
+
+def _unified_hunks(lines_from, lines_to, n=3):
+    """Yield the hunks of a unified diff of two lists of lines.
+
+    That's what difflib.unified_diff yields without the file headers.
+
+    """
+    hashed_from, hashed_to = _hash_lines(lines_from, lines_to)
+    matcher = difflib.SequenceMatcher(None, hashed_from, hashed_to)
+    for group in matcher.get_grouped_opcodes(n):
+        first, last = group[0], group[-1]
+        yield '@@ -%s +%s @@\n' % (_format_range(first[1], last[2]),
+                                    _format_range(first[3], last[4]))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in lines_from[i1:i2]:
+                    yield u' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in lines_from[i1:i2]:
+                    yield u'-' + line
+            if tag in ('replace', 'insert'):
+                for line in lines_to[j1:j2]:
+                    yield u'+' + line
+
+
+def unified_diff(revision_from, revision_to, fromfile=u'', tofile=u''):
+    """Return the unified diff of the content of two revisions.
+
+    It's what ``u''.join(difflib.unified_diff(...))`` of their lines
+    would return: empty if the content is the same, otherwise headed
+    with fromfile and tofile, which aren't cached with the diff.
+
+    """
+    key = _diff_key('unified', revision_from, revision_to)
+    hunks = cache.get(key)
+    if hunks is None:
+        hunks = u''.join(_unified_hunks(
+            revision_from.content.splitlines(True),
+            revision_to.content.splitlines(True)))
+        cache.set(key, hunks, settings.WIKI_DIFF_CACHE_TIMEOUT)
+    if not hunks:
+        return u''
+    return u'--- %s\n+++ %s\n%s' % (fromfile, tofile, hunks)
+
+
+def html_diff(revision_from, revision_to):
+    """Return the side by side HTML table diffing the content of two
+    revisions."""
+    key = _diff_key('html', revision_from, revision_to)
+    table = cache.get(key)
+    if table is None:
+        table = BetterHtmlDiff().make_table(
+            revision_from.content.splitlines(),
+            revision_to.content.splitlines(), context=True)
+        cache.set(key, table, settings.WIKI_DIFF_CACHE_TIMEOUT)
+    return table
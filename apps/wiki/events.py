@@ -1,4 +1,3 @@
-import difflib
 import logging
 
 from django.conf import settings
@@ -14,65 +13,41 @@ from wikimarkup.parser import ALLOWED_TAGS, ALLOWED_ATTRIBUTES
 
 from sumo.urlresolvers import reverse
 from users.models import Profile
+from wiki.diff import unified_diff
 from wiki.models import Document
 
 
 log = logging.getLogger('k.wiki.events')
 
 
+def _previous(revisions):
+    """Return the second newest of some revisions, or None if there isn't
+    one."""
+    previous = list(revisions.order_by('-created')[1:2])
+    return previous[0] if previous else None
+
+
 def context_dict(revision, ready_for_l10n=False, revision_approved=False):
     """Return a dict that fills in the blanks in KB notification templates."""
     document = revision.document
-    diff = ''
-    l10n = revision.document.revisions.filter(is_ready_for_localization=True)
-    approved = revision.document.revisions.filter(is_approved=True)
-    if ready_for_l10n and l10n.count() > 1:
-        fromfile = u'[%s] %s #%s' % (revision.document.locale,
-                                     revision.document.title,
-                                     l10n.order_by('-created')[1].id)
-        tofile = u'[%s] %s #%s' % (revision.document.locale,
-                                   revision.document.title,
-                                   revision.id)
+    revisions = document.revisions.all()
+    from_revision = None
+    if ready_for_l10n:
+        from_revision = _previous(
+            revisions.filter(is_ready_for_localization=True))
+    if from_revision is None and revision_approved:
+        from_revision = _previous(revisions.filter(is_approved=True))
+    if from_revision is None:
+        from_revision = document.current_revision
 
-        diff = clean(
-            u''.join(
-                difflib.unified_diff(
-                    l10n.order_by('-created')[1].content.splitlines(1),
-                    revision.content.splitlines(1),
-                    fromfile=fromfile, tofile=tofile)
-                ),
-            ALLOWED_TAGS, ALLOWED_ATTRIBUTES)
-    elif revision_approved and approved.count() > 1:
-        doc = revision.document
-        approved_rev = approved.order_by('-created')[1]
-
-        fromfile = u'[%s] %s #%s' % (doc.locale, doc.title, approved_rev.id)
-        tofile = u'[%s] %s #%s' % (doc.locale, doc.title, revision.id)
-
-        diff = clean(
-            u''.join(
-                difflib.unified_diff(
-                    approved_rev.content.splitlines(1),
-                    revision.content.splitlines(1),
-                    fromfile=fromfile, tofile=tofile)
-                ),
-            ALLOWED_TAGS, ALLOWED_ATTRIBUTES)
-    elif revision.document.current_revision is not None:
-        fromfile = u'[%s] %s #%s' % (revision.document.locale,
-                                     revision.document.title,
-                                     revision.document.current_revision.id)
-        tofile = u'[%s] %s #%s' % (revision.document.locale,
-                                   revision.document.title,
+    diff = ''
+    if from_revision is not None:
+        fromfile = u'[%s] %s #%s' % (document.locale, document.title,
+                                     from_revision.id)
+        tofile = u'[%s] %s #%s' % (document.locale, document.title,
                                    revision.id)
-
-        diff = clean(
-            u''.join(
-                difflib.unified_diff(
-                    revision.document.current_revision.content.splitlines(1),
-                    revision.content.splitlines(1),
-                    fromfile=fromfile, tofile=tofile)
-                ),
-            ALLOWED_TAGS, ALLOWED_ATTRIBUTES)
+        diff = clean(unified_diff(from_revision, revision, fromfile, tofile),
+                     ALLOWED_TAGS, ALLOWED_ATTRIBUTES)
 
     return {
         'document_title': document.title,
@@ -249,11 +224,17 @@ class ApprovedOrReadyUnion(EventUnion):
         approved_url = reverse('wiki.document',
                                locale=document.locale,
                                args=[document.slug])
+        # The same for every mail, so only work them out once.
+        contexts = {}
+
         for user, watches in users_and_watches:
             if (is_ready and
                 ReadyRevisionEvent.event_type in
                     (w.event_type for w in watches)):
-                c = context_dict(revision, ready_for_l10n=True)
+                if 'ready' not in contexts:
+                    contexts['ready'] = context_dict(revision,
+                                                     ready_for_l10n=True)
+                c = dict(contexts['ready'])
                 c['watch'] = watches[0]  # TODO: Expose all watches.
                 # We should send a "ready" mail.
                 try:
@@ -269,7 +250,10 @@ class ApprovedOrReadyUnion(EventUnion):
                                    settings.TIDINGS_FROM_ADDRESS,
                                    [user.email])
             else:
-                c = context_dict(revision, revision_approved=True)
+                if 'approved' not in contexts:
+                    contexts['approved'] = context_dict(
+                        revision, revision_approved=True)
+                c = dict(contexts['approved'])
                 c['url'] = approved_url
                 c['watch'] = watches[0]  # TODO: Expose all watches.
                 c['reviewer'] = revision.reviewer.username
@@ -2,16 +2,14 @@ from jingo import register
 import jinja2
 
 from wiki import parser
-from wiki.diff import BetterHtmlDiff
+from wiki.diff import html_diff
 
 
 @register.function
-def diff_table(content_from, content_to):
-    """Creates an HTML diff of the passed in content_from and content_to."""
-    html_diff = BetterHtmlDiff()
-    diff = html_diff.make_table(content_from.splitlines(),
-                                content_to.splitlines(), context=True)
-    return jinja2.Markup(diff)
+def diff_table(revision_from, revision_to):
+    """Creates an HTML diff of the content of revision_from and
+    revision_to."""
+    return jinja2.Markup(html_diff(revision_from, revision_to))
 
 
 @register.function
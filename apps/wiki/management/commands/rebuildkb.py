@@ -0,0 +1,29 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wiki.rebuild import rebuild_kb_cmd
+
+
+class Command(BaseCommand):
+    help = 'Re-render the HTML of all the documents in the KB.'
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=1,
+                    help='Number of worker processes to render with'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False,
+                    help="List the documents whose HTML would change "
+                         "instead of changing it"),
+        make_option('--skip-unchanged', action='store_true',
+                    dest='skip_unchanged', default=False,
+                    help="Skip the documents whose revision, included "
+                         "documents and parser version haven't changed "
+                         "since they were rendered"),)
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('workers should be at least 1')
+        rebuild_kb_cmd(workers, options['dry_run'], options['skip_unchanged'])
@@ -0,0 +1,35 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wiki.benchmark import PHASES, wiki_bench_cmd
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the wiki parser on the largest KB articles.'
+    args = '[phase ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--count', type='int', dest='count', default=20,
+                    help='Number of articles to benchmark on'),
+        make_option('--runs', type='int', dest='runs', default=3,
+                    help='Number of times to run each phase per article'),
+        make_option('--locale', dest='locale', default=None,
+                    help='Only benchmark on articles in this locale'),
+        make_option('--check', action='store_true', dest='check',
+                    default=False,
+                    help='Check that the faster ways of rendering give the '
+                         'same HTML instead of timing them'),)
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        unknown = set(args) - set(PHASES)
+        if unknown:
+            raise CommandError('Unknown phases: %s. Choose from: %s' %
+                               (', '.join(sorted(unknown)),
+                                ', '.join(sorted(PHASES))))
+        if options['count'] < 1 or options['runs'] < 1:
+            raise CommandError('count and runs should be at least 1')
+
+        wiki_bench_cmd(options['count'], options['runs'], args or None,
+                       options['locale'], options['check'])
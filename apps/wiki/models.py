@@ -1,20 +1,22 @@
 from datetime import datetime
+import hashlib
 from urlparse import urlparse
 import time
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.urlresolvers import resolve
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models import Max, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.http import Http404
 
 from pyquery import PyQuery
 from tidings.models import NotificationsMixin
 from tower import ugettext_lazy as _lazy, ugettext as _
 
-from search import searcher
 from search.models import SearchMixin, register_for_indexing
 from search.utils import crc32
 from sumo import ProgrammingError
@@ -79,10 +81,21 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
     related_documents = models.ManyToManyField('self',
                                                through='RelatedDocument',
                                                symmetrical=False)
+    # Hash of the tags and fields my related documents were calculated
+    # from. See wiki.related.
+    related_hash = models.CharField(max_length=40, default='',
+                                    editable=False)
 
     # Cached HTML rendering of approved revision's wiki markup:
     html = models.TextField(editable=False)
 
+    # What html was rendered from: the version of the wiki parser and a hash
+    # of the revision and of the documents it included. KB rebuilds can skip
+    # documents where neither changed. See stamp_source().
+    parser_version = models.CharField(max_length=20, default='',
+                                      editable=False)
+    source_hash = models.CharField(max_length=40, default='', editable=False)
+
     # A document's category must always be that of its parent. If it has no
     # parent, it can do what it wants. This invariant is enforced in save().
     category = models.IntegerField(choices=CATEGORIES, db_index=True)
@@ -386,6 +399,38 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
     def __unicode__(self):
         return '[%s] %s' % (self.locale, self.title)
 
+    def set_dependencies(self, dependencies):
+        """Replace my DocumentDependencies with the given (class, title, id
+        or None) ones, as returned by Revision.render()."""
+        wanted = set((cls._meta.module_name, title, id_) for
+                     cls, title, id_ in dependencies)
+        current = dict(((d.kind, d.title, d.object_id), d.id) for d in
+                       DocumentDependency.uncached.filter(document=self))
+        stale = [pk for key, pk in current.iteritems() if key not in wanted]
+        if stale:
+            DocumentDependency.uncached.filter(pk__in=stale).delete()
+        for kind, title, id_ in wanted - set(current):
+            DocumentDependency.uncached.create(document=self, kind=kind,
+                                               title=title, object_id=id_)
+
+    def stamp_source(self, dependencies, current_revisions=None):
+        """Record that my html was just rendered from my current revision
+        and the given (class, title, id or None) dependencies, as returned by
+        Revision.render().
+
+        current_revisions -- get_current_revisions() of the dependencies, if
+            already looked up
+
+        """
+        from wiki.parser import PARSER_VERSION
+        dependencies = [(cls._meta.module_name, title, id_) for
+                        cls, title, id_ in dependencies]
+        if current_revisions is None:
+            current_revisions = get_current_revisions(dependencies)
+        self.parser_version = PARSER_VERSION
+        self.source_hash = get_source_hash(self.current_revision_id,
+                                           dependencies, current_revisions)
+
     def allows_revision_by(self, user):
         """Return whether `user` is allowed to create new revisions of me.
 
@@ -519,41 +564,50 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
             'indexed_on': {'type': 'integer'}}
 
     @classmethod
-    def extract_document(cls, obj_id):
-        obj = cls.objects.select_related(
-            'current_revision', 'parent').get(pk=obj_id)
-
-        d = {}
-        d['id'] = obj.id
-        d['model'] = cls.get_model_name()
-        d['title'] = obj.title
-        d['locale'] = obj.locale
-        d['parent_id'] = obj.parent.id if obj.parent else None
-        d['content'] = obj.html
-        d['category'] = obj.category
-        d['slug'] = obj.slug
-        d['is_archived'] = obj.is_archived
-        d['url'] = obj.get_absolute_url()
-
-        if obj.parent is None:
-            d['tag'] = [tag['name'] for tag in obj.tags.values()]
-        else:
-            # Translations inherit tags from their parents.
-            d['tag'] = [tag['name'] for tag in obj.parent.tags.values()]
-        if obj.current_revision:
-            d['summary'] = obj.current_revision.summary
-            d['keywords'] = obj.current_revision.keywords
-            d['updated'] = int(time.mktime(
-                    obj.current_revision.created.timetuple()))
-            d['current'] = obj.current_revision.id
-        else:
-            d['summary'] = None
-            d['keywords'] = None
-            d['updated'] = None
-            d['current'] = None
-
-        d['indexed_on'] = int(time.time())
-        return d
+    def extract_documents(cls, ids):
+        docs = list(cls.objects.select_related('current_revision', 'parent')
+                               .filter(pk__in=ids))
+
+        # Translations inherit tags from their parents, so get the tags
+        # of whichever document owns them in one go.
+        ct = ContentType.objects.get_for_model(cls)
+        tag_owner_ids = set(obj.parent_id or obj.id for obj in docs)
+        tags = {}
+        for obj_id, name in (TaggedItem.objects
+                                       .filter(content_type=ct,
+                                               object_id__in=tag_owner_ids)
+                                       .values_list('object_id',
+                                                    'tag__name')):
+            tags.setdefault(obj_id, []).append(name)
+
+        for obj in docs:
+            d = {}
+            d['id'] = obj.id
+            d['model'] = cls.get_model_name()
+            d['title'] = obj.title
+            d['locale'] = obj.locale
+            d['parent_id'] = obj.parent_id
+            d['content'] = obj.html
+            d['category'] = obj.category
+            d['slug'] = obj.slug
+            d['is_archived'] = obj.is_archived
+            d['url'] = obj.get_absolute_url()
+            d['tag'] = tags.get(obj.parent_id or obj.id, [])
+
+            if obj.current_revision:
+                d['summary'] = obj.current_revision.summary
+                d['keywords'] = obj.current_revision.keywords
+                d['updated'] = int(time.mktime(
+                        obj.current_revision.created.timetuple()))
+                d['current'] = obj.current_revision.id
+            else:
+                d['summary'] = None
+                d['keywords'] = None
+                d['updated'] = None
+                d['current'] = None
+
+            d['indexed_on'] = int(time.time())
+            yield d
 
     @classmethod
     def get_indexable(cls):
@@ -570,7 +624,8 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
         # we want to remove it from the index.
         if (document['current'] is None or
             document['content'].startswith(REDIRECT_HTML)):
-            cls.unindex(document['id'], es=kwargs.get('es', None))
+            cls.unindex(document['id'], es=kwargs.get('es'),
+                        indexes=kwargs.get('indexes'))
             return
         super(cls, cls).index(document, **kwargs)
 
@@ -591,6 +646,27 @@ register_for_indexing(
                   else None))
 
 
+def resolution_connector(sender, instance, **kwargs):
+    """Forget the cached document view resolutions a document shows up in.
+
+    Redirect creation and revision approval save documents, so this
+    catches those too.
+
+    """
+    if (isinstance(instance, Document) and
+        not kwargs.get('action', 'post_').startswith('pre_')):
+        from wiki.resolution import invalidate_resolutions
+        invalidate_resolutions(instance)
+
+post_save.connect(resolution_connector, sender=Document,
+                  dispatch_uid='wiki_document_resolutions_save')
+post_delete.connect(resolution_connector, sender=Document,
+                    dispatch_uid='wiki_document_resolutions_delete')
+m2m_changed.connect(resolution_connector,
+                    sender=Document.contributors.through,
+                    dispatch_uid='wiki_document_resolutions_contributors')
+
+
 class Revision(ModelBase):
     """A revision of a localized knowledgebase document"""
     document = models.ForeignKey(Document, related_name='revisions')
@@ -706,9 +782,11 @@ class Revision(ModelBase):
             # Update document denormalized fields
             if self.is_ready_for_localization:
                 self.document.latest_localizable_revision = self
-            self.document.html = self.content_parsed
+            self.document.html, dependencies = self.render()
             self.document.current_revision = self
+            self.document.stamp_source(dependencies)
             self.document.save()
+            self.document.set_dependencies(dependencies)
         elif (self.is_ready_for_localization and
               (not self.document.latest_localizable_revision or
                self.id > self.document.latest_localizable_revision.id)):
@@ -740,7 +818,8 @@ class Revision(ModelBase):
             new_current = latest_revision(self, Q(is_approved=True))
             document.update(
                 current_revision=new_current,
-                html=new_current.content_parsed if new_current else '')
+                html=new_current.content_parsed if new_current else '',
+                source_hash='')
 
         # Likewise, step the latest_localizable_revision field backward if
         # we're deleting that revision:
@@ -775,6 +854,12 @@ class Revision(ModelBase):
         return wiki_to_html(self.content, locale=self.document.locale,
                             doc_id=self.document.id)
 
+    def render(self, parse_cache=None):
+        """Return (html, dependencies) of my content. See render_wiki()."""
+        from wiki.parser import render_wiki
+        return render_wiki(self.content, locale=self.document.locale,
+                           doc_id=self.document.id, parse_cache=parse_cache)
+
     def can_be_readied_for_localization(self):
         """Return whether this revision has the prerequisites necessary for the
         user to mark it as ready for localization."""
@@ -806,6 +891,61 @@ class HelpfulVoteMetadata(ModelBase):
     value = models.CharField(max_length=1000)
 
 
+class HelpfulVoteRollup(ModelBase):
+    """Daily yes and no counts of the helpful votes on a revision.
+
+    Charts and reports read these instead of going through every vote.
+    They're kept up to date by the rollup_helpful_votes cron job, so they
+    lag the votes a bit.
+
+    """
+    document = models.ForeignKey(Document, related_name='vote_rollups')
+    revision = models.ForeignKey(Revision, related_name='vote_rollups')
+    day = models.DateField(db_index=True)
+    yes = models.PositiveIntegerField(default=0)
+    no = models.PositiveIntegerField(default=0)
+
+    class Meta(object):
+        unique_together = (('revision', 'day'),)
+
+    @classmethod
+    def roll_up(cls):
+        """Bring the rollups up to date with the votes.
+
+        Votes only ever get added for today, so the days before the last
+        one rolled up are done; that day and later get counted again.
+
+        """
+        last_day = cls.uncached.aggregate(day=Max('day'))['day']
+        cursor = connection.cursor()
+        where, params = '', []
+        if last_day:
+            # Not QuerySet.delete(), which commits: the day's rollups
+            # shouldn't go missing until they're remade.
+            cursor.execute('DELETE FROM wiki_helpfulvoterollup '
+                           'WHERE day >= %s', [last_day])
+            where, params = 'WHERE v.created >= %s', [last_day]
+
+        cursor.execute("""
+            INSERT INTO
+                wiki_helpfulvoterollup (document_id, revision_id, day,
+                                        yes, no)
+            SELECT
+                r.document_id,
+                v.revision_id,
+                DATE(v.created),
+                SUM(v.helpful),
+                SUM(NOT(v.helpful))
+            FROM
+                wiki_helpfulvote v JOIN
+                wiki_revision r ON v.revision_id = r.id
+            """ + where + """
+            GROUP BY
+                v.revision_id,
+                DATE(v.created)""", params)
+        transaction.commit_unless_managed()
+
+
 class ImportantDate(ModelBase):
     """Important date that shows up globally on metrics graphs."""
     text = models.CharField(max_length=100)
@@ -821,6 +961,76 @@ class RelatedDocument(ModelBase):
         ordering = ['-in_common']
 
 
+class DocumentDependency(ModelBase):
+    """A document, image or video whose contents a document's html includes.
+
+    The parser records these while rendering a document, looked up by title
+    and, if one was found, id. When something changes, only the documents
+    that depend on it need re-rendering.
+
+    """
+    document = models.ForeignKey(Document, related_name='dependencies')
+    # The module_name of the model depended on: document, image or video
+    kind = models.CharField(max_length=20)
+    title = models.CharField(max_length=255, db_index=True)
+    object_id = models.PositiveIntegerField(null=True, db_index=True)
+
+
+def get_dependents(kind, title, object_id, parent_id=None, locale=None):
+    """Return the ids of the documents whose html depends on the document,
+    image or video (see DocumentDependency.kind) with the given title and id.
+
+    That includes the documents depending on it through inclusions of
+    inclusions. A translation also counts as its parent for the documents in
+    its locale, since they may have included it through the parent.
+
+    """
+    def dependents(q, **kwargs):
+        return set(DocumentDependency.uncached.filter(q, **kwargs)
+                   .values_list('document', flat=True))
+
+    q = Q(title=title)
+    if object_id:
+        q |= Q(object_id=object_id)
+    found = dependents(q, kind=kind)
+    if parent_id:
+        found |= dependents(Q(object_id=parent_id), kind=kind,
+                            document__locale=locale)
+
+    new = found
+    while new:
+        new = dependents(Q(object_id__in=new), kind='document') - found
+        found |= new
+    return found
+
+
+def get_current_revisions(dependencies):
+    """Return {document id: current revision id} for the documents among
+    the (kind, title, id or None) dependencies."""
+    ids = set(id_ for kind, title, id_ in dependencies
+              if kind == 'document' and id_)
+    if not ids:
+        return {}
+    return dict(Document.uncached.filter(id__in=ids)
+                .values_list('id', 'current_revision'))
+
+
+def get_source_hash(revision_id, dependencies, current_revisions):
+    """Return a hash of what a document's html gets rendered from.
+
+    That's the revision and the (kind, title, id or None) dependencies, with
+    the current revisions of the documents among them (see
+    get_current_revisions()). Links aren't dependencies, so renaming a
+    document doesn't change the hash of the documents linking to it.
+
+    """
+    parts = [unicode(revision_id)]
+    for kind, title, id_ in sorted(dependencies):
+        current = current_revisions.get(id_) if kind == 'document' else None
+        parts.append(u'%s %s %s %s' % (kind, id_, current, title))
+    return hashlib.sha1(u'\n'.join(parts).encode('utf-8')).hexdigest()
+
+
 def _doc_components_from_url(url, required_locale=None, check_host=True):
     """Return (locale, path, slug) if URL is a Document, False otherwise.
 
@@ -859,14 +1069,3 @@ def points_to_document_view(url, required_locale=None):
             url, required_locale=required_locale)
     except _NotDocumentView:
         return False
-
-
-# NOTE: This only affects Sphinx search--it's not used in ES search.
-def wiki_searcher(request):
-    """Return a wiki document searcher with default parameters."""
-    return (searcher(request)(Document)
-            .query_fields('title__text',
-                          'content__text',
-                          'summary__text',
-                          'keywords__text')
-            .weight(title=6, content=1, keywords=4, summary=2))
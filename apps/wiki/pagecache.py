@@ -0,0 +1,93 @@
+"""Caching whole document pages for anonymous users
+
+Almost everyone reading the KB is anonymous, and they all get the same
+page, except for the helpful vote form, which people who already voted
+don't get, and the bits behind waffle flags, which can be on for some
+people and off for others. So the document view caches the page it
+renders for them with the vote forms and flagged bits marked (see the
+vote_form macro and base.html), and takes the marked things back out
+for people who shouldn't see them, a bit like ESI.
+
+Pages are keyed on the token of the document's resolution (see
+:py:mod:`wiki.resolution`), so anything that invalidates the
+resolution, like approving a revision or rebuilding the KB, purges the
+page too.
+
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from jingo_minify.helpers import build_ids
+from statsd import statsd
+import waffle
+
+from wiki.models import Revision
+
+
+VOTE_FORM_RE = re.compile(r'<!--vote-form-->.*?<!--/vote-form-->', re.S)
+FLAG_RE = re.compile(r'<!--flag:([\w-]+)-->(.*?)<!--/flag:\1-->', re.S)
+
+
+def is_cacheable(request):
+    """Return whether the page for a request can come from the cache."""
+    return (settings.WIKI_PAGE_CACHE_TIMEOUT and
+            request.method == 'GET' and not request.GET and
+            not request.user.is_authenticated() and
+            not len(messages.get_messages(request)))
+
+
+def _page_key(request, resolution):
+    # What an anonymous page depends on. The token changes whenever
+    # anything else about the document does.
+    parts = [request.get_host(), request.locale, resolution['document'],
+             resolution['revision'], resolution['token'],
+             int(bool(getattr(request, 'MOBILE', False))),
+             int(bool(request.COOKIES.get('show-editing-tools')))]
+    # The build ids change with every deploy, so template changes make
+    # new pages too.
+    parts.extend(sorted(build_ids(request).items()))
+    return 'wiki:page:%s' % hashlib.md5(repr(parts)).hexdigest()
+
+
+def fill_placeholders(request, html, resolution):
+    """Take the vote forms and flagged bits out of a cached page if they
+    shouldn't show."""
+    revision = resolution['revision']
+    if (waffle.switch_is_active('hide-voting') or not revision or
+        Revision(pk=revision).has_voted(request)):
+        html = VOTE_FORM_RE.sub('', html)
+    return FLAG_RE.sub(
+        lambda m: m.group(2) if waffle.flag_is_active(request, m.group(1))
+                  else '', html)
+
+
+def get_page(request, resolution):
+    """Return the cached page for a request as an HttpResponse, or None if
+    it isn't cached."""
+    html = cache.get(_page_key(request, resolution))
+    if html is None:
+        statsd.incr('wiki.page_cache.miss')
+        return None
+    statsd.incr('wiki.page_cache.hit')
+    return HttpResponse(fill_placeholders(request, html, resolution))
+
+
+def set_page(request, resolution, response):
+    """Cache the page rendered for a request and fill it in for the
+    request."""
+    # Waffle records the flags it rolled out by percentage or testing mode
+    # on the request. If any unmarked ones came up, the page has this
+    # request's answer baked in.
+    flagged = (getattr(request, 'waffles', None) or
+               getattr(request, 'waffle_tests', None))
+    if response.status_code == 200 and not flagged:
+        cache.set(_page_key(request, resolution), response.content,
+                  settings.WIKI_PAGE_CACHE_TIMEOUT)
+    response.content = fill_placeholders(request, response.content,
+                                         resolution)
+    return response
@@ -6,6 +6,9 @@ from xml.sax.saxutils import quoteattr
 from django.conf import settings
 
 from html5lib import HTMLParser
+from html5lib.constants import (booleanAttributes, headingElements,
+                                namespaces, scopingElements, spaceCharacters,
+                                specialElements, voidElements)
 from html5lib.serializer.htmlserializer import HTMLSerializer
 from html5lib.treebuilders import getTreeBuilder
 from html5lib.treewalkers import getTreeWalker
@@ -16,8 +19,7 @@ from tower import ugettext as _, ugettext_lazy as _lazy
 
 from gallery.models import Video
 import sumo.parser
-from sumo.parser import (ALLOWED_ATTRIBUTES, get_object_fallback,
-                         build_hook_params)
+from sumo.parser import ALLOWED_ATTRIBUTES, build_hook_params
 
 
 BLOCK_LEVEL_ELEMENTS = ['table', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5',
@@ -27,15 +29,149 @@ BLOCK_LEVEL_ELEMENTS = ['table', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5',
                                     # knows about (and thus preserves)
 VIDEO_PARAMS = ['height', 'width', 'modal', 'title', 'placeholder']
 TEMPLATE_ARG_REGEX = re.compile('{{{([^{]+?)}}}')
+# Bump the last part when a change to this parser changes the HTML it makes,
+# so KB rebuilds don't skip documents rendered with the old one. See
+# Document.parser_version.
+PARSER_VERSION = '%s.2' % sumo.parser.PARSER_VERSION
+
+# What ForParser.expand can stream through without building a tree. These
+# are elements html5lib doesn't do anything special with when they are in
+# their proper places.
+_STREAMABLE_ELEMENTS = frozenset([
+    'a', 'abbr', 'acronym', 'address', 'article', 'aside', 'b', 'bdo', 'big',
+    'blockquote', 'br', 'caption', 'center', 'cite', 'code', 'col',
+    'colgroup', 'dd', 'del', 'dfn', 'div', 'dl', 'dt', 'em', 'embed', 'font',
+    'footer', 'for', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'i',
+    'img', 'ins', 'kbd', 'li', 'nav', 'object', 'ol', 'p', 'param', 'pre',
+    'q', 's', 'samp', 'section', 'small', 'source', 'span', 'strike',
+    'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead',
+    'tr', 'tt', 'u', 'ul', 'var', 'video'])
+# Start tags that close an open <p>
+_CLOSES_P = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'center', 'dd', 'div', 'dl',
+    'dt', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li',
+    'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'])
+# Table parts -> the elements they belong in
+_TABLE_CHILDREN = {'caption': ('table',), 'colgroup': ('table',),
+                   'col': ('colgroup',), 'tbody': ('table',),
+                   'thead': ('table',), 'tfoot': ('table',),
+                   'tr': ('tbody', 'thead', 'tfoot'), 'td': ('tr',),
+                   'th': ('tr',)}
+_TABLE_PARENTS = frozenset(['table', 'colgroup', 'tbody', 'thead', 'tfoot',
+                            'tr'])
+_HEADING_ELEMENTS = frozenset(headingElements)
+_VOID_ELEMENTS = voidElements
+_SCOPING_ELEMENTS = frozenset(name for ns, name in scopingElements
+                              if ns == namespaces['html'])
+_SPECIAL_ELEMENTS = _SCOPING_ELEMENTS | frozenset(
+    name for ns, name in specialElements if ns == namespaces['html'])
+_SPACE_CHARACTERS = u''.join(spaceCharacters)
+_TAG = re.compile(r'<(/?)([a-z][a-z0-9]*)((?: [^\s"=/>]+(?:="[^"]*")?)*)>')
+_ATTR = re.compile(r' ([^\s"=/>]+)(="[^"]*")?')
+# html5lib escapes <, > and & in text and & in attributes, and would turn
+# any other entities into characters.
+_UNSTREAMABLE_TEXT = re.compile(u'[<>\r\x00]|&(?!(?:amp|lt|gt);)')
+_UNSTREAMABLE_ATTRS = re.compile(u'[\r\x00]|&(?!amp;)')
+_FOR_ATTRS = re.compile(r'(?: data-for="[^"]*")?$')
+
+# Heading lines of wiki markup, with the ='s on their left
+_HEADING_LINE = re.compile(r'^(=+)[^=\n][^\n]*=[ \t\r]*$', re.MULTILINE)
+# Things a document can't be split into sections in the middle of, as
+# (opener)|(closer)
+_SECTION_SPANNERS = [
+    re.compile(r'(\{for(?: +[^\}]*)?\})|(\{/for\})'),
+    re.compile(r'(\{note\})|(\{/note\})'),
+    re.compile(r'(\{warning\})|(\{/warning\})'),
+    re.compile(r'^[ \t]*(?:(\{\|)|(\|\}))', re.MULTILINE),
+    re.compile(r'(<!--)|(-->)')]
+# Any HTML element, like <div>, <ul>, <pre> or <nowiki>, can't be split
+# either. Void and self-closed elements don't need closing.
+_SECTION_TAG = re.compile(r'<(/?)([a-z][a-z0-9]*)\b[^>]*?(/?)>', re.IGNORECASE)
+# strip_fors() treats a {for} at the end of the text specially.
+_FOR_AT_END = re.compile(r'\{/?for[^\}]*\}\s*$')
+_HEADING_ID = re.compile(r'<h[1-6] id="([^"]*)"')
 
 
 def wiki_to_html(wiki_markup, locale=settings.WIKI_DEFAULT_LANGUAGE,
                  doc_id=None):
     """Wiki Markup -> HTML with the wiki app's enhanced parser"""
+    return render_wiki(wiki_markup, locale, doc_id)[0]
+
+
+def render_wiki(wiki_markup, locale=settings.WIKI_DEFAULT_LANGUAGE,
+                doc_id=None, parse_cache=None):
+    """Return (HTML, dependencies) for the wiki markup.
+
+    dependencies is a set of (class, title, id or None) of the documents,
+    images and videos that were included in the HTML, including the ones
+    included by inclusions.
+
+    parse_cache -- a ParseCache to share parsed templates and inclusions
+        with other renders
+
+    Markup longer than settings.WIKI_SECTION_RENDER_SIZE gets rendered a
+    section at a time when possible, which keeps memory use down.
+
+    """
+    parser = WikiParser(doc_id=doc_id, parse_cache=parse_cache)
     with statsd.timer('wiki.render'):
-        content = WikiParser(doc_id=doc_id).parse(wiki_markup, show_toc=False,
-                                                  locale=locale)
-    return content
+        content = None
+        if len(wiki_markup) > settings.WIKI_SECTION_RENDER_SIZE:
+            content = parser.parse_by_section(wiki_markup, show_toc=False,
+                                              locale=locale)
+        if content is None:
+            content = parser.parse(wiki_markup, show_toc=False,
+                                   locale=locale)
+    return content, parser.dependencies
+
+
+def _balanced(text):
+    """Return whether every _SECTION_SPANNERS thing and HTML element opened
+    in text is closed in it and vice versa."""
+    for spanner in _SECTION_SPANNERS:
+        depth = 0
+        for match in spanner.finditer(text):
+            depth += 1 if match.group(1) else -1
+            if depth < 0:
+                return False
+        if depth:
+            return False
+
+    open_tags = {}
+    for closing, name, self_closed in _SECTION_TAG.findall(text):
+        name = name.lower()
+        if name in _VOID_ELEMENTS or self_closed:
+            continue
+        depth = open_tags.get(name, 0) + (-1 if closing else 1)
+        if depth < 0:
+            return False
+        open_tags[name] = depth
+    return not any(open_tags.itervalues())
+
+
+def split_sections(text):
+    """Yield text in pieces that start at its top-level headings.
+
+    A piece gets more sections added to it until everything opened in it is
+    closed and it has something besides whitespace in it, so each piece
+    renders the same on its own as it does as part of the whole text.
+
+    """
+    headings = [(match.start(), len(match.group(1))) for match in
+                _HEADING_LINE.finditer(text)]
+    top = min([level for start, level in headings] or [0])
+    ends = [start for start, level in headings if level == top and start]
+    ends.append(len(text))
+
+    begin = 0
+    for end in ends:
+        piece = text[begin:end]
+        if end < len(text) and (not piece.strip() or
+                                not _balanced(piece) or
+                                _FOR_AT_END.search(piece)):
+            continue
+        yield piece
+        begin = end
 
 
 def _format_template_content(content, params):
@@ -94,19 +230,18 @@ PATTERNS = [
     (re.compile(pattern, re.DOTALL), replacement) for
     pattern, replacement in (
         # (x, y), replace x with y
-        (r'{(?P<name>note|warning)}', '<div class="\g<name>">'),
+        (r'\{(note|warning)\}', r'<div class="\1">'),
         (r'\{/(note|warning)\}', '</div>'),
         # To use } as a key, this syntax won't work. Use [[T:key|}]] instead
         (r'\{key (.+?)\}', _key_split),  # ungreedy: stop at the first }
-        (r'{(?P<name>button|menu|filepath|pref) (?P<content>.*?)}',
-         '<span class="\g<name>">\g<content></span>'),
+        (r'\{(button|menu|filepath|pref) (.*?)\}',
+         r'<span class="\1">\2</span>'),
     )]
+SIMPLE_SYNTAX = sumo.parser.SimpleSyntax(PATTERNS)
 
 
 def parse_simple_syntax(text):
-    for pattern, replacement in PATTERNS:
-        text = pattern.sub(replacement, text)
-    return text
+    return SIMPLE_SYNTAX.expand(text)
 
 
 class ForParser(object):
@@ -172,26 +307,171 @@ class ForParser(object):
                                     omit_optional_tags=False)
         return serializer.render(stream)[container_len:-container_len - 1]
 
+    @classmethod
+    def expand(cls, html):
+        """Return html with its <for> tags balanced and turned into spans
+        and divs.
+
+        Most of the time, the <for> tags are properly nested and the rest of
+        the HTML is already the way html5lib would serialize it, since the
+        wiki formatter's sanitizer ran it through html5lib. Then, balancing
+        doesn't change anything but the <for> tags, so we skip the parse tree
+        and expand them as we go. Anything we aren't sure html5lib would
+        leave alone gets the full round trip.
+
+        """
+        expanded = cls._expand_streaming(html)
+        if expanded is not None:
+            statsd.incr('wiki.for_parser.streamed')
+            return expanded
+        statsd.incr('wiki.for_parser.parsed')
+        for_parser = cls(html)
+        for_parser.expand_fors()
+        return for_parser.to_unicode()
+
+    @classmethod
+    def _expand_streaming(cls, html):
+        """Return what a round trip through ForParser would make of html, or
+        None if html has anything a round trip might change besides the
+        <for> tags.
+
+        Only a few things are allowed: lowercase tags, the elements in
+        _STREAMABLE_ELEMENTS nested and placed just the way html5lib
+        would have them, double-quoted attributes in html5lib's (sorted)
+        order, and escapes html5lib would write.
+
+        """
+        chunks = []
+        copied = 0  # html[:copied] has been dealt with
+        stack = []  # names of the open elements
+        # [chunk index, whether it holds a block, attrs] per open <for>:
+        fors = []
+        pos = 0
+        for match in _TAG.finditer(html):
+            start = match.start()
+            if start > pos and not cls._text_streamable(html, pos, start,
+                                                        stack):
+                return None
+            pos = match.end()
+
+            closing, name, attrs = match.groups()
+            parent = stack[-1] if stack else None
+            if closing:
+                if attrs or parent != name:
+                    return None
+                stack.pop()
+                if name == 'for':
+                    index, block, for_attrs = fors.pop()
+                    tag = 'div' if block else 'span'
+                    chunks[index] = u'<%s class="for"%s>' % (tag, for_attrs)
+                    chunks.append(html[copied:start])
+                    chunks.append(u'</%s>' % tag)
+                    copied = pos
+                continue
+
+            if not (cls._attrs_streamable(name, attrs) and
+                    cls._start_streamable(name, stack)):
+                return None
+            if parent == 'for' and name in BLOCK_LEVEL_ELEMENTS:
+                fors[-1][1] = True
+            if name == 'for':
+                if not _FOR_ATTRS.match(attrs):
+                    return None
+                chunks.append(html[copied:start])
+                fors.append([len(chunks), False, attrs])
+                chunks.append(None)  # We don't know the tag yet.
+                copied = pos
+            elif name == 'pre' and html.startswith('\n', pos):
+                # html5lib drops a newline at the start of a <pre>.
+                return None
+            if name not in _VOID_ELEMENTS:
+                stack.append(name)
+
+        if stack or not cls._text_streamable(html, pos, len(html), stack):
+            return None
+        if not chunks:
+            return html
+        chunks.append(html[copied:])
+        return u''.join(chunks)
+
     @staticmethod
-    def _on_own_line(match, postspace):
+    def _text_streamable(html, start, end, stack):
+        """Return whether html5lib would leave html[start:end], which is
+        text, alone."""
+        if _UNSTREAMABLE_TEXT.search(html, start, end):
+            return False
+        # Text in a table but outside its cells gets moved out of it,
+        # unless it's whitespace:
+        return (not stack or stack[-1] not in _TABLE_PARENTS or
+                not html[start:end].strip(_SPACE_CHARACTERS))
+
+    @staticmethod
+    def _attrs_streamable(name, attrs):
+        """Return whether html5lib would serialize the attributes of a start
+        tag the same way."""
+        if not attrs:
+            return True
+        if _UNSTREAMABLE_ATTRS.search(attrs):
+            return False
+        names = []
+        for attr, value in _ATTR.findall(attrs):
+            # html5lib leaves out the values of boolean attributes.
+            boolean = (attr in booleanAttributes.get(name, ()) or
+                       attr in booleanAttributes[''])
+            if boolean == bool(value):
+                return False
+            names.append(attr)
+        return names == sorted(set(names))
+
+    @staticmethod
+    def _start_streamable(name, stack):
+        """Return whether html5lib would just open an element called name
+        inside the open elements in stack."""
+        if name not in _STREAMABLE_ELEMENTS:
+            return False
+        parent = stack[-1] if stack else None
+        if parent in _TABLE_PARENTS or name in _TABLE_CHILDREN:
+            # Tables are only left alone if they have all their parts.
+            return parent in _TABLE_CHILDREN.get(name, ())
+        if name in ('li', 'dd', 'dt'):
+            # Opening a list item closes the open one.
+            stop = ('li',) if name == 'li' else ('dd', 'dt')
+            for open_name in reversed(stack):
+                if open_name in stop:
+                    return False
+                if (open_name in _SPECIAL_ELEMENTS and
+                    open_name not in ('address', 'div', 'p')):
+                    break
+        if name in _CLOSES_P:
+            for open_name in reversed(stack):
+                if open_name == 'p':
+                    return False
+                if open_name in _SCOPING_ELEMENTS:
+                    break
+        if name in _HEADING_ELEMENTS and parent in _HEADING_ELEMENTS:
+            return False
+        if name == 'a' and 'a' in stack:
+            return False
+        return True
+
+    @staticmethod
+    def _on_own_line(before, postspace, at_bottom):
         """Return (whether the tag is on its own line, whether the tag is at
         the very top of the string, whether the tag is at the very bottom of
         the string).
 
+        ``before`` is the character right before the tag, or '' if the tag is
+        at the very top. ``at_bottom`` is whether the tag and its trailing
+        whitespace end the string.
+
         Tolerates whitespace to the right of the tag: a tag with trailing
         whitespace on the line can still be considered to be on its own line.
 
         """
-        pos_before_tag = match.start(2) - 1
-        if pos_before_tag >= 0:
-            at_left = match.string[pos_before_tag] == '\n'
-            at_top = False
-        else:
-            at_left = at_top = True
-        at_bottom_modulo_space = match.end(4) == len(match.string)
-        at_right_modulo_space = at_bottom_modulo_space or '\n' in postspace
-        return (at_left and at_right_modulo_space,
-                at_top, at_bottom_modulo_space)
+        at_top = not before
+        at_left = at_top or before == '\n'
+        at_right_modulo_space = at_bottom or '\n' in postspace
+        return at_left and at_right_modulo_space, at_top, at_bottom
 
     @staticmethod
     def _wiki_to_tag(attrs):
@@ -216,31 +496,29 @@ class ForParser(object):
                 dehydrated fors for use with unstrip_fors).
 
         """
-        # Replace {for ...} tags:
+        def paragraph_padding(str):
+            """If str doesn't contain at least 2 newlines, return enough
+            such that appending them will cause it to."""
+            return '\n' * max(2 - str.count('\n'), 0)
+
         dehydrations = {}  # "attributes" of {for a, b} directives, like
                            # "a, b", keyed by token number
         indexes = count()
-
-        def dehydrate(match):
-            """Close over `dehydrations`, sock the {for}s away therein, and
-            replace {for}s and {/for}s with tokens."""
-            def paragraph_padding(str):
-                """If str doesn't contain at least 2 newlines, return enough
-                such that appending them will cause it to."""
-                return '\n' * max(2 - str.count('\n'), 0)
-
-            def preceding_whitespace(str, pos):
-                """Return all contiguous whitespace preceding str[pos]."""
-                whitespace = []
-                for i in xrange(pos - 1, 0, -1):
-                    if str[i] in '\t \n\r':
-                        whitespace.append(str[i])
-                    else:
-                        break
-                whitespace.reverse()
-                return ''.join(whitespace)
-
+        chunks = []
+        end = 0
+        # The last character of the output so far and the whitespace it
+        # ends with, which is what the next tag gets to see of previous
+        # replacements, so whitespace added in one can be considered for its
+        # role in helping to nudge an adjacent block-level {for} into its own
+        # paragraph. Between tags, the text ends with something other than
+        # whitespace, since the whitespace would have been part of the match.
+        last_char = whitespace = ''
+        for match in cls._FOR_OR_CLOSER.finditer(text):
             prespace, tag, attrs, postspace = match.groups()
+            if match.start() > end:
+                chunks.append(text[end:match.start()])
+                last_char, whitespace = text[match.start() - 1], ''
+            end = match.end()
 
             if tag != '{/for}':
                 i = indexes.next()
@@ -254,7 +532,8 @@ class ForParser(object):
             # has enough newlines on each side to make it its own paragraph,
             # lest it get sucked into being part of the next or previous
             # paragraph:
-            on_own_line, at_top, at_bottom = cls._on_own_line(match, postspace)
+            on_own_line, at_top, at_bottom = cls._on_own_line(
+                prespace[-1:] or last_char, postspace, end == len(text))
             if on_own_line:
                 # If tag (excluding leading whitespace) wasn't at top of
                 # document, space it off from preceding block elements:
@@ -262,31 +541,19 @@ class ForParser(object):
                     # If there are already enough \ns before the tag to
                     # distance it from the preceding paragraph, take them into
                     # account before adding more.
-                    prespace += paragraph_padding(
-                                    preceding_whitespace(match.string,
-                                                         match.start(1))
-                                    + prespace)
+                    prespace += paragraph_padding(whitespace + prespace)
 
                 # If tag (including trailing whitespace) wasn't at the bottom
                 # of the document, space it off from following block elements:
                 if not at_bottom:
                     postspace += paragraph_padding(postspace)
 
-            return prespace + token + postspace
+            chunks.append(prespace + token + postspace)
+            last_char = postspace[-1:] or token[-1]
+            whitespace = postspace[len(postspace.rstrip('\t \n\r')):]
 
-        # Do single replaces over and over, taking into account the effects of
-        # previous ones so that whitespace added in a previous replacement can
-        # be considered for its role in helping to nudge an adjacent block-
-        # level {for} into its own paragraph. There's no pos arg to replace(),
-        # so we had to write our own.
-        pos = 0
-        while True:
-            m = cls._FOR_OR_CLOSER.search(text, pos)
-            if m is None:
-                return text, dehydrations
-            done = text[:m.start()] + dehydrate(m)  # already been searched
-            pos = len(done)
-            text = done + text[m.end():]
+        chunks.append(text[end:])
+        return ''.join(chunks), dehydrations
 
     # Dratted wiki formatter likes to put <p> tags around my token when it sits
     # on a line by itself, so tolerate and consume that foolishness:
@@ -326,23 +593,61 @@ class ForParser(object):
 RECURSION_MESSAGE = _lazy(u'[Recursive inclusion of "%s"]')
 
 
+class ParseCache(object):
+    """Size-bounded LRU cache of parsed templates and inclusions
+
+    Keys are (kind of inclusion, document id, revision id, locale), so a new
+    revision never gets an old parse. A parser makes its own unless given
+    one; share one across the renders of a task to parse the templates
+    most articles use only once.
+
+    """
+    def __init__(self, size=None):
+        self.size = size or settings.WIKI_PARSE_CACHE_SIZE
+        self._items = {}  # key -> (last use, value)
+        self._clock = count()
+
+    def get(self, key):
+        """Return the value for key, or None if there is none."""
+        item = self._items.get(key)
+        if item is None:
+            statsd.incr('wiki.parse_cache.miss')
+            return None
+        statsd.incr('wiki.parse_cache.hit')
+        self._items[key] = (self._clock.next(), item[1])
+        return item[1]
+
+    def set(self, key, value):
+        if key not in self._items and len(self._items) >= self.size:
+            oldest = min(self._items, key=lambda k: self._items[k][0])
+            del self._items[oldest]
+        self._items[key] = (self._clock.next(), value)
+
+
 class WikiParser(sumo.parser.WikiParser):
     """An extension of the parser from the forums adding more crazy features
 
     {for} tags, inclusions, and templates--oh my!
 
     """
-    def __init__(self, base_url=None, doc_id=None):
+    simple_syntax = SIMPLE_SYNTAX
+
+    def __init__(self, base_url=None, doc_id=None, parse_cache=None):
         """
         doc_id -- If you want to be nice, pass the ID of the Document you are
             rendering. This will make recursive inclusions fail immediately
             rather than after the first round of recursion.
+        parse_cache -- ParseCache to get parsed templates and inclusions from
 
         """
         super(WikiParser, self).__init__(base_url)
 
         # Stack of document IDs to prevent Include or Template recursion:
         self.inclusions = [doc_id] if doc_id else []
+        # How many times that prevented recursion
+        self.recursions = 0
+        self.parse_cache = (parse_cache if parse_cache is not None
+                            else ParseCache())
 
         # The wiki has additional hooks not used elsewhere
         self.registerInternalLinkHook('Include', self._hook_include)
@@ -354,42 +659,122 @@ class WikiParser(sumo.parser.WikiParser):
 
     def parse(self, text, **kwargs):
         """Wrap SUMO's parse() to support additional wiki-only features."""
+        # Balance badly paired <for> tags and convert them to spans and divs:
+        return ForParser.expand(self._parse_unexpanded(text, **kwargs))
+
+    def parse_by_section(self, text, **kwargs):
+        """Like parse(), but a section at a time (see split_sections()).
+
+        Only the HTML of the sections done so far is kept around, rather than
+        every intermediate form of the whole text.
+
+        Return None if heading ids clash across sections, since parse() would
+        have numbered them.
+
+        """
+        html = []
+        dependencies = set()
+        pieces = list(split_sections(text))
+        for i, piece in enumerate(pieces):
+            if i == len(pieces) - 1:
+                html.append(self.parse(piece, **kwargs))
+            else:
+                # The newline before the next heading would be an extra
+                # blank line at the end of the piece, and the heading
+                # would have put one after what the piece ends with.
+                piece_html = self.parse(piece[:-1], **kwargs)
+                if not piece_html.endswith('\n'):
+                    piece_html += '\n'
+                html.append(piece_html)
+            # Each parse() starts its own dependencies.
+            dependencies |= self.dependencies
+        self.dependencies = dependencies
+        html = u''.join(html)
+
+        ids = _HEADING_ID.findall(html)
+        if len(ids) != len(set(ids)):
+            statsd.incr('wiki.render.sections_clashed')
+            return None
+        statsd.incr('wiki.render.sections')
+        return html
+
+    def _parse_unexpanded(self, text, **kwargs):
+        """Return the HTML for text with its <for> tags not yet expanded."""
         # Replace fors with inline tokens the wiki formatter will tolerate:
         text, data = ForParser.strip_fors(text)
 
-        # Do simple substitutions:
-        text = parse_simple_syntax(text)
-
-        # Run the formatter:
+        # Run the formatter, which does the simple substitutions first:
         html = super(WikiParser, self).parse(text, **kwargs)
 
         # Put the fors back in (as XML-ish <for> tags this time):
-        html = ForParser.unstrip_fors(html, data)
-
-        # Balance badly paired <for> tags:
-        for_parser = ForParser(html)
-
-        # Convert them to spans and divs:
-        for_parser.expand_fors()
+        return ForParser.unstrip_fors(html, data)
 
-        return for_parser.to_unicode()
+    def _object_lookups(self, space, name):
+        """Add the lookups of the wiki-only hooks."""
+        from wiki.models import Document
+        if space in ('Include', 'I'):
+            return [(Document, name, {})]
+        elif space in ('Template', 'T'):
+            return [(Document, 'Template:' + name.split('|', 1)[0],
+                     {'is_template': True})]
+        elif space in ('Video', 'V'):
+            return [(Video, name.split('|', 1)[0].strip(), {})]
+        return super(WikiParser, self)._object_lookups(space, name)
 
     def _hook_include(self, parser, space, title):
         """Returns the document's parsed content."""
         from wiki.models import Document
         message = _('The document "%s" does not exist.') % title
-        t = get_object_fallback(Document, title, locale=self.locale)
-        if not t or not t.current_revision:
+        t = self._get_object_fallback(Document, title, locale=self.locale)
+        self._add_dependency(Document, title, t)
+        if not t or not t.current_revision_id:
             return message
 
         if t.id in parser.inclusions:
+            parser.recursions += 1
             return RECURSION_MESSAGE % title
-        else:
-            parser.inclusions.append(t.id)
-        ret = parser.parse(t.current_revision.content, show_toc=False,
-                           locale=self.locale)
-        parser.inclusions.pop()
-        return ret
+        return parser._parse_inclusion('include', t)
+
+    def _parse_inclusion(self, kind, doc):
+        """Return the parsed content of the doc included as kind, 'include'
+        or 'template'.
+
+        Parses come from the parse cache when possible, adding the
+        dependencies the parse found. Parses that ran into recursive inclusion
+        depend on what included them, so they don't get cached.
+
+        """
+        key = (kind, doc.id, doc.current_revision_id, self.locale)
+        cached = self.parse_cache.get(key)
+        if cached is not None:
+            html, dependencies = cached
+            self.dependencies |= dependencies
+            return html
+
+        content = doc.current_revision.content
+        if kind == 'template':
+            content = content.rstrip()
+
+        recursions = self.recursions
+        outer_dependencies, self.dependencies = self.dependencies, set()
+        self.inclusions.append(doc.id)
+        # Note: this completely ignores the allowed attributes passed to the
+        # WikiParser.parse() method and defaults to ALLOWED_ATTRIBUTES.
+        html = self.parse(content, show_toc=False,
+                          attributes=ALLOWED_ATTRIBUTES, locale=self.locale)
+        self.inclusions.pop()
+
+        # Special case for inline templates
+        if kind == 'template' and '\n' not in content:
+            html = html.replace('<p>', '')
+            html = html.replace('</p>', '')
+
+        dependencies = self.dependencies
+        self.dependencies = outer_dependencies | dependencies
+
+        if self.recursions == recursions:
+            self.parse_cache.set(key, (html, dependencies))
+        return html
 
     # Wiki templates are documents that receive arguments.
     #
@@ -407,27 +792,18 @@ class WikiParser(sumo.parser.WikiParser):
 
         message = _('The template "%s" does not exist or has no approved '
                     'revision.') % short_title
-        t = get_object_fallback(Document, template_title,
-                                locale=self.locale, is_template=True)
+        t = self._get_object_fallback(Document, template_title,
+                                      locale=self.locale, is_template=True)
+        self._add_dependency(Document, template_title, t)
 
-        if not t or not t.current_revision:
+        if not t or not t.current_revision_id:
             return message
 
         if t.id in parser.inclusions:
+            parser.recursions += 1
             return RECURSION_MESSAGE % template_title
-        else:
-            parser.inclusions.append(t.id)
-        c = t.current_revision.content.rstrip()
-        # Note: this completely ignores the allowed attributes passed to the
-        # WikiParser.parse() method and defaults to ALLOWED_ATTRIBUTES.
-        parsed = parser.parse(c, show_toc=False, attributes=ALLOWED_ATTRIBUTES,
-                              locale=self.locale)
-        parser.inclusions.pop()
+        parsed = parser._parse_inclusion('template', t)
 
-        # Special case for inline templates
-        if '\n' not in c:
-            parsed = parsed.replace('<p>', '')
-            parsed = parsed.replace('</p>', '')
         # Do some string formatting to replace parameters
         return _format_template_content(parsed, _build_template_params(params))
 
@@ -442,7 +818,8 @@ class WikiParser(sumo.parser.WikiParser):
         # params, only modal supported for now
         title, params = build_hook_params(title, self.locale, VIDEO_PARAMS)
 
-        v = get_object_fallback(Video, title, self.locale, message)
+        v = self._get_object_fallback(Video, title, self.locale, message)
+        self._add_dependency(Video, title, v)
         if isinstance(v, basestring):
             return v
 
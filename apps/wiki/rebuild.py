@@ -0,0 +1,294 @@
+"""Re-rendering the KB
+
+Rendering is what takes the time, so :py:func:`rebuild_kb_with_progress`
+spreads the chunks of documents over a pool of worker processes, and
+can skip the documents whose source hasn't changed since they were
+rendered (see ``Document.stamp_source()``). Only the documents whose
+HTML actually changed get written, with a few bulk UPDATEs rather than
+a ``Document.save()`` each: nothing save() checks or cleans up depends
+on the HTML.
+
+"""
+import logging
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, reset_queries, transaction
+
+from multidb.pinning import pin_this_thread, unpin_this_thread
+from statsd import statsd
+
+from search.es_utils import format_time
+from search.models import generate_tasks
+from sumo.utils import chunked
+from wiki.models import (Document, DocumentDependency, get_current_revisions,
+                         get_source_hash, points_to_document_view)
+from wiki.parser import PARSER_VERSION, ParseCache
+from wiki.resolution import invalidate_resolutions
+
+
+log = logging.getLogger('k.wiki.rebuild')
+
+# This is present in memcached while the rebuildkb command runs and
+# holds "<ratio done> <seconds to go>". When it's done (even if it
+# crashes), the token is removed.
+WIKI_REBUILD_PROGRESS = 'sumo:wiki:rebuild_progress'
+
+# Number of documents per chunk
+CHUNK_SIZE = 100
+
+# Number of documents to write per UPDATE. HTML can be big, so
+# keep the statements well under max_allowed_packet.
+UPDATE_BATCH_SIZE = 20
+
+# The ParseCache of a worker process, shared by the chunks it renders
+_parse_cache = None
+
+
+def update_documents(docs, fields):
+    """Write fields of documents without going through save().
+
+    Cached queries of the documents need invalidating afterward if that
+    matters.
+
+    """
+    table = Document._meta.db_table
+    cursor = connection.cursor()
+    for batch in chunked(sorted(docs, key=lambda doc: doc.id),
+                         UPDATE_BATCH_SIZE):
+        cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+        sets = ', '.join('%s = CASE id %s END' % (field, cases)
+                         for field in fields)
+        params = [value for field in fields for doc in batch
+                  for value in (doc.id, getattr(doc, field))]
+        params.extend(doc.id for doc in batch)
+        cursor.execute('UPDATE %s SET %s WHERE id IN (%s)' %
+                       (table, sets, ', '.join(['%s'] * len(batch))),
+                       params)
+    transaction.commit_unless_managed()
+
+
+def stale_documents(docs):
+    """Return the documents whose html may be out of date.
+
+    Those are the ones rendered with another version of the parser or
+    from a revision or included documents that aren't current any more.
+
+    """
+    dependencies = {}
+    for doc_id, kind, title, id_ in (
+            DocumentDependency.uncached
+            .filter(document__in=[doc.id for doc in docs])
+            .values_list('document', 'kind', 'title', 'object_id')):
+        dependencies.setdefault(doc_id, []).append((kind, title, id_))
+    current_revisions = get_current_revisions(
+        [d for ds in dependencies.itervalues() for d in ds])
+    return [doc for doc in docs if
+            doc.parser_version != PARSER_VERSION or
+            doc.source_hash != get_source_hash(
+                doc.current_revision_id, dependencies.get(doc.id, []),
+                current_revisions)]
+
+
+def rebuild_chunk(ids, dry_run=False, parse_cache=None,
+                  skip_unchanged=False):
+    """Re-render the current revisions of a chunk of documents.
+
+    The documents whose HTML changed get it written and reindexed, and
+    everyone's dependencies and source stamps get updated.
+
+    :arg ids: ids of the documents
+    :arg dry_run: if True, only work out whose HTML would change
+    :arg parse_cache: ParseCache to share with other chunks
+    :arg skip_unchanged: if True, skip the documents whose source hasn't
+        changed since they were rendered; see
+        :py:func:`stale_documents`. Links to renamed documents don't
+        count as changes.
+
+    :returns: ``(changed, messages)``, where changed is a sorted list of
+        ``(id, u'[locale] title')`` of the documents whose HTML changed
+        (or would have) and messages is a list of problems to report
+
+    """
+    pin_this_thread()  # Stick to master.
+    try:
+        docs = list(Document.uncached.select_related('current_revision')
+                                     .filter(pk__in=ids))
+        messages = ['Missing document: %d' % pk for pk in
+                    sorted(set(ids) - set(doc.id for doc in docs))]
+        docs = [doc for doc in docs if doc.current_revision]
+        if skip_unchanged:
+            docs = stale_documents(docs)
+        if parse_cache is None:
+            # Most documents use the same few templates, so parse them
+            # only once.
+            parse_cache = ParseCache()
+
+        rendered = []
+        for doc in docs:
+            # If we know a redirect link to be broken (i.e. if it looks
+            # like a link to a document but the document isn't there),
+            # log an error:
+            url = doc.redirect_url()
+            if (url and points_to_document_view(url) and
+                not doc.redirect_document()):
+                log.error('Invalid redirect document: %d' % doc.id)
+
+            # Spare render() looking the document up again.
+            rev = doc.current_revision
+            rev.document = doc
+            html, dependencies = rev.render(parse_cache)
+            rendered.append((doc, html, dependencies))
+            if not dry_run:
+                doc.set_dependencies(dependencies)
+
+        current_revisions = get_current_revisions(
+            [(cls._meta.module_name, title, id_)
+             for doc, html, dependencies in rendered
+             for cls, title, id_ in dependencies])
+        changed, restamped = [], []
+        for doc, html, dependencies in rendered:
+            stamp = doc.parser_version, doc.source_hash
+            doc.stamp_source(dependencies, current_revisions)
+            if html != doc.html:
+                doc.html = html
+                changed.append(doc)
+            elif stamp != (doc.parser_version, doc.source_hash):
+                restamped.append(doc)
+
+        if not dry_run:
+            if changed:
+                update_documents(changed, ['html', 'parser_version',
+                                           'source_hash'])
+                Document.objects.invalidate(*changed)
+                for doc in changed:
+                    # Purges the cached pages showing the old HTML too.
+                    invalidate_resolutions(doc)
+                    doc.index_later()
+                # There's no request to finish and file the indexing
+                # tasks.
+                generate_tasks()
+            if restamped:
+                # Nothing shows the stamps, so cached queries can keep
+                # their old ones.
+                update_documents(restamped, ['parser_version',
+                                             'source_hash'])
+
+        return sorted((doc.id, unicode(doc)) for doc in changed), messages
+    finally:
+        unpin_this_thread()
+
+
+def _init_worker():
+    global _parse_cache
+    _parse_cache = ParseCache()
+
+
+def _rebuild_chunk_worker(task):
+    """Rebuild a chunk in a worker process.
+
+    Only takes and returns picklable things.
+
+    :arg task: ``(ids, dry_run, skip_unchanged)`` tuple
+
+    :returns: ``(number of ids, changed, messages)``; see
+        :py:func:`rebuild_chunk`
+
+    """
+    ids, dry_run, skip_unchanged = task
+    try:
+        changed, messages = rebuild_chunk(ids, dry_run, _parse_cache,
+                                          skip_unchanged)
+    except Exception, exc:
+        log.exception('Unable to rebuild chunk starting at %d', ids[0])
+        changed, messages = [], ['%s rebuilding %s: %s' %
+                                 (exc.__class__.__name__, ids, exc)]
+    finally:
+        # With DEBUG=True, Django keeps every query around.
+        reset_queries()
+    return len(ids), changed, messages
+
+
+def rebuild_kb_with_progress(workers=1, dry_run=False,
+                             skip_unchanged=False):
+    """Re-render the KB as you iterate over progress.
+
+    :arg workers: Number of worker processes to render with. With 1,
+        everything is rendered in this process.
+    :arg dry_run: Don't write anything, just find out which documents'
+        HTML would change.
+    :arg skip_unchanged: Skip the documents whose source hasn't changed
+        since they were rendered. See :py:func:`rebuild_chunk`.
+
+    Yields ``(ratio done, changed, messages)`` per chunk; see
+    :py:func:`rebuild_chunk`.
+
+    """
+    ids = list(Document.uncached.filter(current_revision__isnull=False)
+                                .values_list('id', flat=True))
+    if not ids:
+        return
+    tasks = [(chunk, dry_run, skip_unchanged)
+             for chunk in chunked(ids, CHUNK_SIZE)]
+
+    pool = None
+    try:
+        if workers > 1:
+            # Worker processes must not share our db connection, so
+            # close it and let everyone open their own.
+            connection.close()
+            pool = multiprocessing.Pool(workers, _init_worker)
+            results = pool.imap_unordered(_rebuild_chunk_worker, tasks)
+        else:
+            _init_worker()
+            results = (_rebuild_chunk_worker(task) for task in tasks)
+
+        done = 0
+        for num, changed, messages in results:
+            done += num
+            yield float(done) / len(ids), changed, messages
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def rebuild_kb_cmd(workers=1, dry_run=False, skip_unchanged=False):
+    """Re-render all the documents in the KB
+
+    Progress is logged and published to memcached.
+
+    See :py:func:`rebuild_kb_with_progress` for argument details.
+
+    """
+    start = last_update = time.time()
+    all_changed = []
+    try:
+        cache.set(WIKI_REBUILD_PROGRESS, '0.00100 0')
+        for ratio, changed, messages in rebuild_kb_with_progress(
+                workers, dry_run, skip_unchanged):
+            all_changed.extend(changed)
+            for message in messages:
+                log.error(message)
+
+            now = time.time()
+            if now > last_update + settings.ES_REINDEX_PROGRESS_BAR_INTERVAL:
+                last_update = now
+                to_go = (now - start) * (1 - ratio) / ratio
+                cache.set(WIKI_REBUILD_PROGRESS, '%.5f %d' % (ratio, to_go))
+                log.info('%.1f%% done (%s so far, about %s to go)',
+                         ratio * 100, format_time(now - start),
+                         format_time(to_go))
+    finally:
+        cache.delete(WIKI_REBUILD_PROGRESS)
+
+    seconds = time.time() - start
+    statsd.timing('wiki.rebuild_kb', int(round(seconds * 1000)))
+    if dry_run:
+        for pk, doc in sorted(all_changed):
+            log.info('Would change %d: %s', pk, doc)
+        log.info('HTML of %d documents would change.', len(all_changed))
+    else:
+        log.info('HTML of %d documents changed.', len(all_changed))
+    log.info('done! (%s)', format_time(seconds))
@@ -0,0 +1,177 @@
+"""Working out which documents are related
+
+Two documents in the same locale and category are related if they
+share more than one tag. Rather than recalculating every pair, each
+run builds an index of tags to documents from one scan of the tags and
+compares what each document's related documents depend on (see
+:py:func:`_related_hash`) to what they were last calculated from. Only
+the pairs involving documents that changed get recalculated.
+
+Tags on more than ``WIKI_RELATED_MAX_TAG_DOCS`` documents don't say
+much about a document and would make for huge candidate lists, so they
+count toward the tags in common but don't bring up candidates by
+themselves. Which of a document's tags are over that limit is part of
+its hash, so when other documents push a tag over the limit or below
+it, every document with the tag gets recalculated.
+
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from statsd import statsd
+
+from sumo.redis_utils import redis_client, RedisError
+from sumo.utils import chunked
+from taggit.models import TaggedItem
+from wiki.models import Document
+from wiki.rebuild import update_documents
+from wiki.resolution import invalidate_resolutions
+
+
+log = logging.getLogger('k.wiki.related')
+
+# Number of rows to write per INSERT
+INSERT_BATCH_SIZE = 500
+
+
+def _related_hash(locale, category, current_revision_id, is_archived,
+                  tag_ids, popular_tag_ids):
+    """Return a hash of what a document's related documents depend on.
+
+    ``popular_tag_ids`` are the ones of ``tag_ids`` that are on too many
+    documents to bring up candidates.
+
+    """
+    return hashlib.sha1(repr((locale, category, current_revision_id is None,
+                              is_archived, sorted(tag_ids),
+                              sorted(popular_tag_ids)))).hexdigest()
+
+
+def _related_pairs(doc_id, docs, tags, index, max_tag_docs):
+    """Yield the ``(document id, related id, tags in common)`` pairs doc is
+    in, either way round."""
+    locale, category, rev_id, is_archived = docs[doc_id][:4]
+    if rev_id is None:
+        return
+    candidates = set()
+    for tag_id in tags.get(doc_id, ()):
+        posting = index.get((locale, category, tag_id), ())
+        if len(posting) <= max_tag_docs:
+            candidates.update(posting)
+    candidates.discard(doc_id)
+
+    for other_id in candidates:
+        in_common = len(tags[doc_id] & tags[other_id])
+        if in_common > 1:
+            if not docs[other_id][3]:
+                yield doc_id, other_id, in_common
+            if not is_archived:
+                yield other_id, doc_id, in_common
+
+
+def _forget_translated_related(doc_ids):
+    """Drop the cached related documents of translations of the documents;
+    see wiki.utils.find_related_documents."""
+    keys = ['translated_doc_id:%s' % pk for pk in
+            Document.uncached.filter(parent__in=doc_ids)
+                             .values_list('id', flat=True)]
+    if not keys:
+        return
+    try:
+        redis_client('default').delete(*keys)
+    except RedisError as e:
+        statsd.incr('redis.errror')
+        log.error('Redis error: %s' % e)
+
+
+def update_related_documents(max_tag_docs=None):
+    """Recalculate the related documents of documents that changed.
+
+    :arg max_tag_docs: tags on more documents than this in a locale and
+        category don't bring up candidates; defaults to
+        ``settings.WIKI_RELATED_MAX_TAG_DOCS``
+
+    :returns: the number of documents whose related documents were
+        recalculated
+
+    """
+    if max_tag_docs is None:
+        max_tag_docs = settings.WIKI_RELATED_MAX_TAG_DOCS
+
+    docs = dict((row[0], row[1:]) for row in Document.uncached.values_list(
+        'id', 'locale', 'category', 'current_revision', 'is_archived',
+        'related_hash'))
+    tags = {}
+    ct = ContentType.objects.get_for_model(Document)
+    for doc_id, tag_id in (TaggedItem.objects.filter(content_type=ct)
+                                     .values_list('object_id', 'tag')):
+        if doc_id in docs:
+            tags.setdefault(doc_id, set()).add(tag_id)
+
+    # The inverted index: (locale, category, tag) -> documents with
+    # content
+    index = {}
+    for doc_id, doc_tags in tags.iteritems():
+        locale, category, rev_id = docs[doc_id][:3]
+        if rev_id is not None:
+            for tag_id in doc_tags:
+                index.setdefault((locale, category, tag_id), []).append(
+                    doc_id)
+
+    changed = []
+    for doc_id, (locale, category, rev_id, is_archived,
+                 related_hash) in docs.iteritems():
+        doc_tags = tags.get(doc_id, ())
+        popular = [tag_id for tag_id in doc_tags if
+                   len(index.get((locale, category, tag_id), ())) >
+                   max_tag_docs]
+        new_hash = _related_hash(locale, category, rev_id, is_archived,
+                                 doc_tags, popular)
+        if new_hash != related_hash:
+            changed.append(Document(id=doc_id, related_hash=new_hash))
+    if not changed:
+        return 0
+    changed_ids = [doc.id for doc in changed]
+
+    pairs = {}
+    for doc_id in changed_ids:
+        for doc, related, in_common in _related_pairs(
+                doc_id, docs, tags, index, max_tag_docs):
+            pairs[doc, related] = in_common
+
+    cursor = connection.cursor()
+    affected = set(changed_ids)
+    for batch in chunked(changed_ids, INSERT_BATCH_SIZE):
+        where = ('document_id IN (%(ids)s) OR related_id IN (%(ids)s)' %
+                 {'ids': ', '.join(['%s'] * len(batch))})
+        cursor.execute('SELECT document_id, related_id '
+                       'FROM wiki_relateddocument WHERE ' + where,
+                       batch * 2)
+        for doc, related in cursor.fetchall():
+            affected.update([doc, related])
+        cursor.execute('DELETE FROM wiki_relateddocument WHERE ' + where,
+                       batch * 2)
+    rows = sorted((doc, related, in_common) for (doc, related), in_common
+                  in pairs.iteritems())
+    for batch in chunked(rows, INSERT_BATCH_SIZE):
+        cursor.execute(
+            'INSERT INTO wiki_relateddocument '
+            '(document_id, related_id, in_common) VALUES ' +
+            ', '.join(['(%s, %s, %s)'] * len(batch)),
+            [value for row in batch for value in row])
+        for doc, related, in_common in batch:
+            affected.update([doc, related])
+    update_documents(changed, ['related_hash'])  # Commits.
+
+    # Whatever showed the old related documents is out of date now.
+    _forget_translated_related(list(affected))
+    for doc in Document.uncached.select_related('parent').filter(
+            pk__in=list(affected)):
+        invalidate_resolutions(doc)
+
+    statsd.incr('wiki.related.changed', len(changed))
+    return len(changed)
@@ -0,0 +1,124 @@
+"""Working out which document a (locale, slug) URL shows
+
+The document view needs the document, whether it's falling back to
+the default language, whether it's a redirect and the related
+documents and contributors. Working that out takes a chain of queries,
+so :py:func:`resolve_document` caches the outcome per (locale, slug).
+Saving or deleting a document, re-rendering it in a rebuild or
+changing its related documents (see :py:mod:`wiki.related`)
+invalidates the resolutions it can show up in (see
+:py:func:`invalidate_resolutions`).
+
+"""
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from wiki.models import Document
+from wiki.utils import find_related_documents
+
+
+# What a (locale, slug) that shows no document resolves to in the cache
+_MISSING = 'missing'
+
+
+def _resolution_key(locale, slug):
+    # Slugs can be long and have anything in them, so hash them.
+    return 'wiki:resolution:%s:%s' % (
+        locale, hashlib.md5(slug.encode('utf-8')).hexdigest())
+
+
+def _resolve(locale, slug):
+    """Return the uncached resolution of a (locale, slug); see
+    :py:func:`resolve_document`."""
+    fallback_reason = None
+    # If a slug isn't available in the requested locale, fall back to en-US:
+    try:
+        doc = Document.objects.get(locale=locale, slug=slug)
+        if (not doc.current_revision and doc.parent and
+            doc.parent.current_revision):
+            # This is a translation but its current_revision is None
+            # and OK to fall back to parent (parent is approved).
+            fallback_reason = 'translation_not_approved'
+        elif not doc.current_revision:
+            # No current_revision, no parent with current revision, so
+            # nothing to show.
+            fallback_reason = 'no_content'
+    except Document.DoesNotExist:
+        # Look in default language:
+        try:
+            doc = Document.objects.get(locale=settings.WIKI_DEFAULT_LANGUAGE,
+                                       slug=slug)
+        except Document.DoesNotExist:
+            return None
+        # If there's a translation to the requested locale, take it:
+        translation = doc.translated_to(locale)
+        if translation:
+            return {'translation_url': translation.get_absolute_url()}
+        elif doc.current_revision:
+            # There is no translation
+            # and OK to fall back to parent (parent is approved).
+            fallback_reason = 'no_translation'
+
+    return {'document': doc.id,
+            'revision': doc.current_revision_id,
+            # Changes every time the resolution is worked out, so things
+            # cached along with it (see wiki.pagecache) can key on it.
+            'token': '%x' % random.getrandbits(64),
+            'locale': doc.locale,
+            'fallback_reason': fallback_reason,
+            'redirect_url': doc.redirect_url(locale),
+            'related': [d.id for d in find_related_documents(doc)],
+            'contributors': list(doc.contributors.all())}
+
+
+def resolve_document(locale, slug):
+    """Return what the document view shows for a slug in a locale.
+
+    That's None if there's no such document in the locale or the default
+    language, or a dict with either
+
+    * ``translation_url``: the URL of the translation of the default
+      language document to redirect to, or
+    * ``document``: the id of the document to show, ``revision``: the
+      id of its current revision, ``token``: a string that changes
+      whenever the resolution gets invalidated, ``locale``: the
+      document's locale, ``fallback_reason``: why it's not in the
+      requested locale or has no content, if it isn't or doesn't,
+      ``redirect_url``: where the document redirects to, if it's a
+      redirect, ``related``: the ids of the related documents, in order,
+      and ``contributors``: the list of contributing Users.
+
+    """
+    key = _resolution_key(locale, slug)
+    resolution = cache.get(key)
+    if resolution is None:
+        resolution = _resolve(locale, slug)
+        cache.set(key, _MISSING if resolution is None else resolution,
+                  settings.WIKI_RESOLUTION_CACHE_TIMEOUT)
+    elif resolution == _MISSING:
+        resolution = None
+    return resolution
+
+
+def invalidate_resolutions(doc):
+    """Forget the cached resolutions that saving or deleting doc affects."""
+    slugs = [doc.slug]
+    if hasattr(doc, 'old_slug'):
+        slugs.append(doc.old_slug)
+
+    keys = [_resolution_key(doc.locale, slug) for slug in slugs]
+    if doc.locale == settings.WIKI_DEFAULT_LANGUAGE:
+        # Every locale can fall back to me, and my translations show
+        # whether I have content.
+        keys.extend(_resolution_key(locale, slug) for slug in slugs
+                    for locale in settings.SUMO_LANGUAGES)
+        if doc.id:
+            keys.extend(_resolution_key(locale, slug) for locale, slug in
+                        doc.translations.values_list('locale', 'slug'))
+    elif doc.parent_id:
+        # A missing slug in my locale can redirect to me via my parent.
+        keys.append(_resolution_key(doc.locale, doc.parent.slug))
+    cache.delete_many(keys)
@@ -4,22 +4,19 @@ import time
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.cache import cache
-from django.core.exceptions import ValidationError
 from django.core.mail import send_mail, mail_admins
-from django.db import transaction
 from django.template import Context, loader
 
 import celery.conf
 from celery.decorators import task
-from multidb.pinning import pin_this_thread, unpin_this_thread
 from statsd import statsd
 from tower import ugettext as _
 import waffle
 
 from sumo.urlresolvers import reverse
 from sumo.utils import chunked
-from wiki.models import (Document, points_to_document_view, SlugCollision,
-                         TitleCollision)
+from wiki.models import Document, get_dependents
+from wiki.rebuild import rebuild_chunk
 
 
 log = logging.getLogger('k.task')
@@ -94,6 +91,33 @@ def schedule_rebuild_kb():
     rebuild_kb.delay()
 
 
+def schedule_rebuild_dependents(obj):
+    """Schedule re-rendering the documents whose html includes the document,
+    image or video obj.
+
+    Call this before deleting obj, while it still has its id.
+
+    """
+    rebuild_dependents.delay(obj._meta.module_name, obj.title, obj.id,
+                             getattr(obj, 'parent_id', None),
+                             getattr(obj, 'locale', None))
+
+
+@task
+def rebuild_dependents(kind, title, object_id, parent_id=None, locale=None):
+    """Re-render the documents that depend on something, in chunks.
+
+    See wiki.models.get_dependents() for the arguments.
+
+    """
+    d = sorted(get_dependents(kind, title, object_id, parent_id, locale))
+    log.info('Rebuilding %s documents depending on %s %s.' %
+             (len(d), kind, object_id))
+
+    for chunk in chunked(d, 100):
+        _rebuild_kb_chunk.apply_async(args=[chunk])
+
+
 @task(rate_limit='3/h')
 def rebuild_kb():
     """Re-render all documents in the KB in chunks."""
@@ -116,43 +140,14 @@ def _rebuild_kb_chunk(data, **kwargs):
     """
     log.info('Rebuilding %s documents.' % len(data))
 
-    pin_this_thread()  # Stick to master.
-
-    messages = []
     start = time.time()
-    for pk in data:
-        message = None
-        try:
-            document = Document.objects.get(pk=pk)
-
-            # If we know a redirect link to be broken (i.e. if it looks like a
-            # link to a document but the document isn't there), log an error:
-            url = document.redirect_url()
-            if (url and points_to_document_view(url) and
-                not document.redirect_document()):
-                log.error('Invalid redirect document: %d' % pk)
-
-            document.html = document.current_revision.content_parsed
-            document.save()
-        except Document.DoesNotExist:
-            message = 'Missing document: %d' % pk
-        except ValidationError as e:
-            message = 'ValidationError for %d: %s' % (pk, e.messages[0])
-        except SlugCollision:
-            message = 'SlugCollision: %d' % pk
-        except TitleCollision:
-            message = 'TitleCollision: %d' % pk
-
-        if message:
-            log.debug(message)
-            messages.append(message)
+    changed, messages = rebuild_chunk(data)
     d = time.time() - start
     statsd.timing('wiki.rebuild_chunk', int(round(d * 1000)))
 
+    for message in messages:
+        log.debug(message)
     if messages:
         subject = ('[%s] Exceptions raised in _rebuild_kb_chunk()' %
                    settings.PLATFORM_NAME)
         mail_admins(subject=subject, message='\n'.join(messages))
-    transaction.commit_unless_managed()
-
-    unpin_this_thread()  # Not all tasks need to do use the master.
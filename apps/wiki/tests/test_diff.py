@@ -0,0 +1,43 @@
+import difflib
+
+from nose.tools import eq_
+
+from sumo.tests import TestCase
+from wiki.diff import html_diff, unified_diff
+from wiki.models import Revision
+from wiki.tests import revision
+
+
+class DiffTests(TestCase):
+    fixtures = ['users.json']
+
+    def setUp(self):
+        super(DiffTests, self).setUp()
+        self.rev_from = revision(content=u'One\nTwo\nThree\n\nFour\nFive',
+                                 save=True)
+        self.rev_to = revision(document=self.rev_from.document,
+                               content=u'One\nTwo\n3\n\nFour\nFive\nSix\n',
+                               save=True)
+
+    def test_unified_diff(self):
+        """The diff is the same as difflib's."""
+        eq_(u''.join(difflib.unified_diff(
+                self.rev_from.content.splitlines(True),
+                self.rev_to.content.splitlines(True),
+                fromfile=u'from', tofile=u'to')),
+            unified_diff(self.rev_from, self.rev_to, u'from', u'to'))
+
+    def test_no_changes(self):
+        eq_(u'', unified_diff(self.rev_from, self.rev_from, u'a', u'b'))
+
+    def test_cached(self):
+        """Diffs are worked out once per pair of revisions."""
+        diff = unified_diff(self.rev_from, self.rev_to, u'from', u'to')
+        table = html_diff(self.rev_from, self.rev_to)
+        rev_to = Revision(id=self.rev_to.id, content=u'Changed')
+        eq_(diff, unified_diff(self.rev_from, rev_to, u'from', u'to'))
+        eq_(table, html_diff(self.rev_from, rev_to))
+
+        # The headers aren't cached along with the diff.
+        assert unified_diff(self.rev_from, rev_to, u'a', u'b').startswith(
+            u'--- a\n+++ b\n')
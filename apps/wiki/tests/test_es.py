@@ -40,6 +40,12 @@ class TestPostUpdate(ElasticTestCase):
         doc_dict = Document.extract_document(doc2.id)
         eq_(doc_dict['tag'], [u'desktop', u'windows'])
 
+        # Same thing when they're extracted together.
+        docs = dict((d['id'], d) for d in
+                    Document.extract_documents([doc1.id, doc2.id]))
+        eq_(docs[doc1.id]['tag'], [u'desktop', u'windows'])
+        eq_(docs[doc2.id]['tag'], [u'desktop', u'windows'])
+
     def test_wiki_tags(self):
         """Make sure that adding tags to a Document causes it to
         refresh the index.
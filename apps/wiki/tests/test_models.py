@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from nose.tools import eq_
 from taggit.models import TaggedItem
@@ -8,12 +8,14 @@ from django.core.exceptions import ValidationError
 from sumo import ProgrammingError
 from sumo.tests import TestCase
 from wiki.cron import calculate_related_documents
-from wiki.models import Document, RelatedDocument
+from wiki.models import Document, HelpfulVoteRollup, RelatedDocument
 from wiki.config import (REDIRECT_SLUG, REDIRECT_TITLE, REDIRECT_HTML,
                          MAJOR_SIGNIFICANCE, CATEGORIES, TYPO_SIGNIFICANCE,
                          REDIRECT_CONTENT)
 from wiki.parser import wiki_to_html
-from wiki.tests import document, revision, doc_rev, translated_revision
+from wiki.related import update_related_documents
+from wiki.tests import (document, revision, doc_rev, helpful_vote,
+                        translated_revision)
 from wiki.utils import find_related_documents
 
 
@@ -643,3 +645,90 @@ class RelatedDocumentTests(TestCase):
         calculate_related_documents()
         d = Document.uncached.get(pk=3)
         eq_(0, d.related_documents.count())
+
+    def _tagged_doc(self, *tags):
+        d = revision(is_approved=True, save=True).document
+        d.tags.add(*tags)
+        return d
+
+    def test_incremental(self):
+        """Only the documents that changed get recalculated."""
+        d1 = self._tagged_doc('a', 'b', 'c')
+        d2 = self._tagged_doc('a', 'b')
+        d3 = self._tagged_doc('c')
+        update_related_documents()
+        eq_([d2], list(d1.related_documents.all()))
+        eq_(0, update_related_documents())
+
+        d3.tags.add('a')
+        eq_(1, update_related_documents())
+        eq_([(d2.id, 2), (d3.id, 2)],
+            sorted(RelatedDocument.uncached.filter(document=d1)
+                   .values_list('related', 'in_common')))
+        eq_([d1], list(d3.related_documents.all()))
+
+        d1.is_archived = True
+        d1.save()
+        update_related_documents()
+        eq_([], list(d2.related_documents.all()))
+        eq_(2, d1.related_documents.count())
+
+    def test_popular_tags(self):
+        """Tags on too many documents don't bring up candidates."""
+        d1 = self._tagged_doc('a', 'b', 'c')
+        d2 = self._tagged_doc('a', 'b')
+        self._tagged_doc('a', 'b')
+        d4 = self._tagged_doc('a', 'b', 'c')
+        update_related_documents(max_tag_docs=3)
+        eq_([d4], list(d1.related_documents.all()))
+        eq_([], list(d2.related_documents.all()))
+
+    def test_tags_becoming_popular(self):
+        """Documents get recalculated when other documents make their tags
+        popular or not popular any more."""
+        def related():
+            return sorted(RelatedDocument.uncached
+                          .filter(document__in=[d1, d2, d3])
+                          .values_list('document', 'related', 'in_common'))
+
+        d1 = self._tagged_doc('a', 'b', 'c')
+        d2 = self._tagged_doc('a', 'b')
+        update_related_documents(max_tag_docs=2)
+        eq_([d2], list(d1.related_documents.all()))
+
+        d3 = self._tagged_doc('a', 'b')
+        eq_(3, update_related_documents(max_tag_docs=2))
+        eq_([], related())
+
+        d3.tags.clear()
+        eq_(3, update_related_documents(max_tag_docs=2))
+        incremental = related()
+        eq_([(d1.id, d2.id, 2), (d2.id, d1.id, 2)], incremental)
+
+        # It's the same as calculating everything from scratch.
+        Document.uncached.update(related_hash='')
+        update_related_documents(max_tag_docs=2)
+        eq_(incremental, related())
+
+
+class HelpfulVoteRollupTests(TestCase):
+    def _counts(self):
+        return sorted(HelpfulVoteRollup.uncached.values_list(
+            'document', 'revision', 'day', 'yes', 'no'))
+
+    def test_roll_up(self):
+        """Votes get counted per revision and day, and only once."""
+        r = revision(save=True)
+        today = datetime.now()
+        yesterday = today - timedelta(days=1)
+        helpful_vote(revision=r, helpful=True, created=yesterday, save=True)
+        helpful_vote(revision=r, created=yesterday, save=True)
+        helpful_vote(revision=r, helpful=True, created=today, save=True)
+        HelpfulVoteRollup.roll_up()
+        eq_([(r.document_id, r.id, yesterday.date(), 1, 1),
+             (r.document_id, r.id, today.date(), 1, 0)], self._counts())
+
+        helpful_vote(revision=r, created=today, save=True)
+        HelpfulVoteRollup.roll_up()
+        eq_([(r.document_id, r.id, yesterday.date(), 1, 1),
+             (r.document_id, r.id, today.date(), 1, 1)], self._counts())
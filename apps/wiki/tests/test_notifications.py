@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
 from django.core import mail
 
 from nose.tools import eq_
 
 from sumo.tests import post
 from users.tests import user
-from wiki.events import ReadyRevisionEvent, ApproveRevisionInLocaleEvent
+from wiki.events import (ReadyRevisionEvent, ApproveRevisionInLocaleEvent,
+                         context_dict)
 from wiki.config import SIGNIFICANCES, MEDIUM_SIGNIFICANCE
 from wiki.tests import revision, TestCaseBase
 
@@ -29,6 +32,58 @@ def _set_up_ready_watcher():
     return ready_watcher
 
 
+def _diffed_from(context):
+    """Return the id of the revision a notification's diff is from."""
+    return int(context['diff'].splitlines()[0].rsplit('#', 1)[1])
+
+
+class ContextDictTests(TestCaseBase):
+    """Tests for which revision notification mails diff against"""
+    fixtures = ['users.json']
+
+    def setUp(self):
+        super(ContextDictTests, self).setUp()
+        now = datetime.now()
+        self.ready = revision(is_approved=True,
+                              is_ready_for_localization=True,
+                              content='One', created=now - timedelta(3),
+                              save=True)
+        self.doc = self.ready.document
+        self.approved = revision(document=self.doc, is_approved=True,
+                                 content='Two', created=now - timedelta(2),
+                                 save=True)
+        self.current = revision(document=self.doc, is_approved=True,
+                                is_ready_for_localization=True,
+                                content='Three', created=now - timedelta(1),
+                                save=True)
+        self.doc.current_revision = self.current
+        self.doc.save()
+
+    def test_ready_for_l10n(self):
+        """Ready mails diff against the previous ready revision."""
+        eq_(self.ready.id,
+            _diffed_from(context_dict(self.current, ready_for_l10n=True)))
+
+    def test_approved(self):
+        """Approval mails diff against the previous approved revision."""
+        eq_(self.approved.id,
+            _diffed_from(context_dict(self.current, revision_approved=True)))
+
+    def test_current_revision(self):
+        """Other mails diff against the current revision."""
+        rev = revision(document=self.doc, content='Four', save=True)
+        eq_(self.current.id, _diffed_from(context_dict(rev)))
+
+    def test_no_previous(self):
+        """Without a previous ready or approved revision, mails diff
+        against the current revision."""
+        self.ready.is_ready_for_localization = False
+        self.ready.save()
+        rev = revision(document=self.doc, content='Four', save=True)
+        eq_(self.current.id,
+            _diffed_from(context_dict(rev, ready_for_l10n=True)))
+
+
 class ReviewTests(TestCaseBase):
     """Tests for notifications sent during revision review"""
     fixtures = ['users.json']
@@ -0,0 +1,74 @@
+from django.http import HttpResponse
+from django.test.client import Client, RequestFactory
+
+import mock
+from nose.tools import eq_
+from pyquery import PyQuery as pq
+from waffle.models import Flag
+
+from sumo.tests import TestCase, post
+from wiki import pagecache
+from wiki.models import Document
+from wiki.pagecache import set_page
+from wiki.tests import revision
+
+
+class PageCacheTests(TestCase):
+    fixtures = ['users.json']
+
+    def setUp(self):
+        super(PageCacheTests, self).setUp()
+        self.doc = revision(content='Cached', is_approved=True,
+                            save=True).document
+
+    def _get(self, client=None):
+        response = (client or self.client).get(self.doc.get_absolute_url())
+        eq_(200, response.status_code)
+        return pq(response.content)
+
+    def test_cached_until_saved(self):
+        """Anonymous pages come from the cache until the document changes."""
+        eq_('Cached', self._get()('#doc-content').text())
+
+        # update() on a QuerySet doesn't send post_save.
+        self.doc.html = '<p>Changed</p>'
+        Document.uncached.filter(pk=self.doc.pk).update(html=self.doc.html)
+        eq_('Cached', self._get()('#doc-content').text())
+
+        self.doc.save()
+        eq_('Changed', self._get()('#doc-content').text())
+
+    def test_logged_in_not_cached(self):
+        self._get()
+        Document.uncached.filter(pk=self.doc.pk).update(html='Changed')
+        Document.objects.invalidate(self.doc)
+        self.client.login(username='jsocol', password='testpass')
+        eq_('Changed', self._get()('#doc-content').text())
+
+    def test_vote_form_filled_in(self):
+        """People who voted don't get the vote form from the cache."""
+        assert self._get()('.document-vote')
+        post(self.client, 'wiki.document_vote',
+             {'helpful': 'Yes',
+              'revision_id': self.doc.current_revision_id},
+             args=[self.doc.slug])
+        assert not self._get()('.document-vote')
+        assert self._get(Client())('.document-vote')
+
+    def test_flags_filled_in(self):
+        """Waffle flags in cached pages get checked on every request."""
+        flag = Flag.objects.create(name='ethnio-all', everyone=True)
+        assert self._get()('script[src*="ethn.io"]')
+
+        flag.everyone = False
+        flag.save()
+        assert not self._get()('script[src*="ethn.io"]')
+
+    @mock.patch.object(pagecache, 'cache')
+    def test_rolled_out_flags_not_cached(self, cache):
+        """Pages that rolled out a flag while rendering don't get cached."""
+        request = RequestFactory().get(self.doc.get_absolute_url())
+        request.waffles = {'some-flag': [True, True]}
+        response = HttpResponse('Rolled out')
+        set_page(request, {'revision': None}, response)
+        assert not cache.set.called
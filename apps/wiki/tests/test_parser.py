@@ -1,13 +1,20 @@
+from itertools import count
+import random
+import re
+
 from django.conf import settings
 
+import mock
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 
-from gallery.models import Video
+from gallery.models import Image, Video
 from gallery.tests import image, video
 from sumo.tests import TestCase
 import sumo.tests.test_parser
 from wiki.parser import (WikiParser, ForParser, PATTERNS, RECURSION_MESSAGE,
+                         ParseCache, parse_simple_syntax, render_wiki,
+                         split_sections,
                          _build_template_params as _btp,
                          _format_template_content as _ftc, _key_split)
 from wiki.tests import document, revision
@@ -113,6 +120,21 @@ class SimpleSyntaxTestCase(TestCase):
             '<span class="key">{</span>',
             key_p.sub(_key_split, '{key ctrl + and + {}'))
 
+    def test_single_pass_matches_sequential(self):
+        """Expanding in one pass should give the same results as
+        substituting each pattern in turn, nested constructs included."""
+        pieces = ['{note}', '{/note}', '{warning}', '{/warning}', '{key ',
+                  '{menu ', '{button ', '{pref ', '{filepath ', '{', '}',
+                  'a', ' + ', '\n']
+        rand = random.Random(42)
+        for i in xrange(2000):
+            text = ''.join(rand.choice(pieces)
+                           for j in xrange(rand.randint(0, 12)))
+            want = text
+            for pattern, replacement in PATTERNS:
+                want = pattern.sub(replacement, want)
+            eq_(want, parse_simple_syntax(text), text)
+
     def test_simple_inline_custom(self):
         """Simple custom inline syntax: menu, button, filepath, pref"""
         p = WikiParser()
@@ -310,6 +332,24 @@ class TestWikiTemplate(TestCase):
         eq_(0, doc('div.caption').length)
         eq_(0, doc('div.img').length)
 
+    def test_template_parsed_once(self):
+        """A template used twice is parsed once."""
+        _, _, p = doc_rev_parser('Hi {{{1}}}', 'Template:hi')
+        with mock.patch.object(p, 'parse', wraps=p.parse) as parse:
+            doc = pq(parse('[[T:hi|you]] [[T:hi|me]]'))
+        eq_('Hi you Hi me', doc.text())
+        # Once for the text, once for the template
+        eq_(2, parse.call_count)
+
+    def test_cached_dependencies(self):
+        """Cached parses keep their dependencies."""
+        doc_rev_parser('[[Image:Missing]]', 'Template:img')
+        parse_cache = ParseCache()
+        for i in range(2):
+            html, dependencies = render_wiki('[[T:img]]',
+                                             parse_cache=parse_cache)
+            assert (Image, 'Missing', None) in dependencies
+
     def test_direct_recursion(self):
         """Make sure direct recursion is caught on the very first nesting."""
         d = document(title='Template:Boo')
@@ -632,6 +672,55 @@ def strip_eq(want, text):
     eq_(want, ForParser.strip_fors(text)[0])
 
 
+def reference_strip_fors(text):
+    """The original strip_fors, which redoes the replacements one at a time
+    and looks back through the text for preceding whitespace. The single pass
+    one should give the same results."""
+    dehydrations = {}
+    indexes = count()
+
+    def padding(str):
+        return '\n' * max(2 - str.count('\n'), 0)
+
+    def preceding_whitespace(str, pos):
+        whitespace = []
+        for i in xrange(pos - 1, 0, -1):
+            if str[i] not in '\t \n\r':
+                break
+            whitespace.append(str[i])
+        return ''.join(reversed(whitespace))
+
+    def dehydrate(match):
+        prespace, tag, attrs, postspace = match.groups()
+        if tag != '{/for}':
+            i = indexes.next()
+            dehydrations[i] = ForParser._wiki_to_tag(attrs)
+            token = u'\x07%i\x07' % i
+        else:
+            token = u'\x07/sf\x07'
+
+        at_top = match.start(2) == 0
+        at_left = at_top or match.string[match.start(2) - 1] == '\n'
+        at_bottom = match.end(4) == len(match.string)
+        if at_left and (at_bottom or '\n' in postspace):
+            if not at_top:
+                prespace += padding(
+                    preceding_whitespace(match.string, match.start(1)) +
+                    prespace)
+            if not at_bottom:
+                postspace += padding(postspace)
+        return prespace + token + postspace
+
+    pos = 0
+    while True:
+        m = ForParser._FOR_OR_CLOSER.search(text, pos)
+        if m is None:
+            return text, dehydrations
+        done = text[:m.start()] + dehydrate(m)
+        pos = len(done)
+        text = done + text[m.end():]
+
+
 class ForParserTests(TestCase):
     """Tests for the ForParser
 
@@ -698,7 +787,9 @@ class ForParserTests(TestCase):
             """Assert that on_own_line operates as expected on the first match
             in `text`."""
             match = ForParser._FOR_OR_CLOSER.search(text)
-            eq_(want, ForParser._on_own_line(match, match.groups(3)))
+            before = text[match.start(2) - 1] if match.start(2) else ''
+            eq_(want, ForParser._on_own_line(before, match.group(4),
+                                             match.end(4) == len(text)))
         on_own_line_eq((True, True, True), '{for}')
         on_own_line_eq((True, True, True), '{for} ')
         on_own_line_eq((False, False, True), ' {for}')
@@ -745,6 +836,23 @@ class ForParserTests(TestCase):
                  '{for mac}Fx3{/for}\n'
                  '{/for}')
 
+    def test_strip_matches_reference(self):
+        """strip_fors should agree with the original, replace-at-a-time
+        implementation on random mixes of tags, text and whitespace."""
+        pieces = ['{for}', '{for mac, win}', '{for }', '{/for}', '{for', '}',
+                  '\n', '\n', ' ', '\t', '\r', '\x0c', 'a', 'b c', '* ']
+        rand = random.Random(42)
+        for i in xrange(2000):
+            text = u''.join(rand.choice(pieces)
+                            for j in xrange(rand.randint(0, 15)))
+            eq_(reference_strip_fors(text), ForParser.strip_fors(text),
+                'strip_fors(%r)' % text)
+
+    def test_strip_without_fors(self):
+        """Text without any {for}s comes back as it was."""
+        text = 'No\n\nfors {here}\n'
+        eq_((text, {}), ForParser.strip_fors(text))
+
     def test_self_closers(self):
         """Make sure self-closing tags aren't balanced as paired ones."""
         balanced_eq('<img src="smoo"><span>g</span>',
@@ -761,3 +869,152 @@ class ForParserTests(TestCase):
         html = 'A<i>hi</i>B<i>there</i>C'
         p = ForParser(html)
         eq_(html, p.to_unicode())
+
+    def test_expand_streams(self):
+        """Properly nested fors get expanded without a parse tree."""
+        html = ('<p>Hi <for data-for="mac">Mac</for></p>'
+                '<for data-for="win"><ul><li><for>A</for></li></ul></for>')
+        want = ('<p>Hi <span class="for" data-for="mac">Mac</span></p>'
+                '<div class="for" data-for="win"><ul><li>'
+                '<span class="for">A</span></li></ul></div>')
+        eq_(want, ForParser._expand_streaming(html))
+        expanded_eq(want, html)
+
+    def test_expand_without_fors(self):
+        """HTML without fors comes back as it was."""
+        html = u'<p>A &amp; <b title="x&amp;y">B</b></p><hr>'
+        eq_(html, ForParser._expand_streaming(html))
+
+    def test_expand_balances(self):
+        """Badly paired fors, and anything else html5lib might change, get
+        the parse tree."""
+        for html, want in [
+            ('<div><for><p>One</for></for></p></div>',
+             '<div><div class="for"><p>One</p></div></div>'),
+            ('<p>A <for>B</p><p>C</p></for>',
+             '<p>A <span class="for">B</span></p><p>C</p>'),
+            ('<for><em>A</for>B</em>',
+             '<span class="for"><em>A</em></span><em>B</em>'),
+            ('<pre>\n\nA</pre>', '<pre>\nA</pre>'),
+            ('<p>A&nbsp;B</p>', u'<p>A\xa0B</p>')]:
+            eq_(None, ForParser._expand_streaming(html))
+            eq_(want, ForParser.expand(html))
+
+    def test_expand_matches_tree(self):
+        """Whenever fors get expanded without a parse tree, the result
+        should be what we'd get with one, on random HTML with fors put in
+        random places."""
+        elements = ['p', 'div', 'ul', 'li', 'b', 'em', 'a', 'h2', 'pre', 'dl',
+                    'dt', 'table', 'tbody', 'tr', 'td', 'br', 'img', 'hr']
+        texts = ['x', ' ', '\n', '&amp;', '&lt;', '"q"']
+        fors = ['<for>', '<for data-for="mac,win">', '</for>']
+        rand = random.Random(42)
+
+        def soup(depth=0):
+            parts = []
+            for i in xrange(rand.randint(0, 4)):
+                if depth > 3 or rand.random() < 0.4:
+                    parts.append(rand.choice(texts))
+                    continue
+                element = rand.choice(elements)
+                parts.append('<%s>%s</%s>' % (element, soup(depth + 1),
+                                              element))
+            return ''.join(parts)
+
+        streamed = 0
+        for i in xrange(300):
+            # Normalize the HTML the way the wiki formatter does:
+            html = ForParser(soup()).to_unicode()
+            html = u''.join(rand.choice(fors) + part
+                            if rand.random() < 0.2 else part
+                            for part in re.split(r'(<[^>]*>)', html))
+            expanded = ForParser._expand_streaming(html)
+            if expanded is not None:
+                streamed += 1
+                for_parser = ForParser(html)
+                for_parser.expand_fors()
+                eq_(for_parser.to_unicode(), expanded, html)
+        assert streamed, "Nothing got expanded without a tree."
+
+
+class ParseCacheTests(TestCase):
+    def test_lru(self):
+        """The least recently used parse gets evicted."""
+        parse_cache = ParseCache(size=2)
+        parse_cache.set('a', 1)
+        parse_cache.set('b', 2)
+        eq_(1, parse_cache.get('a'))
+        parse_cache.set('c', 3)
+        eq_(None, parse_cache.get('b'))
+        eq_(1, parse_cache.get('a'))
+        eq_(3, parse_cache.get('c'))
+
+
+class SectionTests(TestCase):
+    def test_split_sections(self):
+        """Pieces start at top-level headings and close what they open."""
+        text = ('Intro\n= A =\n{for mac}Mac\n= B =\nMore{/for} stuff\n'
+                '== B.1 ==\nSub\n= C =\n<pre>\n= Not a heading =\n</pre>\n'
+                '= D =\nThe end\n')
+        eq_(['Intro\n',
+             '= A =\n{for mac}Mac\n= B =\nMore{/for} stuff\n'
+             '== B.1 ==\nSub\n',
+             '= C =\n<pre>\n= Not a heading =\n</pre>\n',
+             '= D =\nThe end\n'],
+            list(split_sections(text)))
+
+    def test_split_blocks(self):
+        """Notes, warnings and HTML elements keep pieces together."""
+        text = ('= A =\n{note}\nStart\n= B =\n{/note}\n'
+                '= C =\n<div>\n= D =\n<br>\n</div>\n'
+                '= E =\n{warning}\n= F =\n{/note}\n')
+        eq_(['= A =\n{note}\nStart\n= B =\n{/note}\n',
+             '= C =\n<div>\n= D =\n<br>\n</div>\n',
+             '= E =\n{warning}\n= F =\n{/note}\n'],
+            list(split_sections(text)))
+
+    def test_split_blank_intro(self):
+        """Pieces have more than whitespace in them."""
+        eq_(['\n\n= A =\na\n', '= B =\nb\n'],
+            list(split_sections('\n\n= A =\na\n= B =\nb\n')))
+
+    def test_split_without_headings(self):
+        eq_(['No headings\n'], list(split_sections('No headings\n')))
+
+    def _assert_parses_the_same(self, text):
+        whole = WikiParser()
+        sections = WikiParser()
+        eq_(whole.parse(text, show_toc=False),
+            sections.parse_by_section(text, show_toc=False))
+        eq_(whole.dependencies, sections.dependencies)
+
+    def test_parse_by_section(self):
+        """Documents parse the same a section at a time."""
+        doc_rev_parser('Included', title='Inc')
+        self._assert_parses_the_same(
+            'Intro\n\n== First ==\nSome {for mac}text{/for}\n\n'
+            '[[I:Inc]]\n\n== Second ==\n* a\n* b\n\n'
+            '== Third ==\n{| \n| cell\n|}\n')
+
+    def test_parse_blocks_by_section(self):
+        """Notes, warnings and HTML elements across headings parse the same
+        a section at a time."""
+        self._assert_parses_the_same(
+            '= A =\n{note}\nStart\n= B =\nInside\n{/note}\nAfter\n\n'
+            '= C =\n{warning}\n= D =\n{/warning}\n')
+        self._assert_parses_the_same(
+            '= A =\n<div class="x">\nStart\n= B =\nInside\n</div>\n'
+            '= C =\n<ul><li>\n= D =\n</li></ul>\nEnd\n')
+
+    @mock.patch.object(settings, 'WIKI_SECTION_RENDER_SIZE', 10)
+    @mock.patch.object(WikiParser, 'parse_by_section')
+    def test_render_long_by_section(self, parse_by_section):
+        parse_by_section.return_value = 'By section'
+        assert 'By section' not in render_wiki('Short')[0]
+        eq_('By section', render_wiki('= Long enough =\n')[0])
+
+    def test_clashing_ids(self):
+        """Headings with the same id across sections get parsed whole."""
+        parser = WikiParser()
+        eq_(None, parser.parse_by_section('= Same =\na\n= Same =\nb\n'))
+
@@ -0,0 +1,73 @@
+from django.core.cache import cache
+
+import mock
+from nose.tools import eq_
+
+from wiki.models import Document, Revision
+from wiki.rebuild import (WIKI_REBUILD_PROGRESS, rebuild_chunk,
+                          rebuild_kb_cmd, rebuild_kb_with_progress)
+from wiki.tests import TestCaseBase, document, revision
+
+
+class RebuildTests(TestCaseBase):
+    fixtures = ['users.json']
+
+    def setUp(self):
+        super(RebuildTests, self).setUp()
+        self.doc = revision(document=document(title='Stale', save=True),
+                            content='New content', is_approved=True,
+                            save=True).document
+        self.fresh = revision(document=document(title='Fresh', save=True),
+                              content='Same content', is_approved=True,
+                              save=True).document
+        Document.uncached.filter(pk=self.doc.pk).update(html='Old HTML')
+
+    def _html(self, doc):
+        return Document.uncached.get(pk=doc.pk).html
+
+    @mock.patch.object(Document, 'save')
+    def test_rebuild_chunk(self, save):
+        """Only the changed HTML gets written, without save()."""
+        changed, messages = rebuild_chunk([self.doc.id, self.fresh.id, 999])
+        eq_([(self.doc.id, unicode(self.doc))], changed)
+        eq_(['Missing document: 999'], messages)
+        eq_(self.doc.current_revision.content_parsed, self._html(self.doc))
+        assert not save.called
+
+    def test_dry_run(self):
+        changed, messages = rebuild_chunk([self.doc.id, self.fresh.id],
+                                          dry_run=True)
+        eq_([(self.doc.id, unicode(self.doc))], changed)
+        eq_('Old HTML', self._html(self.doc))
+
+    def test_skip_unchanged(self):
+        """Only documents rendered from something else get rendered."""
+        template = revision(document=document(title='Template:Hi',
+                                              save=True),
+                            content='Hi', is_approved=True,
+                            save=True).document
+        includer = revision(document=document(title='Includer', save=True),
+                            content='[[T:Hi]]', is_approved=True,
+                            save=True).document
+        ids = [self.doc.id, self.fresh.id, includer.id]
+
+        with mock.patch.object(Revision, 'render') as render:
+            eq_(([], []), rebuild_chunk(ids, skip_unchanged=True))
+            assert not render.called
+
+        revision(document=template, content='Hello', is_approved=True,
+                 save=True)
+        eq_([(includer.id, unicode(includer))],
+            rebuild_chunk(ids, skip_unchanged=True)[0])
+        assert 'Hello' in self._html(includer)
+
+    def test_progress(self):
+        with mock.patch('wiki.rebuild.CHUNK_SIZE', 1):
+            ratios = [ratio for ratio, changed, messages
+                      in rebuild_kb_with_progress()]
+        eq_([0.5, 1.0], ratios)
+
+    def test_cmd_clears_progress(self):
+        rebuild_kb_cmd()
+        eq_(None, cache.get(WIKI_REBUILD_PROGRESS))
+        eq_(self.doc.current_revision.content_parsed, self._html(self.doc))
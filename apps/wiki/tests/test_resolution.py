@@ -0,0 +1,63 @@
+from nose.tools import eq_
+
+from sumo.tests import TestCase
+from wiki.config import REDIRECT_HTML
+from wiki.models import Document
+from wiki.resolution import resolve_document
+from wiki.tests import document, revision
+
+
+class ResolutionTests(TestCase):
+    fixtures = ['users.json']
+
+    def test_cached(self):
+        """Resolutions come from the cache until the document is saved."""
+        doc = revision(is_approved=True, save=True).document
+        eq_(doc.id, resolve_document('en-US', doc.slug)['document'])
+
+        # update() on a QuerySet doesn't send post_save.
+        doc.html = REDIRECT_HTML + 'href="/en-US/kb/other">Other</a></p>'
+        Document.uncached.filter(pk=doc.pk).update(html=doc.html)
+        eq_(None, resolve_document('en-US', doc.slug)['redirect_url'])
+        doc.save()
+        eq_('/en-US/kb/other',
+            resolve_document('en-US', doc.slug)['redirect_url'])
+
+    def test_fallback(self):
+        """Creating documents invalidates the fallbacks to them."""
+        eq_(None, resolve_document('de', 'some-slug'))
+
+        en_doc = revision(document=document(slug='some-slug', save=True),
+                          is_approved=True, save=True).document
+        resolution = resolve_document('de', 'some-slug')
+        eq_(en_doc.id, resolution['document'])
+        eq_('no_translation', resolution['fallback_reason'])
+
+        de_doc = document(locale='de', parent=en_doc, slug='ein-slug',
+                          save=True)
+        eq_({'translation_url': de_doc.get_absolute_url()},
+            resolve_document('de', 'some-slug'))
+        eq_('translation_not_approved',
+            resolve_document('de', 'ein-slug')['fallback_reason'])
+
+        revision(document=de_doc, is_approved=True, save=True)
+        eq_(None, resolve_document('de', 'ein-slug')['fallback_reason'])
+
+    def test_redirect(self):
+        """Renaming a document makes its old slug resolve to a redirect."""
+        doc = revision(document=document(slug='old-slug', save=True),
+                       is_approved=True, save=True).document
+        eq_(None, resolve_document('en-US', 'old-slug')['redirect_url'])
+
+        doc.slug = 'new-slug'
+        doc.save()
+        eq_(doc.get_absolute_url(),
+            resolve_document('en-US', 'old-slug')['redirect_url'])
+
+    def test_contributors(self):
+        rev = revision(is_approved=True, save=True)
+        doc = rev.document
+        eq_([rev.creator], resolve_document('en-US', doc.slug)['contributors'])
+
+        doc.contributors.remove(rev.creator)
+        eq_([], resolve_document('en-US', doc.slug)['contributors'])
@@ -14,9 +14,11 @@ from test_utils import RequestFactory
 import waffle
 
 from sumo.tests import TestCase
+from wiki.models import DocumentDependency, get_dependents
 from wiki.tasks import (send_reviewed_notification, rebuild_kb,
-                        schedule_rebuild_kb, _rebuild_kb_chunk)
-from wiki.tests import TestCaseBase, revision
+                        schedule_rebuild_kb, _rebuild_kb_chunk,
+                        rebuild_dependents)
+from wiki.tests import TestCaseBase, document, revision
 
 
 REVIEWED_EMAIL_CONTENT = """Your revision has been reviewed.
@@ -93,6 +95,57 @@ class RebuildTestCase(TestCase):
         eq_(data, set(apply_async.call_args[1]['args'][0]))
 
 
+class DependentsTestCase(TestCaseBase):
+    """Test re-rendering only the documents that include something."""
+    fixtures = ['users.json']
+
+    def setUp(self):
+        super(DependentsTestCase, self).setUp()
+        self.template = revision(
+            document=document(title='Template:Hi', save=True),
+            content='Hi', is_approved=True, save=True).document
+        self.includer = revision(
+            document=document(title='Includer', save=True),
+            content='[[T:Hi]]', is_approved=True, save=True).document
+        self.nested = revision(
+            document=document(title='Nested', save=True),
+            content='[[I:Includer]] [[Image:Missing]]', is_approved=True,
+            save=True).document
+
+    def test_dependencies_recorded(self):
+        eq_(set([('document', 'Template:Hi', self.template.id)]),
+            set(DocumentDependency.objects.filter(document=self.includer)
+                .values_list('kind', 'title', 'object_id')))
+        eq_(set([('document', 'Includer', self.includer.id),
+                 ('document', 'Template:Hi', self.template.id),
+                 ('image', 'Missing', None)]),
+            set(DocumentDependency.objects.filter(document=self.nested)
+                .values_list('kind', 'title', 'object_id')))
+
+    def test_get_dependents(self):
+        eq_(set([self.includer.id, self.nested.id]),
+            get_dependents('document', self.template.title,
+                           self.template.id))
+        eq_(set([self.nested.id]),
+            get_dependents('document', 'Includer', self.includer.id))
+        eq_(set([self.nested.id]), get_dependents('image', 'Missing', 42))
+        eq_(set(), get_dependents('video', 'Missing', 42))
+
+    @mock.patch.object(_rebuild_kb_chunk, 'apply_async')
+    def test_rebuild_dependents(self, apply_async):
+        rebuild_dependents('document', self.template.title, self.template.id)
+        eq_([self.includer.id, self.nested.id],
+            sorted(apply_async.call_args[1]['args'][0]))
+
+    def test_rebuild_chunk_updates_dependencies(self):
+        rev = self.includer.current_revision
+        rev.content = 'No more template'
+        rev.save()
+        _rebuild_kb_chunk([self.includer.id])
+        eq_(0, DocumentDependency.objects.filter(
+            document=self.includer).count())
+
+
 class ReviewMailTestCase(TestCaseBase):
     """Test that the review mail gets sent."""
     fixtures = ['users.json']
@@ -25,7 +25,8 @@ from wiki.cron import calculate_related_documents
 from wiki.events import (EditDocumentEvent, ReadyRevisionEvent,
                          ReviewableRevisionInLocaleEvent,
                          ApproveRevisionInLocaleEvent)
-from wiki.models import Document, Revision, HelpfulVote, HelpfulVoteMetadata
+from wiki.models import (Document, Revision, HelpfulVote,
+                         HelpfulVoteMetadata, HelpfulVoteRollup)
 from wiki.config import SIGNIFICANCES, MEDIUM_SIGNIFICANCE
 from wiki.tasks import send_reviewed_notification
 from wiki.tests import (TestCaseBase, document, revision, new_document_data,
@@ -1915,6 +1916,7 @@ class HelpfulVoteTests(TestCaseBase):
                         {'helpful': 'Yes', 'revision_id': r.id},
                         args=[self.document.slug])
         eq_(200, response.status_code)
+        HelpfulVoteRollup.roll_up()
 
         resp = get(self.client, 'wiki.get_helpful_votes_async',
                    args=[r.document.slug])
@@ -1936,6 +1938,7 @@ class HelpfulVoteTests(TestCaseBase):
                         {'helpful': 'No', 'revision_id': r.id},
                         args=[self.document.slug])
         eq_(200, response.status_code)
+        HelpfulVoteRollup.roll_up()
 
         resp = get(self.client, 'wiki.get_helpful_votes_async',
                    args=[r.document.slug])
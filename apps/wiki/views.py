@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import logging
 from string import ascii_letters
@@ -8,7 +8,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.db import connection
+from django.db.models import Max, Sum
 from django.http import (HttpResponse, HttpResponseRedirect,
                          Http404, HttpResponseBadRequest)
 from django.shortcuts import get_object_or_404
@@ -33,14 +33,17 @@ from wiki.events import (EditDocumentEvent, ReviewableRevisionInLocaleEvent,
                          ReadyRevisionEvent)
 from wiki.forms import (AddContributorForm, DocumentForm, RevisionForm,
                         ReviewForm)
-from wiki.models import Document, Revision, HelpfulVote, ImportantDate
+from wiki.models import (Document, Revision, HelpfulVote, HelpfulVoteRollup,
+                         ImportantDate)
 from wiki.config import (CATEGORIES, OPERATING_SYSTEMS,
                          GROUPED_OPERATING_SYSTEMS, FIREFOX_VERSIONS,
                          GROUPED_FIREFOX_VERSIONS, PRODUCT_TAGS)
+from wiki.pagecache import get_page, is_cacheable, set_page
 from wiki.parser import wiki_to_html
 from wiki.tasks import (send_reviewed_notification, schedule_rebuild_kb,
+                        schedule_rebuild_dependents,
                         send_contributor_notification)
-from wiki.utils import find_related_documents
+from wiki.resolution import resolve_document
 
 
 log = logging.getLogger('k.wiki')
@@ -92,46 +95,45 @@ SHOWFOR_DATA = {
 @mobile_template('wiki/{mobile/}document.html')
 def document(request, document_slug, template=None):
     """View a wiki document."""
-    fallback_reason = None
-    # If a slug isn't available in the requested locale, fall back to en-US:
-    try:
-        doc = Document.objects.get(locale=request.locale, slug=document_slug)
-        if (not doc.current_revision and doc.parent and
-            doc.parent.current_revision):
-            # This is a translation but its current_revision is None
-            # and OK to fall back to parent (parent is approved).
-            fallback_reason = 'translation_not_approved'
-        elif not doc.current_revision:
-            # No current_revision, no parent with current revision, so
-            # nothing to show.
-            fallback_reason = 'no_content'
-    except Document.DoesNotExist:
-        # Look in default language:
-        doc = get_object_or_404(Document,
-                                locale=settings.WIKI_DEFAULT_LANGUAGE,
-                                slug=document_slug)
-        # If there's a translation to the requested locale, take it:
-        translation = doc.translated_to(request.locale)
-        if translation:
-            url = translation.get_absolute_url()
-            url = urlparams(url, query_dict=request.GET)
-            return HttpResponseRedirect(url)
-        elif doc.current_revision:
-            # There is no translation
-            # and OK to fall back to parent (parent is approved).
-            fallback_reason = 'no_translation'
+    # If a slug isn't available in the requested locale, fall back to en-US.
+    # Working that out is cached; see wiki.resolution.
+    resolution = resolve_document(request.locale, document_slug)
+    if resolution is None:
+        raise Http404
+    if 'translation_url' in resolution:
+        # There's a translation of the en-US document to the requested
+        # locale, so take it:
+        url = urlparams(resolution['translation_url'], query_dict=request.GET)
+        return HttpResponseRedirect(url)
 
     # Obey explicit redirect pages:
     # Don't redirect on redirect=no (like Wikipedia), so we can link from a
     # redirected-to-page back to a "Redirected from..." link, so you can edit
     # the redirect.
     redirect_url = (None if request.GET.get('redirect') == 'no'
-                    else doc.redirect_url(request.locale))
+                    else resolution['redirect_url'])
     if redirect_url:
         url = urlparams(redirect_url, query_dict=request.GET,
-                        redirectslug=doc.slug, redirectlocale=doc.locale)
+                        redirectslug=document_slug,
+                        redirectlocale=resolution['locale'])
         return HttpResponseRedirect(url)
 
+    # Anonymous users all get the same page, give or take the vote form:
+    page_cache = is_cacheable(request)
+    if page_cache:
+        response = get_page(request, resolution)
+        if response is not None:
+            return response
+
+    # Get the document and the related ones in one (cached) query:
+    docs = dict((d.id, d) for d in Document.objects.filter(
+        pk__in=[resolution['document']] + resolution['related']))
+    try:
+        doc = docs[resolution['document']]
+    except KeyError:
+        raise Http404
+    related = [docs[pk] for pk in resolution['related'] if pk in docs]
+
     # Get "redirected from" doc if we were redirected:
     redirect_slug = request.GET.get('redirectslug')
     redirect_locale = request.GET.get('redirectlocale')
@@ -143,16 +145,16 @@ def document(request, document_slug, template=None):
         except Document.DoesNotExist:
             pass
 
-    related = find_related_documents(doc)
-
-    contributors = doc.contributors.all()
-
     data = {'document': doc, 'redirected_from': redirected_from,
-            'related': related, 'contributors': contributors,
-            'fallback_reason': fallback_reason,
-            'is_aoa_referral': request.GET.get('ref') == 'aoa'}
+            'related': related, 'contributors': resolution['contributors'],
+            'fallback_reason': resolution['fallback_reason'],
+            'is_aoa_referral': request.GET.get('ref') == 'aoa',
+            'page_cache': page_cache}
     data.update(SHOWFOR_DATA)
-    return jingo.render(request, template, data)
+    response = jingo.render(request, template, data)
+    if page_cache:
+        response = set_page(request, resolution, response)
+    return response
 
 
 def revision(request, document_slug, revision_id):
@@ -412,9 +414,10 @@ def review_revision(request, document_slug, revision_id):
             send_reviewed_notification.delay(rev, doc, msg)
             send_contributor_notification(based_on_revs, rev, doc, msg)
 
-            # Schedule KB rebuild?
+            # Re-render the documents that include this one.
             statsd.incr('wiki.review')
-            schedule_rebuild_kb()
+            if rev.is_approved:
+                schedule_rebuild_dependents(doc)
 
             return HttpResponseRedirect(reverse('wiki.document_revisions',
                                                 args=[document_slug]))
@@ -789,37 +792,31 @@ def get_helpful_votes_async(request, document_slug):
     flag_data = []
     rev_data = []
     revisions = set([])
-    created_list = []
+    days = []
 
     start = time.time()
-    cursor = connection.cursor()
-
-    cursor.execute('SELECT wiki_helpfulvote.revision_id, '
-                             'SUM(wiki_helpfulvote.helpful), '
-                             'SUM(NOT(wiki_helpfulvote.helpful)), '
-                             'wiki_helpfulvote.created '
-                        'FROM wiki_helpfulvote '
-                        'INNER JOIN wiki_revision ON '
-                            'wiki_helpfulvote.revision_id=wiki_revision.id '
-                        'WHERE wiki_revision.document_id=%s '
-                        'GROUP BY DATE(wiki_helpfulvote.created)',
-                        [document.id])
-
-    results = cursor.fetchall()
-    for res in results:
-        created = 1000 * (int(time.mktime(res[3].timetuple()) / 86400) * 86400)
-        percent = float(res[1]) / (float(res[1]) + float(res[2]))
-        yes_data.append({'x': created, 'y': int(res[1])})
-        no_data.append({'x': created, 'y': int(res[2])})
+    rollups = (HelpfulVoteRollup.uncached.filter(document=document)
+               .values('day')
+               .annotate(yes=Sum('yes'), no=Sum('no'),
+                         rev_id=Max('revision'))
+               .order_by('day'))
+
+    for res in rollups:
+        created = 1000 * (int(time.mktime(res['day'].timetuple()) / 86400) *
+                          86400)
+        yes, no = int(res['yes']), int(res['no'])
+        percent = float(yes) / (yes + no)
+        yes_data.append({'x': created, 'y': yes})
+        no_data.append({'x': created, 'y': no})
         perc_data.append({'x': created, 'y': percent})
-        date_to_rev_id[created] = res[0]
-        date_tooltip[created] = {'yes': int(res[1]),
-                                 'no': int(res[2]),
+        date_to_rev_id[created] = res['rev_id']
+        date_tooltip[created] = {'yes': yes,
+                                 'no': no,
                                  'percent': round(percent * 100, 2)}
-        revisions.add(int(res[0]))
-        created_list.append(res[3])
+        revisions.add(res['rev_id'])
+        days.append(res['day'])
 
-    if created_list == []:
+    if days == []:
         send = {'data': [],
                 'date_to_rev_id': [],
                 'date_tooltip': [],
@@ -828,8 +825,8 @@ def get_helpful_votes_async(request, document_slug):
         return HttpResponse(json.dumps(send),
                         mimetype='application/json')
 
-    min_created = min(created_list)
-    max_created = max(created_list)
+    min_created = days[0]
+    max_created = days[-1]
 
     for flag in ImportantDate.uncached.filter(date__gte=min_created,
                                              date__lte=max_created):
@@ -840,9 +837,9 @@ def get_helpful_votes_async(request, document_slug):
             #'url': 'http://www.google.com/'  # Not supported yet
         })
 
-    for rev in Revision.objects.filter(pk__in=revisions,
-                                       created__gte=min_created,
-                                       created__lte=max_created):
+    for rev in Revision.objects.filter(
+            pk__in=revisions, created__gte=min_created,
+            created__lt=max_created + timedelta(days=1)):
         rdate = rev.reviewed or rev.created
         rev_data.append({
                     'x': 1000 * int(time.mktime(rdate.timetuple())),
@@ -963,6 +960,7 @@ def delete_document(request, document_slug):
     # Handle confirm delete form POST
     log.warning('User %s is deleting document: %s (id=%s)' %
                 (request.user, document.title, document.id))
+    schedule_rebuild_dependents(document)
     document.delete()
 
     return jingo.render(request, 'wiki/confirm_document_delete.html',
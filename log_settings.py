@@ -29,6 +29,12 @@ handler.setLevel(level)
 handler.setFormatter(formatter)
 log.addHandler(handler)
 
+if settings.SEARCH_SLOW_LOG:
+    slow_handler = logging.handlers.RotatingFileHandler(
+        settings.SEARCH_SLOW_LOG, maxBytes=10 * 1024 * 1024, backupCount=5)
+    slow_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logging.getLogger('k.search.slow').addHandler(slow_handler)
+
 if not settings.DEBUG:
     task_log = logging.getLogger('k.celery')
     task_proxy = celery.log.LoggingProxy(task_log)
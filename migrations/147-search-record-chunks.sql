@@ -0,0 +1,7 @@
+ALTER TABLE `search_record`
+    ADD COLUMN `batch_id` varchar(10) NOT NULL DEFAULT '',
+    ADD COLUMN `name` varchar(255) NOT NULL DEFAULT '',
+    ADD COLUMN `status` integer NOT NULL DEFAULT 0;
+
+CREATE INDEX `search_record_batch_id` ON `search_record` (`batch_id`);
+CREATE INDEX `search_record_name` ON `search_record` (`name`);
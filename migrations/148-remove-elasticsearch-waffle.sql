@@ -0,0 +1 @@
+DELETE FROM waffle_flag WHERE name = 'elasticsearch';
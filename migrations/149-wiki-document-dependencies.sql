@@ -0,0 +1,14 @@
+-- Dependencies get recorded as documents are rendered. Run the rebuild_kb
+-- cron job after this to record them for all documents.
+CREATE TABLE `wiki_documentdependency` (
+    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `document_id` integer NOT NULL,
+    `kind` varchar(20) NOT NULL,
+    `title` varchar(255) NOT NULL,
+    `object_id` integer UNSIGNED
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci
+;
+ALTER TABLE `wiki_documentdependency` ADD CONSTRAINT `document_id_refs_id_5e1d9b0f` FOREIGN KEY (`document_id`) REFERENCES `wiki_document` (`id`);
+CREATE INDEX `wiki_documentdependency_f4226d13` ON `wiki_documentdependency` (`document_id`);
+CREATE INDEX `wiki_documentdependency_841a7e28` ON `wiki_documentdependency` (`title`);
+CREATE INDEX `wiki_documentdependency_829e37fd` ON `wiki_documentdependency` (`object_id`);
@@ -0,0 +1,5 @@
+-- Documents rendered before this have no stamp, so the first rebuild
+-- renders them all.
+ALTER TABLE `wiki_document`
+    ADD COLUMN `parser_version` varchar(20) NOT NULL DEFAULT '',
+    ADD COLUMN `source_hash` varchar(40) NOT NULL DEFAULT '';
@@ -0,0 +1,17 @@
+-- Run the rollup_helpful_votes cron job after this to roll up the
+-- existing votes.
+CREATE TABLE `wiki_helpfulvoterollup` (
+    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `document_id` integer NOT NULL,
+    `revision_id` integer NOT NULL,
+    `day` date NOT NULL,
+    `yes` integer UNSIGNED NOT NULL,
+    `no` integer UNSIGNED NOT NULL,
+    UNIQUE (`revision_id`, `day`)
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci
+;
+ALTER TABLE `wiki_helpfulvoterollup` ADD CONSTRAINT `document_id_refs_id_4a9c1e3b` FOREIGN KEY (`document_id`) REFERENCES `wiki_document` (`id`);
+ALTER TABLE `wiki_helpfulvoterollup` ADD CONSTRAINT `revision_id_refs_id_7d2f5b61` FOREIGN KEY (`revision_id`) REFERENCES `wiki_revision` (`id`);
+CREATE INDEX `wiki_helpfulvoterollup_f4226d13` ON `wiki_helpfulvoterollup` (`document_id`);
+CREATE INDEX `wiki_helpfulvoterollup_c2d7ab2b` ON `wiki_helpfulvoterollup` (`revision_id`);
+CREATE INDEX `wiki_helpfulvoterollup_0c4a7e7f` ON `wiki_helpfulvoterollup` (`day`);
@@ -0,0 +1,4 @@
+-- Documents with no hash get their related documents recalculated by the
+-- next calculate_related_documents cron job.
+ALTER TABLE `wiki_document`
+    ADD COLUMN `related_hash` varchar(40) NOT NULL DEFAULT '';
@@ -8,13 +8,16 @@ HOME = /tmp
 
 # Every minute!
 * * * * * {{ cron }} collect_tweets
+* * * * * {{ cron }} index_queued
+
+# Every 10 minutes.
+*/10 * * * * {{ cron }} update_suggestions
+*/10 * * * * {{ cron }} rollup_helpful_votes
+*/10 * * * * {{ cron }} calculate_related_documents
 
 # Every hour.
 42 * * * * {{ django }} cleanup
 
-# Every 2 hours.
-1 */2 * * * {{ cron }} calculate_related_documents
-
 # Every 6 hours.
 0 */6 * * * {{ django }} update_product_details -q > /dev/null
 10 */6 * * * {{ cron }} rebuild_kb
@@ -30,6 +33,7 @@ HOME = /tmp
 47 2 * * * {{ cron }} remove_expired_registration_profiles
 0 9 * * * {{ cron }} update_visitors_metric
 0 10 * * * {{ cron }} update_l10n_metric
+30 3 * * * {{ cron }} rebuild_suggestions
 
 # Twice per week.
 #05 01 * * 1,4 {{ cron }} update_weekly_votes
@@ -601,11 +601,9 @@ SESSION_EXISTS_COOKIE = 'sumo_session'
 #
 # Connection information for Elastic
 ES_HOSTS = ['127.0.0.1:9200']
-# Indexes for reading
+# Aliases for reading. Live indexing writes to the indexes behind the
+# same alias with "_write" appended.
 ES_INDEXES = {'default': 'sumo'}
-# Indexes for indexing--set this to ES_INDEXES if you want to read to
-# and write to the same index.
-ES_WRITE_INDEXES = ES_INDEXES
 # This is prepended to index names to get the final read/write index
 # names used by kitsune. This is so that you can have multiple environments
 # pointed at the same ElasticSearch cluster and not have them bump into
@@ -620,6 +618,21 @@ ES_INDEXING_TIMEOUT = 30
 # Seconds between updating admin progress bar:
 ES_REINDEX_PROGRESS_BAR_INTERVAL = 5
 ES_FLUSH_BULK_EVERY = 100
+# Whether live indexing goes through a queue in the "default" redis
+# backend that coalesces repeated saves and gets indexed in bulk by the
+# process_index_queue cron job, rather than a celery task per object.
+ES_INDEX_QUEUE = False
+# Number of queued objects of a model to extract and index at a time.
+ES_INDEX_QUEUE_BATCH_SIZE = 500
+# Seconds to cache which indexes live indexing writes to. Reindexing
+# clears it when it changes them.
+ES_WRITE_INDEXES_TIMEOUT = 60
+# Width of the id ranges full reindexing splits each model into. Each
+# chunk is checkpointed, so this is also the unit of resuming.
+ES_REINDEX_CHUNK_SIZE = 1000
+# Seconds without a chunk starting or finishing after which an
+# unfinished reindexing run is taken to have crashed and can be resumed.
+ES_REINDEX_STALE_AFTER = 60 * 60
 
 #
 # Connection information for Sphinx search
@@ -637,16 +650,36 @@ TEST_SPHINXQL_PORT = 3418
 
 SEARCH_MAX_RESULTS = 1000
 SEARCH_RESULTS_PER_PAGE = 20
+# For result pages that end within this many results, the ES search
+# view fetches counts and results for all kinds in a single round
+# trip. Deeper pages take two.
+SEARCH_PREFETCH_WINDOW = 60
 
 # Search default settings
 # comma-separated tuple of included category IDs. Negative IDs are excluded.
 SEARCH_DEFAULT_CATEGORIES = (10, 20,)
 SEARCH_SUMMARY_LENGTH = 275
+# Longest title prefix the search suggestions index holds. Longer terms
+# get filtered from the matches for their first this many characters.
+SEARCH_SUGGEST_PREFIX_LENGTH = 12
 
 # The length for which we would like the user to cache search forms and
 # results, in minutes.
 SEARCH_CACHE_PERIOD = 15
 
+# ES searches slower than this many milliseconds get logged to the
+# "k.search.slow" log with their ES bodies. The last SEARCH_SLOW_KEEP
+# of them show up in the search admin.
+SEARCH_SLOW_MS = 1000
+SEARCH_SLOW_KEEP = 100
+# If set, the slow search log also goes to this file, rotated when it
+# gets to 10MB.
+SEARCH_SLOW_LOG = None
+
+# Seconds to cache the results of an ES search server side. Indexing
+# invalidates them. Set to 0 to turn it off.
+SEARCH_RESULTS_CACHE_TIMEOUT = 5 * 60
+
 # Maximum length of the filename. Forms should use this and raise
 # ValidationError if the length is exceeded.
 # @see http://code.djangoproject.com/ticket/9893
@@ -726,6 +759,22 @@ CELERY_IMPORTS = ['django_arecibo.tasks']
 
 # Wiki rebuild settings
 WIKI_REBUILD_TOKEN = 'sumo:wiki:full-rebuild'
+# How many parsed templates and inclusions to keep while rendering
+WIKI_PARSE_CACHE_SIZE = 100
+# Documents longer than this many characters get rendered a section at a time
+WIKI_SECTION_RENDER_SIZE = 50000
+# Related documents don't come up through tags on more documents than this in
+# a locale and category. See wiki.related.
+WIKI_RELATED_MAX_TAG_DOCS = 500
+# Seconds to cache what a (locale, slug) of the document view resolves to.
+# Saving documents or changing their related documents invalidates them.
+WIKI_RESOLUTION_CACHE_TIMEOUT = 60 * 60 * 2
+# Seconds to cache document pages rendered for anonymous users. Anything that
+# invalidates the resolution above purges them. Set to 0 to turn it off.
+WIKI_PAGE_CACHE_TIMEOUT = 60 * 60 * 2
+# Seconds to cache diffs between revisions. Revisions don't change, so these
+# never go stale.
+WIKI_DIFF_CACHE_TIMEOUT = 60 * 60 * 24 * 7
 
 # Anonymous user cookie
 ANONYMOUS_COOKIE_NAME = 'SUMO_ANONID'